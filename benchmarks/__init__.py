@@ -0,0 +1,10 @@
+"""
+benchmarks - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+
+from .generate import *
@@ -0,0 +1,87 @@
+"""
+benchmarks - part of fastlogger
+---
+
+Run from the repository root:
+
+    python -m benchmarks --qsos 20000 -o before.json
+    python -m benchmarks --qsos 20000 -o after.json --compare before.json
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+from .generate import generate_log
+from .suite import BENCHMARKS, run
+
+
+def revision() -> str:
+    try:
+        out = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return out.stdout.strip()
+
+
+def compare(doc: dict, base: dict):
+    # times and sizes relative to an earlier run, below 1.00 is better
+    print(f"\ncompared to {base['revision']}:")
+    if base["log"] != doc["log"]:
+        print(f"  (that run used a different log: {base['log']})")
+    results = doc["results"]
+    for name, values in results.items():
+        for key, value in values.items():
+            old = base["results"].get(name, {}).get(key)
+            if (key.endswith("_s") or key.startswith("bytes")) and isinstance(old, (int, float)) and old:
+                print(f"  {name}.{key}: {old:.4g} -> {value:.4g} ({value / old:.2f}x)")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark fastlogger on a synthetic log.")
+    ap.add_argument("--qsos", type=int, default=10000, help="QSOs in the generated log")
+    ap.add_argument("--seed", type=int, default=0, help="seed of the generated log")
+    ap.add_argument("--contest", action="store_true", help="generate a contest log with exchanges")
+    ap.add_argument("--repeat", type=int, default=3, help="runs of each benchmark, the fastest counts")
+    ap.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS), metavar="NAME",
+                    help=f"benchmarks to run: {', '.join(BENCHMARKS)}")
+    ap.add_argument("-o", "--output", metavar="FILE", help="save the results as JSON")
+    ap.add_argument("--compare", metavar="FILE", help="JSON results of an earlier run to compare with")
+    ap.add_argument("--save-log", metavar="FILE", help="also write the generated log to FILE")
+    args = ap.parse_args()
+
+    lines = generate_log(args.qsos, args.seed, contest=args.contest)
+    if args.save_log:
+        with open(args.save_log, "w") as file:
+            file.write("\n".join(lines) + "\n")
+
+    def report(name, values):
+        print(f"{name}: " + ", ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}"
+                                      for k, v in values.items()))
+
+    results = run(lines, args.only, args.repeat, report)
+    doc = {
+        "revision": revision(),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "log": {"qsos": args.qsos, "seed": args.seed, "contest": args.contest, "lines": len(lines)},
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(doc, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(doc, json.load(file))
+    return 0
+
+
+sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+generate.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import random
+from datetime import date, timedelta
+from typing import Iterator, List
+
+
+__all__ = ["generate_log"]
+
+
+_prefixes = ("W", "K", "N", "AA", "KB", "VE", "G", "M", "DL", "F", "I", "EA", "ON", "PA", "OK", "SP", "JA", "VK",
+             "ZL", "LU", "PY", "UA", "YU", "S5", "HA", "OH", "SM", "LA")
+_suffix_letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+# (band, frequency range in MHz, modes)
+_bands = (
+    ("160m", (1.81, 1.99), ("CW", "SSB")),
+    ("80m", (3.5, 3.79), ("CW", "SSB", "RTTY")),
+    ("40m", (7.0, 7.19), ("CW", "SSB", "FT8")),
+    ("20m", (14.0, 14.34), ("CW", "SSB", "FT8", "RTTY")),
+    ("15m", (21.0, 21.44), ("CW", "SSB")),
+    ("10m", (28.0, 29.6), ("CW", "SSB", "FM")),
+    ("6m", (50.0, 50.5), ("SSB", "FT8")),
+    ("2m", (144.0, 147.9), ("FM", "SSB")),
+    ("70cm", (432.0, 439.9), ("FM",)),
+)
+_states = ("WY", "WV", "VA", "TN", "LA", "PA", "KY", "IA", "OH", "CA", "IL", "MN", "AL", "ON", "QC", "BC")
+_names = ("Dave", "Bob", "Anna", "Jo", "Mike", "Sue", "Ken", "Lee")
+_notes = ("good sig", "QSB", "pse qsl direct", "portable", "tnx for qso")
+_comment_words = ("rig", "antenna", "dipole", "battery", "rain", "pileup", "qrm", "break", "lunch")
+
+
+def generate_log(qsos: int = 1000, seed: int = 0, *, contest: bool = False, comments: float = 0.02,
+                 new_day: float = 0.002, deletes: float = 0.005, refs: float = 0.05, extras: float = 0.2,
+                 calls: int = 0) -> List[str]:
+    """
+    A synthetic FLE log with `qsos` QSO lines, the same for the same arguments.
+
+    The other arguments are the share of QSO lines that come with: a comment (`comments`, single or multi-line),
+    a `day ++` (`new_day`), a delete on the next line (`deletes`), a WWFF/SOTA/POTA reference (`refs`), and a
+    name, grid, RST, note, or QSL message (`extras`). `contest` logs receive a state and send a serial number,
+    which is only logged now and then (parse them with auto_incr=True).
+    Calls are drawn from `calls` different ones (default qsos // 2), so some are worked more than once.
+    """
+    return list(_lines(random.Random(seed), qsos, contest, comments, new_day, deletes, refs, extras,
+                       calls or max(qsos // 2, 1)))
+
+
+def _lines(rnd: random.Random, qsos: int, contest: bool, comments: float, new_day: float, deletes: float,
+           refs: float, extras: float, n_calls: int) -> Iterator[str]:
+    pool = [_call(rnd) for _ in range(n_calls)]
+
+    yield "{ synthetic log generated for benchmarks }"
+    yield "# Header"
+    yield f"mycall {_call(rnd).lower()}"
+    yield f"mygrid {_grid(rnd).lower()}"
+    yield f"operator {_call(rnd).lower()}"
+    if not contest:
+        yield "qslmsg tnx for the qso"
+    yield ""
+    yield "# Log"
+    day = date(2016, 1, 1) + timedelta(days=rnd.randrange(3000))
+    yield f"date {day:%Y-%m-%d}"
+
+    minute = rnd.randrange(1440)
+    band, (lo, hi), modes = rnd.choice(_bands)
+    mode = rnd.choice(modes)
+    yield f"{band} {mode.lower()}"
+    serial = 1
+
+    for _ in range(qsos):
+        parts = []
+        if rnd.random() < 0.02:
+            band, (lo, hi), modes = rnd.choice(_bands)
+            mode = rnd.choice(modes)
+            parts += [band, mode.lower()]
+        if rnd.random() < 0.05:
+            parts.append(f"{rnd.uniform(lo, hi):.3f}")
+
+        # time moves on by up to 4 minutes, and only the digits that changed are always logged
+        prev, minute = minute, minute + rnd.randrange(5)
+        if minute >= 1440:
+            minute -= 1440
+            yield "day +"
+        if rnd.random() < new_day:
+            yield "day ++" if rnd.random() < 0.5 else "day +"
+        if minute != prev or rnd.random() < 0.3:
+            hhmm = f"{minute // 60:02}{minute % 60:02}"
+            parts.append(hhmm if minute // 10 != prev // 10 or rnd.random() < 0.5 else hhmm[-1])
+        elif not parts:
+            parts.append(" " * rnd.randrange(1, 6))
+
+        parts.append(rnd.choice(pool).lower())
+        if contest:
+            parts.append(f",{serial:03}" if serial == 1 or rnd.random() < 0.05 else "")
+            parts.append(f".{rnd.choice(_states).lower()}")
+            serial += 1
+        elif rnd.random() < extras:
+            parts.append(_extra(rnd, mode))
+        if rnd.random() < refs:
+            parts.append(_ref(rnd))
+
+        line = " ".join(p for p in parts if p)
+        if rnd.random() < comments:
+            if rnd.random() < 0.5:
+                line += " {" + " ".join(rnd.sample(_comment_words, 2)) + "}"
+            else:
+                yield line
+                yield "{ " + " ".join(rnd.sample(_comment_words, 3))
+                line = " ".join(rnd.sample(_comment_words, 2)) + " }"
+        yield line
+        if rnd.random() < deletes:
+            yield "delete"
+
+
+def _call(rnd: random.Random) -> str:
+    suffix = "".join(rnd.choice(_suffix_letters) for _ in range(rnd.randint(1, 3)))
+    call = f"{rnd.choice(_prefixes)}{rnd.randrange(10)}{suffix}"
+    if rnd.random() < 0.03:
+        call += rnd.choice(("/P", "/M", "/QRP"))
+    return call
+
+
+def _grid(rnd: random.Random) -> str:
+    return (rnd.choice("ABCDEFGHIJKLMNOPQR") + rnd.choice("ABCDEFGHIJKLMNOPQR") + str(rnd.randrange(10))
+            + str(rnd.randrange(10)) + rnd.choice("abcdefghijklmnopqrstuvwx") + rnd.choice("abcdefghijklmnopqrstuvwx"))
+
+
+def _extra(rnd: random.Random, mode: str) -> str:
+    kind = rnd.randrange(5)
+    if kind == 0:
+        return f"@{rnd.choice(_names)}"
+    if kind == 1:
+        return f"#{_grid(rnd)[:rnd.choice((4, 6))]}"
+    if kind == 2:
+        # sent and received report, only the digits that differ from 59(9)
+        return f"{rnd.randrange(3, 6)} {rnd.randrange(3, 10)}"
+    if kind == 3:
+        return f"<{rnd.choice(_notes)}>"
+    return "[direct]" if mode == "CW" else "[buro]"
+
+
+def _ref(rnd: random.Random) -> str:
+    kind = rnd.randrange(3)
+    if kind == 0:
+        return f"{rnd.choice(('dl', 'on', 'g', 'k'))}ff-{rnd.randrange(10000):04}"
+    if kind == 1:
+        return f"{rnd.choice(('dl/al', 'g/ld', 'w7w/lc'))}-{rnd.randrange(1, 200):03}"
+    return f"k-{rnd.randrange(1, 10000):04}"
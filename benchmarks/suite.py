@@ -0,0 +1,171 @@
+"""
+suite.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import gc
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+# the app imports logparser and gui as top-level packages, from inside fastlogger/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "fastlogger"))
+
+import logparser  # noqa: E402
+
+
+__all__ = ["BENCHMARKS", "run"]
+
+
+def _best(fn: Callable[[], object], repeat: int, setup: Optional[Callable[[], object]] = None) -> float:
+    # fastest of `repeat` runs, in seconds, each after an untimed setup()
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_parse(lines: List[str], repeat: int) -> Dict[str, float]:
+    results = {}
+    for engine in logparser.ENGINES:
+        secs = _best(lambda: logparser.LogFile(lines, auto_incr=True, engine=engine), repeat)
+        results[f"{engine}_s"] = secs
+    results["iterparse_s"] = _best(lambda: sum(1 for _ in logparser.iterparse(lines, auto_incr=True)), repeat)
+    n = len(logparser.LogFile(lines, auto_incr=True))
+    results["qsos"] = n
+    results["token_qsos_per_sec"] = n / results["token_s"]
+    return results
+
+
+def bench_parallel(lines: List[str], repeat: int) -> Dict[str, float]:
+    return {
+        "processes": os.cpu_count(),
+        "parallel_s": _best(lambda: logparser.LogFile(lines, auto_incr=True, processes=None), repeat),
+    }
+
+
+def bench_memory(lines: List[str], repeat: int) -> Dict[str, float]:
+    # memory held by a parsed log, not counting the lines it was parsed from
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        log = logparser.LogFile(lines, auto_incr=True)
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return {"bytes": size, "bytes_per_qso": size / max(len(log), 1)}
+
+
+def bench_viewer(lines: List[str], repeat: int) -> Dict[str, float]:
+    # LogViewer.set_data on a shown viewer under the offscreen Qt platform, for a whole new log and for one
+    # appended row
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt5.QtTest import QTest
+        from PyQt5.QtWidgets import QApplication
+    except ImportError:
+        return {"skipped": "PyQt5 is not installed"}
+    # the GUI failing to import or start is reported, not a reason to stop the other benchmarks
+    try:
+        from gui.components import LogViewer
+        app = QApplication.instance() or QApplication([])
+    except Exception as e:
+        return {"skipped": f"GUI setup failed: {type(e).__name__}: {e}"}
+    log = logparser.LogFile(lines, auto_incr=True)
+    shorter = logparser.LogFile((), auto_incr=True)
+    shorter._data = log[:-1]
+    delta = logparser.RowDelta(len(log) - 1, 0, log[-1:])
+    viewer = LogViewer()
+    viewer.show()
+    QTest.qWaitForWindowExposed(viewer)
+
+    def full():
+        viewer.set_data(log)
+        app.processEvents()
+
+    def reset():
+        # the log without its last row, shown and painted before the timed append
+        viewer.set_data(shorter)
+        app.processEvents()
+
+    def append():
+        viewer.set_data(log, delta)
+        app.processEvents()
+
+    results = {"set_data_s": _best(full, repeat), "set_data_append_s": _best(append, repeat, reset)}
+    viewer.deleteLater()
+    return results
+
+
+def bench_export(lines: List[str], repeat: int) -> Dict[str, float]:
+    log = logparser.LogFile(lines, auto_incr=True)
+    return {
+        "adif_s": _best(lambda: logparser.write_adif(log, io.StringIO()), repeat),
+        "cabrillo_s": _best(lambda: logparser.write_cabrillo(log, io.StringIO()), repeat),
+    }
+
+
+def bench_cache(lines: List[str], repeat: int) -> Dict[str, float]:
+    # saving a parsed log to the parse cache and loading it back, against parsing it
+    log = logparser.LogFile(lines)
+    text = "\n".join(lines)
+    with tempfile.TemporaryDirectory() as directory:
+        cache = logparser.ParseCache(directory)
+        key = cache.key(text)
+        results = {
+            "key_s": _best(lambda: cache.key(text), repeat),
+            "put_s": _best(lambda: cache.put(key, log), repeat),
+            "get_s": _best(lambda: cache.get(key), repeat),
+            "bytes": cache.size,
+        }
+    results["bytes_per_qso"] = results["bytes"] / max(len(log), 1)
+    return results
+
+
+def bench_grid(lines: List[str], repeat: int) -> Dict[str, float]:
+    # distance and bearing of every row from my_grid, as when a VHF log is rescored
+    log = logparser.LogFile(lines)
+    results = {"distances_s": _best(lambda: logparser.grid_distances(log), repeat)}
+    results["rows_with_grid"] = logparser.grid_distances(log).count
+    return results
+
+
+# name: benchmark(lines, repeat) -> measurements
+BENCHMARKS: Dict[str, Callable[[List[str], int], Dict[str, float]]] = {
+    "parse": bench_parse,
+    "parallel": bench_parallel,
+    "memory": bench_memory,
+    "viewer": bench_viewer,
+    "export": bench_export,
+    "cache": bench_cache,
+    "grid": bench_grid,
+}
+
+
+def run(lines: List[str], names: Sequence[str] = tuple(BENCHMARKS), repeat: int = 3,
+        report: Optional[Callable[[str, Dict[str, float]], None]] = None) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name in names:
+        try:
+            results[name] = BENCHMARKS[name](lines, repeat)
+        except ImportError as e:
+            # an optional dependency of the benchmark is missing
+            results[name] = {"skipped": str(e)}
+        if report is not None:
+            report(name, results[name])
+    return results
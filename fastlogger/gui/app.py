@@ -46,12 +46,21 @@ class MainWindowUi(QMainWindow):
         self.action_save.setShortcut("Ctrl+S")
         self.action_save_as = QAction(QIcon("assets/icons/document-save-as.png"), "Save Log &as")
         self.action_save_as.setShortcut("Ctrl+Shift+S")
+        self.action_export_adif = QAction("&Export ADIF")
+        self.action_export_adif.setShortcut("Ctrl+E")
+        self.action_export_cabrillo = QAction("Export &Cabrillo")
+        self.action_follow = QAction("&Follow Log File")
+        self.action_follow.setCheckable(True)
 
     def _bind_actions(self):
         self.action_new.triggered.connect(self.log_editor.onNewFile)
         self.action_open.triggered.connect(self.log_editor.onOpenFile)
         self.action_save.triggered.connect(self.log_editor.onSaveFile)
         self.action_save_as.triggered.connect(self.log_editor.onSaveAsFile)
+        self.action_export_adif.triggered.connect(self.log_editor.onExportAdif)
+        self.action_export_cabrillo.triggered.connect(self.log_editor.onExportCabrillo)
+        self.action_follow.toggled.connect(self.log_editor.setFollow)
+        self.log_editor.followChanged.connect(self.action_follow.setChecked)
 
     def _create_log_area(self):
         self.log_area = QSplitter(self)
@@ -71,6 +80,10 @@ class MainWindowUi(QMainWindow):
         self.menu_file.addAction(self.action_open)
         self.menu_file.addAction(self.action_save)
         self.menu_file.addAction(self.action_save_as)
+        self.menu_file.addAction(self.action_follow)
+        self.menu_file.addSeparator()
+        self.menu_file.addAction(self.action_export_adif)
+        self.menu_file.addAction(self.action_export_cabrillo)
         self.menu_edit = QMenu("&Edit", self.menubar)
         self.setMenuBar(self.menubar)
 
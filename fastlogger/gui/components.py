@@ -7,18 +7,24 @@ Released under the terms of the BSD 3-Clause license.
 """
 
 
-from typing import List, Optional
+import collections.abc as abc
+import os
+from typing import List, Optional, Sequence
 from datetime import time
 from pathlib import Path
 
-from PyQt5.QtCore import QSize, Qt, QRect
-from PyQt5.QtGui import QFont, QPainter, QColor, QTextFormat
-from PyQt5.QtWidgets import (QPlainTextEdit, QTextEdit, QTableWidget, QWidget, QTableWidgetItem,
+from PyQt5.QtCore import (QSize, Qt, QRect, QTimer, QThread, QCoreApplication, QObject, QAbstractTableModel,
+                          QModelIndex, QSocketNotifier, pyqtSignal)
+from PyQt5.QtGui import QFont, QPainter, QColor, QTextFormat, QTextCursor
+from PyQt5.QtWidgets import (QPlainTextEdit, QTextEdit, QTableView, QWidget,
                              QFileDialog, QDialog, QDialogButtonBox, QVBoxLayout, QStatusBar,
                              QLabel, QFrame)
 
 import logparser
 
+from .highlighter import LogHighlighter
+from .worker import ParseResult, ParseWorker
+
 
 __all__ = ["LogEditor", "LogViewer"]
 
@@ -51,78 +57,551 @@ class LineNumberArea(QWidget):
         self.editor.lineNumberAreaPaintEvent(event)
 
 
+class DocumentLines(abc.Sequence):
+    # the lines of a document, read from it when they are asked for
+    def __init__(self, document):
+        self.document = document
+
+    def __len__(self):
+        return self.document.blockCount()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            lines = []
+            block = self.document.findBlockByNumber(start)
+            for _ in range(start, stop):
+                lines.append(block.text())
+                block = block.next()
+            return lines[::step]
+        return self.document.findBlockByNumber(range(len(self))[index]).text()
+
+    def __iter__(self):
+        block = self.document.firstBlock()
+        while block.isValid():
+            yield block.text()
+            block = block.next()
+
+
 class LogEditor(QPlainTextEdit):
     filename = ""
     saved = False
+    # whether the open file is followed, see setFollow
+    followChanged = pyqtSignal(bool)
 
-    def __init__(self, viewer: QTableWidget, statusbar: QStatusBar, parent: Optional[QWidget] = None):
+    def __init__(self, viewer: QTableView, statusbar: QStatusBar, parent: Optional[QWidget] = None,
+                 debounce: int = 150, dupe_rule: str = "band-mode", parse_cache: Optional[logparser.ParseCache] = None,
+                 autosave: int = 5000, idle_compact: int = 30000, journal_dir: Optional[str] = None):
         super().__init__(parent)
         self.lineNumberArea = LineNumberArea(self)
         self.viewer = viewer
         self.statusbar = statusbar
+        # the last parsed log shown in the viewer
+        self.log = logparser.LogFile([])
+        # kept up to date with the row changes of each result, and shared with the viewer
+        self.dupes = logparser.DupeIndex(rule=dupe_rule)
+        self.viewer.set_dupes(self.dupes)
+        # counts and rates of the shown log, kept up to date like the dupes
+        self.stats = logparser.LogStats()
+        # total km of the QSOs with a grid at both ends, kept up to date with the row changes of each result,
+        # and the my_grid it was worked out from
+        self.distance = 0.0
+        self._distance_grid = ""
+        # opened logs are saved here once parsed, and shown from here when opened again unchanged
+        self.parse_cache = parse_cache if parse_cache is not None else logparser.ParseCache()
+        # (generation, cache key, whether it was shown from the cache) of the last opened file, until parsed
+        self._opened = None
+        # set while the document changes in ways that don't need parsing: replacing the whole text (see
+        # set_content), and highlighting, which Qt reports as a change to the highlighted text
+        self._untracked = False
+        self._block_count = 1
+        self._edits = []
+        self._generation = 0
+        # row changes of results that were not shown
+        self._deltas = []
+        # edits are appended to the journal of the log every `autosave` ms, and written to the file when saving.
+        # once the journal has grown large, it is folded into the file when typing pauses for `idle_compact` ms,
+        # see logparser.Journal
+        self.journal: Optional[logparser.Journal] = None
+        self.journal_dir = journal_dir
+        self._unjournaled = []
+        self._autosave = QTimer(self)
+        self._autosave.setInterval(autosave)
+        self._autosave.timeout.connect(self.flushJournal)
+        self._autosave.start()
+        self._idle = QTimer(self)
+        self._idle.setSingleShot(True)
+        self._idle.setInterval(idle_compact)
+        self._idle.timeout.connect(self.compactJournal)
+        # following a file that another program appends to: what was appended is read when the watcher says
+        # the file changed, or when the poll timer runs out, in case it didn't
+        self._tail: Optional[logparser.LogTail] = None
+        self._watcher: Optional[logparser.FileWatcher] = None
+        self._notifier: Optional[QSocketNotifier] = None
+        self._poll = QTimer(self)
+        self._poll.timeout.connect(self.readTail)
+
+        # edits are collected until typing pauses for `debounce` ms, then parsed in the background
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(debounce)
+        self._debounce.timeout.connect(self.submitEdits)
+
+        self._parse_thread = QThread(self)
+        self._parser = ParseWorker()
+        self._parser.moveToThread(self._parse_thread)
+        self._parser.parsed.connect(self.updateViewer)
+        self._parser.highlighted.connect(self.updateHighlighting)
+        self._parse_thread.finished.connect(self._parser.deleteLater)
+        self._parse_thread.start()
+        QCoreApplication.instance().aboutToQuit.connect(self.stopParser)
+        QCoreApplication.instance().aboutToQuit.connect(lambda: self.closeJournal(keep_unsaved=True))
+
+        self.highlighter = LogHighlighter(self.document())
 
         self.setFont(QFont("Courier"))
 
         self.blockCountChanged.connect(self.updateLineNumberAreaWidth)
         self.updateRequest.connect(self.updateLineNumberArea)
         self.cursorPositionChanged.connect(self.highlightCurrentLine)
-        self.textChanged.connect(self.updateViewer)
+        self.document().contentsChange.connect(self.onContentsChange)
         self.textChanged.connect(self.setSavedStatus)
 
         self.updateLineNumberAreaWidth(0)
 
+        self.startJournal()
+        # after a crash, the log that was open is brought back once the window is up
+        QTimer.singleShot(0, self.recoverJournal)
+
     def onNewFile(self):
+        self.setFollow(False)
         if not self.saved:
             dlg = SaveDialog(self, self)
             if d := dlg.exec() == QDialog.reject:
                 return
             elif d == QDialog.accept:
                 self.onSaveFile()
+        self.closeJournal()
         self.clear()
         self.setPlainText(log_template)
         self.filename = ""
         self.saved = False
+        self.startJournal()
 
     def onOpenFile(self):
         # if unsaved, ask to save
         fn = QFileDialog.getOpenFileName(self, "Open Log file", str(Path.home()), "Text files (*.txt)")
         if fn[0]:
-            with open(fn[0]) as log_file:
-                self.set_content(log_file.read())
-                self.filename = fn[0]
-                self.saved = False
+            self.setFollow(False)
+            self.closeJournal()
+            journal = logparser.Journal(fn[0], self.journal_dir)
+            if journal.journal_path.exists() and self.resumeJournal(journal):
+                return
+            # the parser gets the lines straight from a map of the file, so only the document holds all the text
+            lines = logparser.MappedLog(fn[0])
+            key = self.parse_cache.key(lines.raw)
+            cached = self.parse_cache.get(key)
+            self.set_content(lines.text(), lines)
+            self.startJournal(journal, lines)
+            # parsed right away, as one job, so the result for exactly this content can be told apart
+            self._debounce.stop()
+            self.submitEdits()
+            self._opened = (self._generation, key, cached is not None)
+            if cached is not None:
+                # shown now, while the editor still parses the lines in the background to be able to edit them
+                self.showLog(cached)
+            self.filename = fn[0]
+            self.saved = False
 
     def onSaveFile(self):
+        if self._tail is not None:
+            # the file is the log, and another program is writing to it
+            return
         if not self.filename:
             fn = QFileDialog.getSaveFileName(self, "Save Log file", str(Path.home()), "Text files (*.txt)")
             if fn[0]:
                 self.filename = fn[0]
             else:
                 return
-        with open(self.filename, "w") as log_file:
-            log_file.write(self.toPlainText())
-            self.saved = True
+        journal = self.journal
+        if journal is None or journal.path != os.path.abspath(self.filename):
+            self.writeFile(self.filename)
+            return
+        # only the lines from the first one edited on are written, see logparser.Journal.save
+        if not self._appendJournal():
+            return
+        try:
+            journal.save(DocumentLines(self.document()))
+        except OSError as e:
+            self.statusbar.showMessage(f"Saving failed: {e}", 10000)
+            return
+        self.saved = True
 
     def onSaveAsFile(self):
+        self.setFollow(False)
         fn = QFileDialog.getSaveFileName(self, "Save Log file As", str(Path.home()), "Text files (*.txt)")
         if fn[0]:
             self.filename = fn[0]
         else:
             return
-        with open(self.filename, "w") as log_file:
-            log_file.write(self.toPlainText())
+        self.writeFile(self.filename)
+
+    def writeFile(self, filename: str):
+        # write out the whole log to a file, which the log is journaled against from then on
+        journal = logparser.Journal(filename, self.journal_dir)
+        if self.journal is not None:
+            journal.newline = self.journal.newline
+        journal.compact(self.documentLines())
+        if self.journal is not None:
+            self.journal.discard()
+        self.journal = journal
+        self._unjournaled = []
+        self.saved = True
+
+    def documentLines(self) -> List[str]:
+        return self.blockTexts(self.document().firstBlock(), self.document().blockCount())
+
+    def startJournal(self, journal: Optional[logparser.Journal] = None, lines: Optional[Sequence[str]] = None):
+        # journal the edits from here on, against `lines` as they are in the journal's file, or for a log
+        # without a file, against the whole document
+        self._unjournaled = []
+        if journal is None:
+            journal = logparser.Journal(None, self.journal_dir)
+        try:
+            if journal.path is None:
+                journal.compact(self.documentLines())
+            else:
+                journal.begin(lines)
+        except OSError as e:
+            self.statusbar.showMessage(f"Not autosaving: {e}", 10000)
+            journal = None
+        self.journal = journal
+
+    def resumeJournal(self, journal: logparser.Journal) -> bool:
+        # open the log of a journal left by a crash, with the journal's edits. returns whether it did
+        try:
+            if journal.in_use():
+                return False
+            if (replayed := journal.replay()) is None:
+                journal.discard()
+                return False
+            lines, dirty = replayed
+            if journal.empty or (journal.path is None and not "".join(lines)):
+                journal.discard()
+                return False
+            self.set_content("\n".join(lines), lines)
+            self._debounce.stop()
+            self.submitEdits()
+            self._unjournaled = []
+            journal.resume()
+        except (OSError, ValueError):
+            return False
+        self.journal = journal
+        self.filename = journal.path or ""
+        self.saved = not dirty
+        self.statusbar.showMessage(f"Recovered edits to {journal.path or 'an unsaved log'}", 10000)
+        return True
+
+    def recoverJournal(self):
+        # reopen the newest log left by a crash, unless a log was opened or typed into already
+        if self.filename or self.journal is None or not self.journal.empty:
+            return
+        for journal in logparser.find_journals(self.journal_dir):
+            if journal.journal_path == self.journal.journal_path:
+                continue
+            self.closeJournal()
+            if self.resumeJournal(journal):
+                return
+            self.startJournal()
+
+    def setFollow(self, follow: bool):
+        # show what another program appends to the open file as it does, without reading the file again.
+        # while following, the file is only shown, not edited or journaled
+        if follow == (self._tail is not None):
+            return
+        if follow:
+            if not self.filename:
+                self.statusbar.showMessage("Only a log that is saved to a file can be followed", 10000)
+                self.followChanged.emit(False)
+                return
+            if not self.saved:
+                self.onSaveFile()
+            self.closeJournal()
+            self._tail = logparser.LogTail(self.filename)
+            self._watcher = logparser.FileWatcher(self.filename)
+            if (fd := self._watcher.fileno()) is not None:
+                self._notifier = QSocketNotifier(fd, QSocketNotifier.Read, self)
+                self._notifier.activated.connect(self.readTail)
+                self._poll.start(5000)
+            else:
+                self._poll.start(1000)
+            self.setReadOnly(True)
+            self.readTail()
+        else:
+            self._poll.stop()
+            if self._notifier is not None:
+                self._notifier.setEnabled(False)
+                self._notifier.deleteLater()
+                self._notifier = None
+            self._watcher.close()
+            self._watcher = self._tail = None
+            self.setReadOnly(False)
+            self.startJournal(logparser.Journal(self.filename, self.journal_dir), self.documentLines())
+        self.followChanged.emit(follow)
+
+    def readTail(self):
+        # apply what was appended to the followed file to the document, which is parsed like any other edit,
+        # starting from the state the parser was in at the end of the lines before
+        if self._tail is None:
+            return
+        self._watcher.drain()
+        if (edit := self._tail.read()) is None:
+            return
+        start, removed, lines = edit
+        if removed is None or start >= self.document().blockCount():
+            self.set_content("\n".join(lines), lines)
+        else:
+            # the last line, which may have been cut off before, and the lines after it
+            cursor = QTextCursor(self.document().findBlockByNumber(start))
+            cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+            cursor.insertText("\n".join(lines))
+        self.saved = True
+
+    def flushJournal(self):
+        self._appendJournal()
+
+    def _appendJournal(self) -> bool:
+        # append the edits since the last time to the journal, returns whether they are in it
+        if self.journal is not None and self._unjournaled:
+            try:
+                self.journal.append(self._unjournaled)
+            except OSError as e:
+                self.statusbar.showMessage(f"Autosave failed: {e}", 10000)
+                return False
+        self._unjournaled = []
+        return True
+
+    def compactJournal(self):
+        # once the journal has grown large, fold it into the log's file, which is then saved, or for a log
+        # without a file, start the journal over from the whole log
+        self._idle.stop()
+        if (journal := self.journal) is None or not self._appendJournal() or not journal.should_compact():
+            return
+        try:
+            journal.compact(self.documentLines())
+        except OSError as e:
+            self.statusbar.showMessage(f"Saving failed: {e}", 10000)
+            return
+        if journal.path is not None:
             self.saved = True
 
-    def set_content(self, new_log):
-        self.clear()
-        self.setPlainText(new_log)
+    def closeJournal(self, keep_unsaved: bool = False):
+        # done with the log: remove the journal, as its file has the saved edits. unsaved edits are thrown away,
+        # or kept to be recovered like after a crash
+        if (journal := self.journal) is None:
+            return
+        self.flushJournal()
+        self.journal = None
+        try:
+            if keep_unsaved and not self.saved and not journal.empty:
+                journal.close()
+                return
+            # the file has the edits up to the last save already
+            journal.discard()
+        except OSError:
+            journal.close()
+
+    def onExportAdif(self):
+        # exports the log as shown in the viewer
+        start = Path(self.filename).with_suffix(".adi") if self.filename else Path.home()
+        fn = QFileDialog.getSaveFileName(self, "Export ADIF file", str(start), "ADIF files (*.adi)")
+        if fn[0]:
+            with open(fn[0], "w", newline="") as adif_file:
+                logparser.write_adif(self.log, adif_file)
+
+    def onExportCabrillo(self):
+        start = Path(self.filename).with_suffix(".log") if self.filename else Path.home()
+        fn = QFileDialog.getSaveFileName(self, "Export Cabrillo file", str(start), "Cabrillo files (*.log *.cbr)")
+        if fn[0]:
+            with open(fn[0], "w", newline="") as cbr_file:
+                logparser.write_cabrillo(self.log, cbr_file)
+
+    def set_content(self, new_log: str, lines: Optional[Sequence[str]] = None):
+        # lines: new_log split at "\n", to be parsed instead of reading the lines back from the document
+        if lines is None:
+            self.clear()
+            self.setPlainText(new_log)
+            return
+        self._untracked = True
+        try:
+            self.clear()
+            self.setPlainText(new_log)
+        finally:
+            self._untracked = False
+        self._block_count = self.document().blockCount()
+        if len(lines) != self._block_count:
+            # split differently from the document, e.g. at a lone "\r"
+            lines = self.blockTexts(self.document().firstBlock(), self._block_count)
+        self._edits = [(0, None, lines)]
+        self._debounce.start()
 
     def setSavedStatus(self):
         self.saved = False
 
-    def updateViewer(self):
-        log_data = logparser.LogFile(self.toPlainText().split("\n"))
-        self.viewer.set_data(log_data)
+    def setDebounceInterval(self, msec: int):
+        self._debounce.setInterval(msec)
+
+    def setDupeRule(self, rule: str):
+        self.dupes = logparser.DupeIndex(self.log, rule)
+        self.viewer.set_dupes(self.dupes)
+        self.updateDupeCount()
+
+    def updateDupeCount(self):
+        if n := self.dupes.dupe_count:
+            self.statusbar.update_widget("dupes", "1 dupe" if n == 1 else f"{n} dupes")
+        else:
+            self.statusbar.update_widget("dupes")
+
+    def stopParser(self):
+        self._parse_thread.quit()
+        self._parse_thread.wait()
+
+    def onContentsChange(self, position: int, removed: int, added: int):
+        # queue the lines touched by the edit to be re-parsed
+        if self._untracked:
+            return
+        doc = self.document()
+        first = doc.findBlock(position)
+        if not (last := doc.findBlock(position + added)).isValid():
+            last = doc.lastBlock()
+        count = doc.blockCount()
+        start = first.blockNumber()
+        n = last.blockNumber() - start + 1
+        removed_lines = n - (count - self._block_count)
+
+        if start < 0 or removed_lines < 0 or start + removed_lines > self._block_count:
+            self._edits.append((0, None, self.blockTexts(doc.firstBlock(), count)))
+        else:
+            self._edits.append((start, removed_lines, self.blockTexts(first, n)))
+        self._unjournaled.append(self._edits[-1])
+        self._block_count = count
+        self._debounce.start()
+        self._idle.start()
+
+    @staticmethod
+    def blockTexts(block, n: int) -> List[str]:
+        # the text of `n` lines from `block` on, without a copy of the whole document's text
+        lines = []
+        for _ in range(n):
+            lines.append(block.text())
+            block = block.next()
+        return lines
+
+    def submitEdits(self):
+        if self._edits:
+            self._generation += 1
+            self._parser.submit(self._generation, self._edits)
+            self._edits = []
+
+    def updateHighlighting(self, spans):
+        self._untracked = True
+        try:
+            self.highlighter.set_spans(spans)
+        finally:
+            self._untracked = False
+
+    def showLog(self, log: logparser.LogFile):
+        # show a whole other log, not one derived from the shown one by a delta
+        self.log = log
+        self.dupes = logparser.DupeIndex(log, self.dupes.rule)
+        self.stats = logparser.LogStats(log)
+        self.viewer.set_data(log)
+        self.viewer.set_dupes(self.dupes)
+        self.updateDistance(log)
+        self.updateStatus()
+
+    def updateViewer(self, result: ParseResult):
+        if self._opened is not None and not self.checkOpened(result):
+            return
+        # only show the result for the newest edits
+        if result.generation != self._generation:
+            self._deltas.append(result.delta)
+            return
+        delta = logparser.RowDelta.merge(self._deltas + [result.delta], result.log)
+        self._deltas = []
+        removed = self.log[delta.start:delta.start + delta.removed]
+        dupes_changed = self.dupes.update(removed, delta.rows, result.log)
+        self.stats.update(removed, delta.rows)
+        self.updateDistance(result.log, removed, delta.rows)
+        self.log = log_data = result.log
+        self.viewer.set_data(log_data, delta)
+        if self._tail is not None and delta.rows:
+            self.viewer.scrollToBottom()
+        if dupes_changed:
+            self.viewer.log_model.update_dupes()
+        self.updateStatus()
+
+    def checkOpened(self, result: ParseResult) -> bool:
+        # deals with the results from around when a file was opened, returns whether to show the result as usual
+        generation, key, cached = self._opened
+        if not cached:
+            if result.generation >= generation:
+                self._opened = None
+                # only a parse of the file as it was opened is saved, and only if all of it parsed
+                if result.generation == generation and not result.errors:
+                    self.parse_cache.put(key, result.log)
+            return True
+        if result.generation < generation:
+            # edits to the log that was open before, which the cached log has taken the place of
+            return False
+        if result.generation == generation:
+            # the same rows as the cached log, which later results follow on from
+            self._opened = None
+            self._deltas = []
+            if result.generation == self._generation:
+                self.log = result.log
+                self.viewer.set_data(result.log, logparser.RowDelta(0, 0, ()))
+            return False
+        # edited again before the opened file was parsed: the rows of the newest result replace the cached log
+        if result.generation == self._generation:
+            self._opened = None
+            self._deltas = []
+            self.showLog(result.log)
+        return False
+
+    def updateDistance(self, log: logparser.LogFile, removed: Sequence[logparser.LogRow] = (),
+                       added: Optional[Sequence[logparser.LogRow]] = None):
+        # all of the log at once for a new log or my_grid, else only the rows that changed
+        if added is None or log.my_grid != self._distance_grid:
+            self.distance = logparser.grid_distances(log).total_km
+            self._distance_grid = log.my_grid
+        else:
+            self.distance += (logparser.total_distance(added, log.my_grid)
+                              - logparser.total_distance(removed, log.my_grid))
+
+    def updateStats(self):
+        stats = self.stats
+        if n := len(stats):
+            per_band_mode = "\n".join(f"{band or '?'} {mode or '?'}: {count}"
+                                      for (band, mode), count in stats.band_mode().items())
+            self.statusbar.update_widget("num_qsos", "1 QSO" if n == 1 else f"{n} QSOs", per_band_mode)
+            n = stats.unique_calls
+            self.statusbar.update_widget("calls", "1 call" if n == 1 else f"{n} calls")
+        else:
+            self.statusbar.update_widget("num_qsos", "0 QSOs")
+            self.statusbar.update_widget("calls")
+        if (latest := stats.latest) is not None:
+            rates = " | ".join(f"{stats.rate(minutes):.0f}/h" for minutes in logparser.RATE_WINDOWS)
+            windows = " and ".join(str(minutes) for minutes in logparser.RATE_WINDOWS)
+            self.statusbar.update_widget("rate", f"Rate: {rates}",
+                                         f"QSOs per hour over the last {windows} minutes to {latest:%Y-%m-%d %H:%M}")
+        else:
+            self.statusbar.update_widget("rate")
+
+    def updateStatus(self):
+        self.updateDupeCount()
+        self.updateStats()
+        log_data = self.log
         if log_data.my_call:
             ops = None
             if log_data.operators:
@@ -150,10 +629,11 @@ class LogEditor(QPlainTextEdit):
             self.statusbar.update_widget("myota", myota)
         else:
             self.statusbar.update_widget("myota")
-        if len(log_data) == 1:
-            self.statusbar.update_widget("num_qsos", "1 QSO")
+        if self.distance >= 0.5:
+            self.statusbar.update_widget("distance", f"{self.distance:,.0f} km",
+                                         f"Total distance from {log_data.my_grid}")
         else:
-            self.statusbar.update_widget("num_qsos", f"{len(log_data)} QSOs")
+            self.statusbar.update_widget("distance")
 
     def lineNumberAreaWidth(self):
         digits = 1
@@ -208,7 +688,7 @@ class LogEditor(QPlainTextEdit):
                 else:
                     number = str(n)
                 painter.setPen(Qt.black)
-                painter.drawText(0, top, self.lineNumberArea.width(), height,
+                painter.drawText(0, int(top), self.lineNumberArea.width(), height,
                                  Qt.AlignRight, number)
 
             block = block.next()
@@ -232,47 +712,147 @@ class LogEditor(QPlainTextEdit):
         self.setExtraSelections(extraSelections)
 
 
-class LogViewer(QTableWidget):
+class LogTableModel(QAbstractTableModel):
     col_headings = ["Date", "Time", "Band", "Frequency", "Mode", "Callsign", "Tx RST", "Rx RST", "Name",
-                    "Grid", "Tx Exch", "Rx Exch", "WWFF", "SOTA", "POTA", "QSL Message", "Notes", ]
+                    "Grid", "Tx Exch", "Rx Exch", "WWFF", "SOTA", "POTA", "QSL Message", "Notes",
+                    "Distance", "Bearing", ]
+    # LogRow keys, in column order, then the columns worked out from the grids (see path_text)
+    col_keys = ["date", "time", "band", "freq", "mode", "call", "sent_rst", "rcvd_rst", "name",
+                "grid", "sent_exch", "rcvd_exch", "wwff", "sota", "pota", "qsl_msg", "notes",
+                "distance", "bearing", ]
 
+    dupe_color = QColor(255, 200, 200)
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._log = ()
+        self.dupes: Optional[logparser.DupeIndex] = None
+
+    def set_log(self, log):
+        self.beginResetModel()
+        self._log = log
+        self.endResetModel()
+
+    def update_log(self, log, delta: logparser.RowDelta) -> bool:
+        # switch to `log`, which is the current log with `delta` applied, only signalling the rows that changed.
+        # returns False if the delta didn't fit, and the whole log was shown anew
+        start, removed, added = delta.start, delta.removed, len(delta.rows)
+        if len(self._log) - removed + added != len(log):
+            self.set_log(log)
+            return False
+        if removed > added:
+            self.beginRemoveRows(QModelIndex(), start + added, start + removed - 1)
+            self._log = log
+            self.endRemoveRows()
+        elif added > removed:
+            self.beginInsertRows(QModelIndex(), start + removed, start + added - 1)
+            self._log = log
+            self.endInsertRows()
+        else:
+            self._log = log
+        if changed := min(removed, added):
+            self.dataChanged.emit(self.index(start, 0), self.index(start + changed - 1, len(self.col_keys) - 1))
+        return True
+
+    def set_dupes(self, dupes: logparser.DupeIndex):
+        self.dupes = dupes
+        self.update_dupes()
+
+    def update_dupes(self):
+        # rows anywhere in the log can start or stop being dupes, but only the shown ones are repainted
+        if self._log:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self._log) - 1, len(self.col_keys) - 1),
+                                  [Qt.BackgroundRole])
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._log)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.col_headings)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        # cells are formatted when the view asks for them, which is only for the rows it shows
+        if not index.isValid():
+            return None
+        if role == Qt.BackgroundRole:
+            if self.dupes is not None and self.dupes.is_dupe(self._log[index.row()]):
+                return self.dupe_color
+            return None
+        if role == Qt.ToolTipRole:
+            return self.band_tooltip(self._log[index.row()], self.col_keys[index.column()])
+        if role != Qt.DisplayRole:
+            return None
+        key = self.col_keys[index.column()]
+        if key in ("distance", "bearing"):
+            return self.path_text(self._log[index.row()], key)
+        itm = self._log[index.row()][key]
+        if isinstance(itm, float):
+            return f"{itm:.3f}"
+        elif isinstance(itm, time):
+            return time.strftime(itm, "%H:%M")
+        return str(itm)
+
+    def path_text(self, row: logparser.LogRow, key: str) -> str:
+        # distance and bearing from the log's my_grid (or the sent grid of a rover) to the row's grid
+        if (path := logparser.row_path(row, getattr(self._log, "my_grid", ""))) is None:
+            return ""
+        if key == "distance":
+            return f"{path[0]:,.0f} km"
+        return f"{round(path[1]) % 360:03d}\N{DEGREE SIGN}"
+
+    def band_tooltip(self, row: logparser.LogRow, key: str) -> Optional[str]:
+        # band edges on the band column, and the segment on the frequency column, by the log's band plan
+        plan = getattr(self._log, "band_plan", logparser.DEFAULT_PLAN)
+        if key == "band" and (edges := plan.edges.get(row.band)) is not None:
+            return f"{row.band}: {edges[0]:.3f}-{edges[1]:.3f} MHz ({plan.name})"
+        if key == "freq" and row.freq != "":
+            if (seg := plan.segment(row.freq)) is not None:
+                return f"{seg[2]} segment: {seg[0]:.3f}-{seg[1]:.3f} MHz ({plan.name})"
+            if (mode := plan.default_mode(row.band)) is not None:
+                return f"usually {mode} on {row.band} ({plan.name})"
+        return None
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.col_headings[section]
+        return str(section + 1)
+
+
+class LogViewer(QTableView):
     def __init__(self, parent: Optional[QWidget] = None):
         super().__init__(parent)
+        self.log_model = LogTableModel(self)
+        self.setModel(self.log_model)
 
-        self.create_columns()
-
-    def create_columns(self):
-        self.setColumnCount(len(self.col_headings))
-        self.setHorizontalHeaderLabels(self.col_headings)
         self.resizeColumnsToContents()
 
     def data(self) -> List[List[str]]:
-        data = [
-            [None for _ in range(self.log_viewer.columnCount())]
-            for _ in range(self.log_viewer.rowCount())
-        ]
-        for i in range(self.log_viewer.rowCount()):
-            for j in range(self.log_viewer.columnCount()):
-                data[i][j] = self.log_viewer.itemAt(i, j).text()
-        return data
-
-    def set_data(self, new_data):
-        # clear data
-        self.clearContents()
-        self.setRowCount(0)
-        # set new data
-        for i, row in enumerate(new_data):
-            self.insertRow(i)
-            self.setVerticalHeaderItem(i, QTableWidgetItem(str(i+1)))
-            for j, itm in enumerate(row.values()):
-                if isinstance(itm, float):
-                    itm = f"{itm:.3f}"
-                elif isinstance(itm, time):
-                    itm = time.strftime(itm, "%H:%M")
-                else:
-                    itm = str(itm)
-                self.setItem(i, j, QTableWidgetItem(itm))
-        self.resizeColumnsToContents()
+        model = self.log_model
+        return [[model.data(model.index(i, j)) for j in range(model.columnCount())] for i in range(model.rowCount())]
+
+    def set_dupes(self, dupes: logparser.DupeIndex):
+        # rows that are dupes by this index are highlighted
+        self.log_model.set_dupes(dupes)
+
+    def set_data(self, new_data, delta: Optional[logparser.RowDelta] = None):
+        # with a delta from the shown log, only the changed rows are updated and scroll and selection are kept
+        if delta is None or not self.log_model.update_log(new_data, delta):
+            if delta is None:
+                self.log_model.set_log(new_data)
+            self.resizeColumnsToContents()
+        elif delta.rows:
+            self.widenColumns(delta.start, delta.start + len(delta.rows))
+
+    def widenColumns(self, first: int, last: int):
+        # widen the columns that rows first to last - 1 don't fit in, without measuring the other rows
+        model = self.log_model
+        grid = 1 if self.showGrid() else 0
+        for col in range(model.columnCount()):
+            width = max(self.sizeHintForIndex(model.index(row, col)).width() for row in range(first, last)) + grid
+            if width > self.columnWidth(col):
+                self.setColumnWidth(col, width)
 
 
 class StatusBar(QStatusBar):
@@ -285,6 +865,10 @@ class StatusBar(QStatusBar):
             "myota": QLabel(""),
             "qth_nick": QLabel(""),
             "num_qsos": QLabel("0 QSOs"),
+            "calls": QLabel(""),
+            "rate": QLabel(""),
+            "dupes": QLabel(""),
+            "distance": QLabel(""),
         }
 
         self._add_widgets()
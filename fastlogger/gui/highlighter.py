@@ -0,0 +1,88 @@
+"""
+highlighter.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+
+from typing import Sequence, Tuple
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor, QFont, QSyntaxHighlighter, QTextBlockUserData, QTextCharFormat, QTextDocument
+
+
+__all__ = ["LogHighlighter"]
+
+
+# kind: (colour, bold, italic), see logparser.SPAN_KINDS
+styles = {
+    "call": ("#00008b", True, False),
+    "band": ("#006400", False, False),
+    "freq": ("#006400", False, False),
+    "mode": ("#008b8b", False, False),
+    "date": ("#8b008b", False, False),
+    "time": ("#8b008b", False, False),
+    "exchange": ("#8b4513", False, False),
+    "ref": ("#2e8b57", False, False),
+    "rst": ("#555555", False, False),
+    "notes": ("#555555", False, True),
+    "comment": ("#808080", False, True),
+    "header": ("#8b0000", True, False),
+    "drop": ("#b22222", True, False),
+    "error": ("#ff0000", False, False),
+}
+
+
+class _BlockSpans(QTextBlockUserData):
+    # the spans of a block, and the text they were found in
+    def __init__(self, text: str, spans: Tuple[Tuple[int, int, str], ...]):
+        super().__init__()
+        self.text = text
+        self.spans = spans
+
+
+class LogHighlighter(QSyntaxHighlighter):
+    """
+    Highlights the fields of each line as the parser found them.
+
+    Nothing is parsed here: the spans come from the parse worker and are kept with their block, and only
+    blocks whose spans changed are highlighted again. A block that was edited since its spans were found is
+    left plain until the spans of its new text come in.
+    """
+    def __init__(self, document: QTextDocument):
+        super().__init__(document)
+        self.formats = {}
+        for kind, (colour, bold, italic) in styles.items():
+            fmt = QTextCharFormat()
+            fmt.setForeground(QColor(colour))
+            if bold:
+                fmt.setFontWeight(QFont.Bold)
+            fmt.setFontItalic(italic)
+            if kind == "error":
+                fmt.setUnderlineStyle(QTextCharFormat.WaveUnderline)
+                fmt.setUnderlineColor(QColor(Qt.red))
+            self.formats[kind] = fmt
+
+    def set_spans(self, spans: Sequence[Tuple[int, str, Tuple[Tuple[int, int, str], ...]]]):
+        # (block number, text, spans), see logparser.IncrementalLogFile.take_spans
+        doc = self.document()
+        for i, text, block_spans in spans:
+            block = doc.findBlockByNumber(i)
+            # skip blocks edited since, their new spans are on the way
+            if not block.isValid() or block.text() != text:
+                continue
+            data = block.userData()
+            if isinstance(data, _BlockSpans) and data.text == text and data.spans == block_spans:
+                continue
+            block.setUserData(_BlockSpans(text, block_spans))
+            self.rehighlightBlock(block)
+
+    def highlightBlock(self, text: str):
+        data = self.currentBlockUserData()
+        if not isinstance(data, _BlockSpans) or data.text != text:
+            return
+        formats = self.formats
+        for start, length, kind in data.spans:
+            self.setFormat(start, length, formats[kind])
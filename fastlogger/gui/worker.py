@@ -0,0 +1,93 @@
+"""
+worker.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+
+from collections import deque
+from typing import List, Optional, Sequence, Tuple
+
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+
+import logparser
+
+
+__all__ = ["ParseResult", "ParseWorker"]
+
+
+# spans of this many lines are worked out and sent at a time, see ParseWorker.highlighted
+SPAN_CHUNK = 2000
+
+
+# (first line, number of lines removed, new lines). None lines removed replaces the whole log.
+Edit = Tuple[int, Optional[int], Sequence[str]]
+
+
+class ParseResult:
+    __slots__ = ("generation", "log", "delta", "errors")
+
+    def __init__(self, generation: int, log: logparser.LogFile, delta: logparser.RowDelta, errors: int = 0):
+        self.generation = generation
+        self.log = log
+        self.delta = delta
+        # number of lines that failed to parse and were left out of the log
+        self.errors = errors
+
+
+class ParseWorker(QObject):
+    """
+    Parses edits to the log off the GUI thread.
+
+    Move it to a QThread and queue edits with submit() from the GUI thread. Edits are always applied in order,
+    but a result is only built and emitted for the newest job; jobs overtaken by newer ones are folded into it.
+
+    After a result, the spans of the lines that were parsed follow in chunks, as lists of (line number, text,
+    spans) (see IncrementalLogFile.take_spans), for as long as no new job comes in.
+    """
+    parsed = pyqtSignal(object)
+    highlighted = pyqtSignal(object)
+    _wake = pyqtSignal()
+
+    def __init__(self, auto_incr: bool = False):
+        super().__init__()
+        self._log = logparser.IncrementalLogFile([""], auto_incr, spans=True)
+        self._jobs = deque()
+        self._latest = 0
+        self._deltas: List[logparser.RowDelta] = []
+        self._wake.connect(self._run)
+
+    def submit(self, generation: int, edits: Sequence[Edit]):
+        # called from the GUI thread
+        self._latest = generation
+        self._jobs.append((generation, edits))
+        self._wake.emit()
+
+    @pyqtSlot()
+    def _run(self):
+        generation = None
+        while self._jobs:
+            generation, edits = self._jobs.popleft()
+            for start, removed, lines in edits:
+                if removed is None:
+                    self._deltas.append(self._log.set_lines(lines))
+                else:
+                    self._deltas.append(self._log.update(start, removed, lines))
+                if isinstance(lines, logparser.MappedLog):
+                    # done with the file, which can be saved over now
+                    lines.close()
+
+        # stale: a newer job came in while parsing, and its result will cover this one
+        if generation is None or generation != self._latest:
+            return
+
+        log = self._log.snapshot()
+        delta = logparser.RowDelta.merge(self._deltas, log)
+        self._deltas = []
+        self.parsed.emit(ParseResult(generation, log, delta, self._log.error_count))
+
+        # submit() is called from the GUI thread, so new jobs show up in the queue while this runs
+        while not self._jobs and (spans := self._log.take_spans(SPAN_CHUNK)):
+            self.highlighted.emit(spans)
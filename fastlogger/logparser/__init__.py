@@ -7,4 +7,20 @@ Released under the terms of the BSD 3-Clause license.
 """
 
 
-from .parser import *
\ No newline at end of file
+from .parser import *
+from .bandplan import *
+from .incremental import *
+from .columns import *
+from .adif import *
+from .cabrillo import *
+from .dupes import *
+from .spans import *
+from .dxcc import *
+from .grid import *
+from .stats import *
+from .journal import *
+from .tail import *
+from .profiling import *
+from .cache import *
+from .mapped import *
+from .merge import *
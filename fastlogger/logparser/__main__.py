@@ -6,38 +6,60 @@ Copyright (C) 2020 classabbyamp
 This software is released under the BSD 3-Clause license.
 """
 
+import sys
 from pathlib import Path
-import tabulate
 
-import parser
+if __package__:
+    # python -m fastlogger.logparser
+    from . import parser
+    from .convert import main as convert
+    from .profiling import main as profile
+    from .merge import main as merge
+    commands = {"convert": convert, "profile": profile, "merge": merge}
+else:
+    import parser
+    commands = {}
 
 test_file_dir = Path("./testlogs")
 
-while True:
-    for i, f in enumerate(fns := [x for x in test_file_dir.iterdir() if not x.is_dir()]):
-        print(f"({i}) {f}")
 
-    try:
-        fn = fns[int(input("Choose a file: "))]
-    except ValueError:
-        break
-    except IndexError:
-        print("Not Found!")
-        continue
+def interactive():
+    import tabulate
+
+    while True:
+        for i, f in enumerate(fns := [x for x in test_file_dir.iterdir() if not x.is_dir()]):
+            print(f"({i}) {f}")
 
-    with open(fn) as file:
         try:
-            log = parser.LogFile(file.readlines())
-        except parser.QLParsingError as e:
-            print(f"[!!] {e.msg} on Line {e.line_num}:\n    {e.line}")
-        else:
-            print("My Call:", log.my_call)
-            print("My Grid:", log.my_grid)
-            print("Operators:", ", ".join(log.operators))
-            print("My QSL Message:", log.qsl_msg)
-            print("My WWFF:", log.my_wwff)
-            print("My SOTA:", log.my_sota)
-            print("My QTH Nickname:", log.qth_nickname)
-            header = log[0].keys()
-            rows = [x.values() for x in log]
-            print(tabulate.tabulate(rows, header))
\ No newline at end of file
+            fn = fns[int(input("Choose a file: "))]
+        except ValueError:
+            break
+        except IndexError:
+            print("Not Found!")
+            continue
+
+        with open(fn) as file:
+            try:
+                log = parser.LogFile(file.readlines())
+            except parser.QLParsingError as e:
+                print(f"[!!] {e.msg} on Line {e.line_num}:\n    {e.line}")
+            else:
+                print("My Call:", log.my_call)
+                print("My Grid:", log.my_grid)
+                print("Operators:", ", ".join(log.operators))
+                print("My QSL Message:", log.qsl_msg)
+                print("My WWFF:", log.my_wwff)
+                print("My SOTA:", log.my_sota)
+                print("My QTH Nickname:", log.qth_nickname)
+                header = log[0].keys()
+                rows = [x.values() for x in log]
+                print(tabulate.tabulate(rows, header))
+
+
+# guarded, as worker processes may import this module again
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ("convert", "profile", "merge"):
+        if sys.argv[1] not in commands:
+            sys.exit(f"{sys.argv[1]} needs to be run as: python -m fastlogger.logparser {sys.argv[1]} ...")
+        sys.exit(commands[sys.argv[1]](sys.argv[2:]))
+    interactive()
@@ -0,0 +1,141 @@
+"""
+adif.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+from datetime import date, time
+from typing import Dict, Iterable, TextIO
+
+from .bandplan import get_plan
+from .parser import LogRow
+
+
+__all__ = ["write_adif", "ADIF_VERSION"]
+
+
+ADIF_VERSION = "3.1.4"
+
+# rows are written to the file this many at a time
+CHUNK_ROWS = 2000
+
+# (LogRow field, ADIF tag) for fields copied as they are
+_row_tags = (
+    ("call", "CALL"),
+    ("sent_rst", "RST_SENT"),
+    ("rcvd_rst", "RST_RCVD"),
+    ("name", "NAME"),
+    ("grid", "GRIDSQUARE"),
+    ("sent_exch", "STX_STRING"),
+    ("rcvd_exch", "SRX_STRING"),
+    ("wwff", "WWFF_REF"),
+    ("sota", "SOTA_REF"),
+    ("pota", "POTA_REF"),
+    ("notes", "NOTES"),
+)
+# (LogFile header, ADIF tag), written into every record
+_header_tags = (
+    ("my_call", "STATION_CALLSIGN"),
+    ("my_grid", "MY_GRIDSQUARE"),
+    ("my_wwff", "MY_WWFF_REF"),
+    ("my_sota", "MY_SOTA_REF"),
+    ("my_pota", "MY_POTA_REF"),
+)
+# the headers that go into records
+_station_attrs = tuple(attr for attr, _ in _header_tags) + ("operators", "qsl_msg")
+
+# FLE names that ADIF spells differently, or only knows as a submode
+_adif_bands = {"2200m": "2190m"}
+_adif_modes = {
+    "USB": ("SSB", "USB"),
+    "LSB": ("SSB", "LSB"),
+    "FT4": ("MFSK", "FT4"),
+    "JS8": ("MFSK", "JS8"),
+}
+
+
+def _tag(name: str, value) -> str:
+    value = str(value)
+    return f"<{name}:{len(value)}>{value}" if value else ""
+
+
+def write_adif(log: Iterable[LogRow], file: TextIO, program: str = "FastLogger"):
+    """
+    Write a log as an ADIF (.adi) file.
+
+    `log` is a LogFile, or a LogStream to convert a log while it is read. Headers (my_call, my_grid, operators,
+    and the my_*ota refs) go into every record. The output is written CHUNK_ROWS records at a time.
+    """
+    _write_head(file, program, getattr(log, "operators", ()))
+    _write_records(log, log, file)
+
+
+def _write_head(file: TextIO, program: str, operators: Iterable[str]):
+    file.write(f"ADIF export from {program}\n")
+    if operators:
+        file.write(f"Operators: {', '.join(operators)}\n")
+    file.write(f"{_tag('ADIF_VER', ADIF_VERSION)} {_tag('PROGRAMID', program)} <EOH>\n\n")
+
+
+def _write_records(log, rows: Iterable[LogRow], file: TextIO):
+    # the records of `rows`, with the headers of `log`
+    plan = get_plan(getattr(log, "band_plan", None))
+    # band, mode, date, and time objects are shared between rows, so each is only formatted once
+    bands: Dict[str, str] = {}
+    modes: Dict[str, str] = {}
+    dates: Dict[date, str] = {}
+    times: Dict[time, str] = {}
+    # headers can change while a LogStream is read, so they are checked for each chunk
+    station = None
+    headers = ""
+    qsl_msgs: Dict[str, str] = {}
+
+    chunk = []
+    for i, row in enumerate(rows):
+        if not i % CHUNK_ROWS:
+            file.write("".join(chunk))
+            chunk.clear()
+            if (current := _station(log)) != station:
+                station = current
+                headers = _headers(log)
+                qsl_msgs.clear()
+
+        if (d := dates.get(row.date)) is None:
+            # rows before the first date in the log have date.min, which has no QSO_DATE
+            d = dates[row.date] = _tag("QSO_DATE", f"{row.date:%Y%m%d}") if row.date != date.min else ""
+        if (t := times.get(row.time)) is None:
+            t = times[row.time] = _tag("TIME_ON", f"{row.time:%H%M}")
+        # rows logged with a frequency but no band get the band the frequency is in
+        band = row.band or (row.freq != "" and plan.band_of(row.freq)) or ""
+        if (b := bands.get(band)) is None:
+            b = bands[band] = _tag("BAND", _adif_bands.get(band, band))
+        if (m := modes.get(row.mode)) is None:
+            mode, submode = _adif_modes.get(row.mode, (row.mode, ""))
+            m = modes[row.mode] = _tag("MODE", mode) + _tag("SUBMODE", submode)
+        # rows without a qsl message get the one from the header
+        if (q := qsl_msgs.get(msg := row.qsl_msg or station[-1])) is None:
+            q = qsl_msgs[msg] = _tag("QSLMSG", msg)
+
+        chunk.append(d + t + b + m)
+        if row.freq != "":
+            chunk.append(_tag("FREQ", row.freq))
+        for attr, name in _row_tags:
+            if value := getattr(row, attr):
+                chunk.append(f"<{name}:{len(value)}>{value}")
+        chunk.append(q + headers + "<EOR>\n")
+
+    file.write("".join(chunk))
+
+
+def _station(log) -> tuple:
+    return tuple(tuple(v) if isinstance(v := getattr(log, attr, ""), list) else v for attr in _station_attrs)
+
+
+def _headers(log) -> str:
+    tags = [_tag(name, getattr(log, attr, "")) for attr, name in _header_tags]
+    # ADIF only has room for one operator
+    if (ops := getattr(log, "operators", ())) and len(ops) == 1:
+        tags.append(_tag("OPERATOR", next(iter(ops))))
+    return "".join(tags)
@@ -0,0 +1,319 @@
+"""
+bandplan.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import json
+import os
+from bisect import bisect_right
+from typing import Dict, Iterable, Mapping, Optional, Tuple, Union
+
+
+__all__ = ["BandPlan", "PLANS", "DEFAULT_PLAN", "get_plan"]
+
+
+class BandPlan:
+    """
+    Band edges, modes, and mode segments of a region.
+
+    Frequencies (in MHz) are looked up by bisecting the sorted band edges, band and mode names through dicts
+    that give the plan's own string for each name. Plans are compiled once, use get_plan() to share them.
+    """
+    __slots__ = ("name", "edges", "modes", "default_modes", "segments", "_lows", "_highs", "_names",
+                 "_band_names", "_mode_names", "_seg_lows")
+
+    def __init__(self, name: str, bands: Mapping[str, Tuple[float, float]], modes: Iterable[str],
+                 default_modes: Optional[Mapping[str, str]] = None,
+                 segments: Iterable[Tuple[float, float, str]] = ()):
+        self.name = name
+        # band: (lower edge, upper edge)
+        self.edges: Dict[str, Tuple[float, float]] = {b: (float(lo), float(hi)) for b, (lo, hi) in bands.items()}
+        self._band_names = {b: b for b in self.edges}
+        self._mode_names = {m: m for m in modes}
+        self.modes = frozenset(self._mode_names)
+        self.default_modes = {b: self._mode_names[m] for b, m in (default_modes or {}).items()}
+
+        self._lows, self._highs, self._names = _interval_index(
+            ((lo, hi, b) for b, (lo, hi) in self.edges.items()), f"{name}: bands")
+        # (lower edge, upper edge, mode), sorted and not overlapping
+        lows, highs, seg_modes = _interval_index(
+            ((float(lo), float(hi), self._mode_names[m]) for lo, hi, m in segments), f"{name}: segments")
+        self.segments = tuple(zip(lows, highs, seg_modes))
+        self._seg_lows = lows
+
+    def __repr__(self):
+        return f"<BandPlan {self.name!r}: {len(self.edges)} bands, {len(self.modes)} modes>"
+
+    def band_of(self, freq: float) -> Optional[str]:
+        # the band a frequency is in, or None if it is outside all bands
+        i = bisect_right(self._lows, freq) - 1
+        if i >= 0 and freq <= self._highs[i]:
+            return self._names[i]
+        return None
+
+    def in_band(self, band: str, freq: float) -> bool:
+        return (edges := self.edges.get(band)) is not None and edges[0] <= freq <= edges[1]
+
+    def band_name(self, text: str) -> Optional[str]:
+        # the band called `text` (any case), or None if there is none
+        return self._band_names.get(text.lower())
+
+    def mode_name(self, text: str) -> Optional[str]:
+        return self._mode_names.get(text.upper())
+
+    def segment(self, freq: float) -> Optional[Tuple[float, float, str]]:
+        # the mode segment a frequency is in
+        i = bisect_right(self._seg_lows, freq) - 1
+        if i >= 0 and freq <= (seg := self.segments[i])[1]:
+            return seg
+        return None
+
+    def default_mode(self, band: str, freq: Optional[float] = None) -> Optional[str]:
+        # the mode of the segment `freq` is in, else the usual mode of the band
+        if freq is not None and (seg := self.segment(freq)) is not None and self.in_band(band, freq):
+            return seg[2]
+        return self.default_modes.get(band)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "bands": {b: list(e) for b, e in self.edges.items()},
+            "modes": list(self._mode_names),
+            "default_modes": dict(self.default_modes),
+            "segments": [list(seg) for seg in self.segments],
+        }
+
+    @classmethod
+    def from_dict(cls, spec: Mapping, name: Optional[str] = None) -> "BandPlan":
+        # keys as in to_dict(). a plan can be based on another with "base": its bands, modes, and default modes
+        # are taken and updated, and its segments are used unless the plan has its own. a band set to null
+        # is removed
+        base = get_plan(spec["base"]).to_dict() if "base" in spec else {}
+        bands = dict(base.get("bands", {}))
+        bands.update(spec.get("bands", {}))
+        default_modes = dict(base.get("default_modes", {}))
+        default_modes.update(spec.get("default_modes", {}))
+        modes = dict.fromkeys(base.get("modes", ()))
+        modes.update(dict.fromkeys(spec.get("modes", ())))
+        return cls(name or spec.get("name", "custom"), {b: e for b, e in bands.items() if e is not None}, modes,
+                   {b: m for b, m in default_modes.items() if bands.get(b) is not None},
+                   spec.get("segments", base.get("segments", ())))
+
+    @classmethod
+    def load(cls, path: Union[str, os.PathLike]) -> "BandPlan":
+        # a plan from a JSON file, see from_dict()
+        with open(path) as file:
+            return cls.from_dict(json.load(file), name=None)
+
+
+def _interval_index(intervals: Iterable[Tuple[float, float, str]], what: str):
+    # sorted lower edges, upper edges, and names of intervals, which may touch but not overlap
+    lows, highs, names = [], [], []
+    for lo, hi, name in sorted(intervals):
+        if lo > hi:
+            raise ValueError(f"{what}: {name} ends before it starts")
+        if highs and lo < highs[-1]:
+            raise ValueError(f"{what}: {name} overlaps {names[-1]}")
+        lows.append(lo)
+        highs.append(hi)
+        names.append(name)
+    return lows, highs, names
+
+
+# compiled plans, by name or by (path, modification time)
+_compiled: Dict[object, BandPlan] = {}
+
+
+def get_plan(plan: Union[None, str, os.PathLike, BandPlan] = None) -> BandPlan:
+    """
+    The plan with a name from PLANS, or loaded from a JSON file, compiled the first time it is asked for.
+    None gives the default plan, and a BandPlan is returned as it is.
+    """
+    if plan is None:
+        plan = "default"
+    if isinstance(plan, BandPlan):
+        return plan
+    if isinstance(plan, str) and plan in PLANS:
+        if (compiled := _compiled.get(plan)) is None:
+            compiled = _compiled[plan] = BandPlan.from_dict(PLANS[plan], name=plan)
+        return compiled
+    path = os.path.abspath(plan)
+    key = path, os.stat(path).st_mtime_ns
+    if (compiled := _compiled.get(key)) is None:
+        compiled = _compiled[key] = BandPlan.load(path)
+    return compiled
+
+
+bands = {
+    # wl: (lower f, upper f)
+    # [pfx]metres (MHz, MHz)
+    "2200m": (0.1357, 0.1358),
+    "630m": (0.472, 0.479),
+    "160m": (1.8, 2.0),
+    "80m": (3.5, 4.0),
+    "60m": (5.06, 5.45),
+    "40m": (7.0, 7.3),
+    "30m": (10.1, 10.15),
+    "20m": (14.0, 14.35),
+    "17m": (18.068, 18.168),
+    "15m": (21.0, 21.45),
+    "12m": (24.89, 24.99),
+    "10m": (28.0, 29.7),
+    "6m": (50.0, 54.0),
+    "4m": (70.0, 71.0),
+    "2m": (144.0, 148.0),
+    "1.25m": (222.0, 225.0),
+    "70cm": (420.0, 450.0),
+    "33cm": (902.0, 928.0),
+    "23cm": (1240.0, 1300.0),
+    "13cm": (2300.0, 2450.0),
+    "9cm": (3300.0, 3500.0),
+    "6cm": (5650.0, 5925.0),
+    "3cm": (10000.0, 10500.0),
+    "1.25cm": (24000.0, 24250.0),
+    "6mm": (47000.0, 47200.0),
+    "4mm": (75500.0, 81000.0),
+    "2.5mm": (119980.0, 120020.0),
+    "2mm": (142000.0, 149000.0),
+    "1mm": (241000.0, 250000.0),
+}
+
+modes = [
+    "CW",
+    "SSB",
+    "USB",
+    "LSB",
+    "AM",
+    "FM",
+    "RTTY",
+    "FT8",
+    "PSK",
+    "JT65",
+    "JT9",
+    "FT4",
+    "JS8",
+    "ARDOP",
+    "ATV",
+    "C4FM",
+    "CHIP",
+    "CLO",
+    "CONTESTI",
+    "DIGITALVOICE",
+    "DOMINO",
+    "DSTAR",
+    "FAX",
+    "FSK441",
+    "HELL",
+    "ISCAT",
+    "JT4",
+    "JT6M",
+    "JT44",
+    "MFSK",
+    "MSK144",
+    "MT63",
+    "OLIVIA",
+    "OPERA",
+    "PAC",
+    "PAX",
+    "PKT",
+    "PSK2K",
+    "Q15",
+    "QRA64",
+    "ROS",
+    "RTTYM",
+    "SSTV",
+    "T10",
+    "THOR",
+    "THRB",
+    "TOR",
+    "V4",
+    "VOI",
+    "WINMOR",
+    "WSPR",
+]
+
+
+# usual mode of each band, for the default plan
+_default_modes = {
+    "2200m": "CW", "630m": "CW", "160m": "SSB", "80m": "SSB", "60m": "SSB", "40m": "SSB", "30m": "CW",
+    "20m": "SSB", "17m": "SSB", "15m": "SSB", "12m": "SSB", "10m": "SSB", "6m": "SSB", "4m": "FM", "2m": "FM",
+    "1.25m": "FM", "70cm": "FM", "33cm": "FM", "23cm": "FM", "13cm": "SSB", "9cm": "SSB", "6cm": "SSB",
+    "3cm": "SSB", "1.25cm": "SSB", "6mm": "SSB", "4mm": "SSB", "2.5mm": "SSB", "2mm": "SSB", "1mm": "SSB",
+}
+
+# name: plan, see BandPlan.from_dict(). "default" is the plan logs are parsed with, which takes in the bands of all
+# regions. the regional plans have the band edges and the CW, SSB, and FM segments of the IARU band plans
+PLANS = {
+    "default": {
+        "bands": bands,
+        "modes": modes,
+        "default_modes": _default_modes,
+    },
+    "iaru-r1": {
+        "base": "default",
+        "bands": {
+            "160m": (1.81, 2.0), "80m": (3.5, 3.8), "60m": (5.3515, 5.3665), "40m": (7.0, 7.2), "4m": (70.0, 70.5),
+            "2m": (144.0, 146.0), "1.25m": None, "70cm": (430.0, 440.0), "33cm": None,
+        },
+        "segments": [
+            (1.81, 1.838, "CW"), (1.843, 2.0, "SSB"),
+            (3.5, 3.6, "CW"), (3.6, 3.8, "SSB"),
+            (5.3515, 5.354, "CW"), (5.354, 5.3665, "SSB"),
+            (7.0, 7.06, "CW"), (7.06, 7.2, "SSB"),
+            (10.1, 10.15, "CW"),
+            (14.0, 14.1, "CW"), (14.101, 14.35, "SSB"),
+            (18.068, 18.111, "CW"), (18.111, 18.168, "SSB"),
+            (21.0, 21.151, "CW"), (21.151, 21.45, "SSB"),
+            (24.89, 24.931, "CW"), (24.931, 24.99, "SSB"),
+            (28.0, 28.3, "CW"), (28.3, 29.51, "SSB"), (29.52, 29.7, "FM"),
+            (50.0, 50.1, "CW"), (50.1, 50.5, "SSB"), (51.21, 52.0, "FM"),
+            (144.0, 144.15, "CW"), (144.15, 144.4, "SSB"), (145.2, 145.8, "FM"),
+            (432.0, 432.1, "CW"), (432.1, 432.4, "SSB"), (433.0, 435.0, "FM"),
+        ],
+    },
+    "iaru-r2": {
+        "base": "default",
+        "bands": {"60m": (5.3305, 5.4065)},
+        "segments": [
+            (1.8, 1.843, "CW"), (1.843, 2.0, "SSB"),
+            (3.5, 3.6, "CW"), (3.6, 4.0, "SSB"),
+            (7.0, 7.125, "CW"), (7.125, 7.3, "SSB"),
+            (10.1, 10.15, "CW"),
+            (14.0, 14.15, "CW"), (14.15, 14.35, "SSB"),
+            (18.068, 18.11, "CW"), (18.11, 18.168, "SSB"),
+            (21.0, 21.2, "CW"), (21.2, 21.45, "SSB"),
+            (24.89, 24.93, "CW"), (24.93, 24.99, "SSB"),
+            (28.0, 28.3, "CW"), (28.3, 29.5, "SSB"), (29.5, 29.7, "FM"),
+            (50.0, 50.1, "CW"), (50.1, 51.0, "SSB"), (51.0, 54.0, "FM"),
+            (144.0, 144.1, "CW"), (144.1, 144.3, "SSB"), (145.1, 148.0, "FM"),
+            (222.0, 222.15, "CW"), (222.15, 222.25, "SSB"), (223.4, 225.0, "FM"),
+            (432.0, 432.07, "CW"), (432.07, 433.0, "SSB"), (440.0, 450.0, "FM"),
+        ],
+    },
+    "iaru-r3": {
+        "base": "default",
+        "bands": {
+            "80m": (3.5, 3.9), "60m": None, "4m": None, "2m": (144.0, 148.0), "1.25m": None, "70cm": (430.0, 440.0),
+            "33cm": None,
+        },
+        "segments": [
+            (1.8, 1.84, "CW"), (1.84, 2.0, "SSB"),
+            (3.5, 3.535, "CW"), (3.535, 3.9, "SSB"),
+            (7.0, 7.04, "CW"), (7.04, 7.3, "SSB"),
+            (10.1, 10.15, "CW"),
+            (14.0, 14.1, "CW"), (14.101, 14.35, "SSB"),
+            (18.068, 18.11, "CW"), (18.11, 18.168, "SSB"),
+            (21.0, 21.15, "CW"), (21.15, 21.45, "SSB"),
+            (24.89, 24.93, "CW"), (24.93, 24.99, "SSB"),
+            (28.0, 28.2, "CW"), (28.2, 29.5, "SSB"), (29.51, 29.7, "FM"),
+            (50.0, 50.1, "CW"), (50.1, 50.5, "SSB"), (51.0, 54.0, "FM"),
+            (144.0, 144.1, "CW"), (144.1, 144.5, "SSB"), (145.0, 148.0, "FM"),
+            (432.0, 432.1, "CW"), (432.1, 432.5, "SSB"), (438.0, 440.0, "FM"),
+        ],
+    },
+}
+
+DEFAULT_PLAN = get_plan("default")
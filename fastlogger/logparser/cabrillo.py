@@ -0,0 +1,136 @@
+"""
+cabrillo.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import warnings
+from datetime import date, time
+from itertools import chain
+from typing import Dict, Iterable, Mapping, Optional, TextIO
+
+from .bandplan import BandPlan, get_plan
+from .parser import LogRow
+
+
+__all__ = ["write_cabrillo", "CABRILLO_VERSION"]
+
+
+CABRILLO_VERSION = "3.0"
+
+# rows are written to the file this many at a time
+CHUNK_ROWS = 2000
+
+# QSO line columns: freq, mode, date, time, then the info sent and received.
+# the widths are the minimums from the Cabrillo spec, longer values push the rest of the line along
+_qso_columns = "QSO: {:>5} {:<2} {} {} "
+# call, rst, and exchange
+_info_columns = "{:<13} {:<3} {:<6}"
+_info_columns_no_rst = "{:<13} {:<6}"
+
+# band as written in place of a frequency above 30 MHz. below, it is the lower band edge in kHz
+_cabrillo_bands = {
+    "6m": "50", "4m": "70", "2m": "144", "1.25m": "222", "70cm": "432", "33cm": "902", "23cm": "1.2G",
+    "13cm": "2.3G", "9cm": "3.4G", "6cm": "5.7G", "3cm": "10G", "1.25cm": "24G", "6mm": "47G", "4mm": "75G",
+    "2.5mm": "119G", "2mm": "142G", "1mm": "241G",
+}
+_cabrillo_modes = {
+    "CW": "CW",
+    "SSB": "PH",
+    "USB": "PH",
+    "LSB": "PH",
+    "AM": "PH",
+    "FM": "FM",
+    "RTTY": "RY",
+}
+
+
+def write_cabrillo(log: Iterable[LogRow], file: TextIO, contest: Optional[str] = None,
+                   headers: Optional[Mapping[str, str]] = None, rst: bool = True,
+                   transmitter: Optional[int] = None, program: str = "FastLogger"):
+    """
+    Write a log as a Cabrillo 3.0 contest log.
+
+    CALLSIGN, OPERATORS, and GRID-LOCATOR come from the log's headers, CONTEST from `contest`, and any other
+    header lines (CATEGORY-OPERATOR, CLUB, ...) from `headers`. The sent and received exchanges follow the RSTs,
+    which can be left out with rst=False for contests that don't exchange them. `transmitter` adds the
+    transmitter ID column of multi-transmitter logs.
+
+    `log` can also be a LogStream; its headers are read up to the first QSO before the header is written.
+
+    QSOs without a date, mode, or band or frequency (logged before the first date, mode, or band line) can't be
+    written as QSO lines, so they are left out, with a warning saying how many were.
+    """
+    rows = iter(log)
+    first = next(rows, None)
+
+    lines = [f"START-OF-LOG: {CABRILLO_VERSION}", f"CREATED-BY: {program}"]
+    if contest:
+        lines.append(f"CONTEST: {contest}")
+    if my_call := getattr(log, "my_call", ""):
+        lines.append(f"CALLSIGN: {my_call}")
+    if ops := getattr(log, "operators", ()):
+        lines.append(f"OPERATORS: {' '.join(sorted(ops))}")
+    if my_grid := getattr(log, "my_grid", ""):
+        lines.append(f"GRID-LOCATOR: {my_grid}")
+    for tag, value in (headers or {}).items():
+        lines.append(f"{tag.upper()}: {value}")
+    file.write("\n".join(lines) + "\n")
+
+    # the whole line is laid out by one format call, with the columns that only depend on a few values
+    # (frequency, mode, date, time) formatted once per distinct value
+    info = _info_columns if rst else _info_columns_no_rst
+    template = f"{_qso_columns}{info} {info}"
+    if transmitter is not None:
+        template += f" {transmitter}"
+    else:
+        # no padding after the last column
+        template = template[:-len("{:<6}")] + "{}"
+    qso = (template + "\n").format
+    plan = get_plan(getattr(log, "band_plan", None))
+    freqs: Dict[object, str] = {}
+    modes: Dict[str, str] = {}
+    dates: Dict[date, str] = {}
+    times: Dict[time, str] = {}
+    mine = my_call or ""
+    skipped = 0
+
+    chunk = []
+    for i, row in enumerate(chain((first,), rows) if first is not None else ()):
+        if i and not i % CHUNK_ROWS:
+            file.write("".join(chunk))
+            chunk.clear()
+        if (f := freqs.get(key := (row.band, row.freq))) is None:
+            f = freqs[key] = _freq(row.band, row.freq, plan)
+        if (m := modes.get(row.mode)) is None:
+            m = modes[row.mode] = _cabrillo_modes.get(row.mode, "DG") if row.mode else ""
+        if (d := dates.get(row.date)) is None:
+            # rows before the first date in the log have date.min
+            d = dates[row.date] = row.date.isoformat() if row.date != date.min else ""
+        if not (f and m and d):
+            skipped += 1
+            continue
+        if (t := times.get(row.time)) is None:
+            t = times[row.time] = f"{row.time:%H%M}"
+        if rst:
+            chunk.append(qso(f, m, d, t, mine, row.sent_rst, row.sent_exch, row.call, row.rcvd_rst, row.rcvd_exch))
+        else:
+            chunk.append(qso(f, m, d, t, mine, row.sent_exch, row.call, row.rcvd_exch))
+
+    chunk.append("END-OF-LOG:\n")
+    file.write("".join(chunk))
+    if skipped:
+        warnings.warn(f"left out {skipped} QSO{'s' if skipped != 1 else ''} without a date, mode, or frequency",
+                      stacklevel=2)
+
+
+def _freq(band: str, freq, plan: BandPlan) -> str:
+    if freq != "":
+        if freq < 30:
+            return str(round(freq * 1000))
+        band = band or plan.band_of(freq) or ""
+    if (edges := plan.edges.get(band)) is not None and edges[0] < 30:
+        return str(round(edges[0] * 1000))
+    return _cabrillo_bands.get(band, band)
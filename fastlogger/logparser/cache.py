@@ -0,0 +1,245 @@
+"""
+cache.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from datetime import date, datetime, time
+from operator import attrgetter
+from pathlib import Path
+from typing import List, Optional, Union
+
+from .bandplan import PLANS, BandPlan, get_plan
+from .mapped import MappedLog
+from .parser import PARSER_VERSION, LogFile, LogRow, _header_attrs
+
+
+__all__ = ["ParseCache", "default_cache_dir"]
+
+
+# a cache file is the magic, the format version, and the zlib-compressed snapshot.
+# bump _FORMAT when the layout of the snapshot changes
+_MAGIC = b"FLPC"
+_FORMAT = 1
+_head = struct.Struct("<4sH")
+_SUFFIX = ".flpc"
+
+# the snapshot is a JSON header (log headers, options, string table, row count), then one array per column:
+# dates as ordinals, times as seconds since midnight, frequencies (NaN if not logged),
+# and the other fields as indexes into the string table
+_str_fields = tuple(f for f in LogRow.fields if f not in ("date", "time", "freq"))
+_length = struct.Struct("<I")
+
+_nan = float("nan")
+
+
+def default_cache_dir() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "fastlogger" / "parses"
+
+
+class ParseCache:
+    """
+    Parsed logs saved on disk, so a log that hasn't changed since it was last parsed doesn't have to be parsed
+    again. Entries are keyed by a hash of the log's text, the parser version, the options it was parsed with, and
+    the current year, which 2-digit years are read by (see key()), and hold a compact snapshot of the log's headers
+    and rows.
+
+    The cache keeps to `max_bytes` by removing the least recently used entries. It is only a shortcut:
+    entries that can't be read or written are treated as missing.
+
+        cache = ParseCache()
+        log = cache.load("my.log")
+    """
+    def __init__(self, directory: Union[None, str, os.PathLike] = None, max_bytes: int = 256 << 20):
+        self.directory = Path(directory) if directory is not None else default_cache_dir()
+        self.max_bytes = max_bytes
+
+    def key(self, text: Union[str, bytes, memoryview], auto_incr: bool = False,
+            band_plan: Union[None, str, BandPlan] = None) -> str:
+        plan = json.dumps(get_plan(band_plan).to_dict(), sort_keys=True)
+        # 2-digit years are read as 19yy or 20yy depending on this year, see _set_date
+        this_year = datetime.today().year
+        digest = hashlib.sha256(f"{PARSER_VERSION}\0{_FORMAT}\0{auto_incr:d}\0{plan}\0{this_year}\0".encode())
+        digest.update(text.encode("utf-8", "surrogatepass") if isinstance(text, str) else text)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[LogFile]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            log = _load_snapshot(data)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, struct.error, zlib.error):
+            # truncated or from another version of the format
+            self._remove(path)
+            return None
+        # the modification time is when an entry was last used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return log
+
+    def put(self, key: str, log: LogFile):
+        data = _dump_snapshot(log)
+        if len(data) > self.max_bytes:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # written next to the entry and renamed into place, so readers never see half an entry
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(data)
+                os.replace(tmp, self._path(key))
+            except BaseException:
+                self._remove(tmp)
+                raise
+            self._evict()
+        except OSError:
+            pass
+
+    def load(self, path: Union[str, os.PathLike], auto_incr: bool = False,
+             band_plan: Union[None, str, BandPlan] = None) -> LogFile:
+        # parse a log file, or take it from the cache if it was parsed before and hasn't changed since
+        with MappedLog(path) as lines:
+            key = self.key(lines.raw, auto_incr, band_plan)
+            if (log := self.get(key)) is None:
+                log = LogFile(lines, auto_incr, band_plan=band_plan)
+                self.put(key, log)
+        return log
+
+    def clear(self):
+        for path in self._entries():
+            self._remove(path)
+
+    @property
+    def size(self) -> int:
+        # bytes taken up by the entries
+        return sum(size for _, size, _ in self._stats())
+
+    def _path(self, key: str) -> Path:
+        return self.directory / (key + _SUFFIX)
+
+    def _entries(self) -> List[Path]:
+        try:
+            return list(self.directory.glob("*" + _SUFFIX))
+        except OSError:
+            return []
+
+    def _stats(self):
+        # (last used, size, path) of each entry
+        stats = []
+        for path in self._entries():
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            stats.append((st.st_mtime_ns, st.st_size, path))
+        return stats
+
+    def _evict(self):
+        stats = sorted(self._stats(), key=lambda s: s[0])
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in stats:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: Union[str, Path]):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _dump_snapshot(log: LogFile) -> bytes:
+    rows = log[:]
+    # rows mostly share their date and time objects, so each is only converted once
+    dates = {d: d.toordinal() for d in set(map(attrgetter("date"), rows))}
+    times = {t: t.hour * 3600 + t.minute * 60 + t.second for t in set(map(attrgetter("time"), rows))}
+    columns = [
+        array("i", map(dates.__getitem__, map(attrgetter("date"), rows))),
+        array("i", map(times.__getitem__, map(attrgetter("time"), rows))),
+        array("d", [f if f != "" else _nan for f in map(attrgetter("freq"), rows)]),
+    ]
+    strings = {"": 0}
+    for name in _str_fields:
+        columns.append(array("I", [strings.setdefault(v, len(strings)) for v in map(attrgetter(name), rows)]))
+
+    header = {
+        "headers": {attr: getattr(log, attr) for attr in _header_attrs},
+        "auto_incr": log._auto_exch,
+        "band_plan": log.band_plan.to_dict(),
+        "strings": list(strings),
+        "rows": len(rows),
+        "byteorder": sys.byteorder,
+    }
+    parts = [json.dumps(header).encode()]
+    parts += [col.tobytes() for col in columns]
+    body = b"".join(_length.pack(len(part)) + part for part in parts)
+    return _head.pack(_MAGIC, _FORMAT) + zlib.compress(body, 1)
+
+
+def _load_snapshot(data: bytes) -> LogFile:
+    magic, fmt = _head.unpack_from(data)
+    if magic != _MAGIC or fmt != _FORMAT:
+        raise ValueError("not a parse cache entry of this version")
+    body = memoryview(zlib.decompress(data[_head.size:]))
+    parts = []
+    pos = 0
+    while pos < len(body):
+        (n,) = _length.unpack_from(body, pos)
+        pos += _length.size
+        parts.append(body[pos:pos + n])
+        pos += n
+
+    header = json.loads(bytes(parts[0]))
+    n = header["rows"]
+    arrays = []
+    for typecode, part in zip("iid" + "I" * len(_str_fields), parts[1:]):
+        col = array(typecode)
+        col.frombytes(part)
+        if header["byteorder"] != sys.byteorder:
+            col.byteswap()
+        if len(col) != n:
+            raise ValueError("snapshot is truncated")
+        arrays.append(col)
+    if len(arrays) != 3 + len(_str_fields):
+        raise ValueError("snapshot is truncated")
+
+    # rows share their date and time objects and strings, like freshly parsed ones
+    dates = {d: date.fromordinal(d) for d in set(arrays[0])}
+    times = {t: time(t // 3600, t // 60 % 60, t % 60) for t in set(arrays[1])}
+    strings = header["strings"]
+    band, mode, call, *rest = ([strings[s] for s in col] for col in arrays[3:])
+    freq = [f if f == f else "" for f in arrays[2]]
+    make = LogRow._make
+    # LogRow.fields order: date, time, band, freq, mode, call, then the rest of the strings
+    rows = tuple(make(values) for values in zip((dates[d] for d in arrays[0]), (times[t] for t in arrays[1]),
+                                                band, freq, mode, call, *rest))
+
+    spec = header["band_plan"]
+    name = spec.get("name")
+    plan = get_plan(name) if name in PLANS and get_plan(name).to_dict() == spec else BandPlan.from_dict(spec)
+    log = LogFile((), header["auto_incr"], band_plan=plan)
+    for attr, value in header["headers"].items():
+        setattr(log, attr, value)
+    log.operators = tuple(log.operators)
+    log._data = rows
+    return log
@@ -0,0 +1,133 @@
+"""
+columns.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+__all__ = ["LogColumns"]
+
+
+# datetimes are stored as minutes since this
+EPOCH = datetime(1970, 1, 1)
+_epoch_ordinal = EPOCH.toordinal()
+
+# columns stored as integer codes into a table of their distinct values
+ENCODED = ("band", "mode", "call")
+
+
+class LogColumns:
+    """
+    The rows of a LogFile as one typed array per column, for counting, filtering, and bucketing
+    without going through the rows one by one.
+
+    - `minutes`: date and time of each QSO in minutes since 1970-01-01 (int64)
+    - `freq`: frequency in MHz, NaN if not logged (float64)
+    - `band`, `mode`, `call`: int32 codes into `categories[name]`
+
+    The arrays are array.array, or numpy arrays after to_numpy(). The queries work on both.
+    """
+    __slots__ = ("minutes", "freq", "band", "mode", "call", "categories")
+
+    def __init__(self, rows: Iterable):
+        self.minutes = array("q")
+        self.freq = array("d")
+        codes = {name: {} for name in ENCODED}
+        enc_cols = {name: array("i") for name in ENCODED}
+        # rows mostly share date objects, so their day numbers are only worked out once
+        days = {}
+        nan = float("nan")
+
+        for row in rows:
+            if (day := days.get(d := row.date)) is None:
+                day = days[d] = (d.toordinal() - _epoch_ordinal) * 1440
+            t = row.time
+            self.minutes.append(day + t.hour * 60 + t.minute)
+            self.freq.append(row.freq if row.freq != "" else nan)
+            for name in ENCODED:
+                tbl = codes[name]
+                if (code := tbl.get(v := getattr(row, name))) is None:
+                    code = tbl[v] = len(tbl)
+                enc_cols[name].append(code)
+
+        self.band = enc_cols["band"]
+        self.mode = enc_cols["mode"]
+        self.call = enc_cols["call"]
+        self.categories: Dict[str, Tuple[str, ...]] = {name: tuple(tbl) for name, tbl in codes.items()}
+
+    def __len__(self):
+        return len(self.minutes)
+
+    @property
+    def is_numpy(self) -> bool:
+        return np is not None and isinstance(self.minutes, np.ndarray)
+
+    def to_numpy(self) -> "LogColumns":
+        # the same columns as numpy arrays. the arrays share memory with these ones
+        if np is None:
+            raise ImportError("to_numpy() needs numpy to be installed")
+        if self.is_numpy:
+            return self
+        cols = LogColumns(())
+        cols.minutes = np.frombuffer(self.minutes, dtype=np.int64)
+        cols.freq = np.frombuffer(self.freq, dtype=np.float64)
+        for name in ENCODED:
+            setattr(cols, name, np.frombuffer(getattr(self, name), dtype=np.int32))
+        cols.categories = self.categories
+        return cols
+
+    def decode(self, name: str) -> List[str]:
+        cats = self.categories[name]
+        return [cats[c] for c in getattr(self, name)]
+
+    def counts(self, name: str) -> Dict[str, int]:
+        # number of QSOs per band, mode, or call
+        cats = self.categories[name]
+        codes = getattr(self, name)
+        if self.is_numpy:
+            return {cats[i]: int(n) for i, n in enumerate(np.bincount(codes, minlength=len(cats))) if n}
+        return {cats[i]: n for i, n in sorted(Counter(codes).items())}
+
+    def select(self, **where: Union[str, Sequence[str]]) -> Sequence[int]:
+        # indices of the rows matching all conditions, e.g. select(band="20m", mode=("CW", "SSB"))
+        if not where:
+            return range(len(self))
+        wanted = []
+        for name, values in where.items():
+            if name not in ENCODED:
+                raise KeyError(name)
+            lookup = {v: i for i, v in enumerate(self.categories[name])}
+            if isinstance(values, str):
+                values = (values,)
+            wanted.append((getattr(self, name), {lookup[v] for v in values if v in lookup}))
+
+        if self.is_numpy:
+            mask = np.ones(len(self), dtype=bool)
+            for codes, keep in wanted:
+                mask &= np.isin(codes, list(keep))
+            return np.flatnonzero(mask)
+        idx = range(len(self))
+        for codes, keep in wanted:
+            idx = [i for i in idx if codes[i] in keep]
+        return idx
+
+    def histogram(self, width: int = 60) -> Dict[datetime, int]:
+        # number of QSOs per `width` minutes, keyed by the start of each bucket
+        if self.is_numpy:
+            buckets, counts = np.unique(self.minutes // width, return_counts=True)
+            pairs = zip(buckets.tolist(), counts.tolist())
+        else:
+            pairs = sorted(Counter(m // width for m in self.minutes).items())
+        return {EPOCH + timedelta(minutes=b * width): n for b, n in pairs}
@@ -0,0 +1,192 @@
+"""
+convert.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, time as dt_time
+from glob import glob
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, TextIO, Tuple
+
+from .adif import write_adif
+from .cabrillo import write_cabrillo
+from .parser import LogFile, QLParsingError, _header_attrs
+
+
+__all__ = ["FORMATS", "ConvertResult", "convert", "convert_file", "find_logs"]
+
+
+def write_summary(log: LogFile, file: TextIO):
+    for attr in _header_attrs:
+        value = getattr(log, attr)
+        if attr == "operators":
+            value = ", ".join(sorted(value))
+        if value:
+            file.write(f"{attr}: {value}\n")
+    file.write(f"qsos: {len(log)}\n")
+    if len(log):
+        cols = log.columns()
+        first, last = log[0], log[-1]
+        file.write(f"first: {first.date} {first.time:%H:%M}\n")
+        file.write(f"last: {last.date} {last.time:%H:%M}\n")
+        file.write(f"unique calls: {len(cols.categories['call'])}\n")
+        for name in ("band", "mode"):
+            counts = ", ".join(f"{k} {n}" for k, n in cols.counts(name).items())
+            file.write(f"{name}s: {counts}\n")
+
+
+def write_jsonl(log: LogFile, file: TextIO):
+    # one object per row, with the same keys as the row
+    dumps = json.JSONEncoder(default=_json_default, ensure_ascii=False).encode
+    file.writelines(dumps(dict(row)) + "\n" for row in log)
+
+
+def _json_default(value):
+    if isinstance(value, (date, dt_time)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# format name: (file extension, writer(log, file))
+FORMATS: Dict[str, Tuple[str, Callable[[LogFile, TextIO], None]]] = {
+    # not ending in .txt, or a directory of logs would have its summaries converted as logs on the next run
+    "summary": (".summary", write_summary),
+    "jsonl": (".jsonl", write_jsonl),
+    "adif": (".adi", write_adif),
+    "cabrillo": (".log", write_cabrillo),
+}
+
+
+class ConvertResult:
+    __slots__ = ("path", "output", "qsos", "seconds", "error")
+
+    def __init__(self, path: str, output: Optional[str] = None, qsos: int = 0, seconds: float = 0.0,
+                 error: Optional[str] = None):
+        self.path = path
+        self.output = output
+        self.qsos = qsos
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __str__(self):
+        if self.error is not None:
+            return f"FAIL {self.path} ({self.seconds:.3f}s): {self.error}"
+        return f"ok   {self.path} -> {self.output} ({self.qsos} QSOs, {self.seconds:.3f}s)"
+
+
+def find_logs(patterns: Sequence[str], suffix: str = ".txt") -> List[str]:
+    # files matching each glob, directories are searched (not recursively) for files ending with `suffix`
+    found = {}
+    for pattern in patterns:
+        # a pattern matching nothing is kept, so it is reported as missing
+        matches = sorted(glob(pattern, recursive=True)) or [pattern]
+        for path in matches:
+            if Path(path).is_dir():
+                for child in sorted(Path(path).iterdir()):
+                    if child.is_file() and child.name.endswith(suffix):
+                        found[str(child)] = None
+            else:
+                found[path] = None
+    return list(found)
+
+
+def convert_file(path: str, fmt: str = "summary", out_dir: Optional[str] = None,
+                 auto_incr: bool = False) -> ConvertResult:
+    # parse one log and write it in `fmt` to out_dir (or next to the log). "-" for out_dir writes to stdout.
+    ext, writer = FORMATS[fmt]
+    start = time.perf_counter()
+    try:
+        with open(path) as file:
+            log = LogFile(file, auto_incr)
+        if out_dir == "-":
+            output = "<stdout>"
+            writer(log, sys.stdout)
+            sys.stdout.flush()
+        else:
+            output = str(Path(out_dir or Path(path).parent) / (Path(path).stem + ext))
+            if Path(output).resolve() == Path(path).resolve():
+                return ConvertResult(path, seconds=time.perf_counter() - start,
+                                     error=f"not overwriting the log with its {fmt} output")
+            with open(output, "w", newline="") as file:
+                writer(log, file)
+    except QLParsingError as e:
+        return ConvertResult(path, seconds=time.perf_counter() - start, error=f"{e.msg} on line {e.line_num}")
+    except (OSError, ValueError) as e:
+        # ValueError: a file that isn't text in the expected encoding (UnicodeDecodeError)
+        return ConvertResult(path, seconds=time.perf_counter() - start, error=str(e))
+    return ConvertResult(path, output, len(log), time.perf_counter() - start)
+
+
+def convert(paths: Sequence[str], fmt: str = "summary", out_dir: Optional[str] = None, auto_incr: bool = False,
+            jobs: Optional[int] = None,
+            report: Optional[Callable[[ConvertResult], None]] = None) -> List[ConvertResult]:
+    # convert logs in a pool of `jobs` processes (None for one per CPU), calling report() as each one finishes.
+    # results are in the order of `paths`
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt!r}")
+    jobs = min(jobs or os.cpu_count() or 1, len(paths))
+    # output to stdout is written in order, from this process
+    if jobs <= 1 or out_dir == "-":
+        results = []
+        for path in paths:
+            results.append(res := convert_file(path, fmt, out_dir, auto_incr))
+            if report is not None:
+                report(res)
+        return results
+
+    results = {}
+    with ProcessPoolExecutor(jobs) as pool:
+        # biggest first, so a large log doesn't start last and hold up the whole run
+        order = sorted(paths, key=lambda p: -os.path.getsize(p) if os.path.exists(p) else 0)
+        futures = [pool.submit(convert_file, path, fmt, out_dir, auto_incr) for path in order]
+        for fut in as_completed(futures):
+            res = fut.result()
+            results[res.path] = res
+            if report is not None:
+                report(res)
+    return [results[path] for path in paths]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m fastlogger.logparser convert",
+                                 description="Convert FLE logs to other formats.")
+    ap.add_argument("paths", nargs="+", metavar="PATH", help="log files, globs, or directories of logs")
+    ap.add_argument("-f", "--format", default="summary", choices=list(FORMATS), help="output format")
+    ap.add_argument("-o", "--output-dir", metavar="DIR",
+                    help="where to write the output files (default: next to each log, - for stdout)")
+    ap.add_argument("-j", "--jobs", type=int, metavar="N", help="number of processes (default: one per CPU)")
+    ap.add_argument("--suffix", default=".txt", help="file ending of logs searched for in directories")
+    ap.add_argument("--auto-incr", action="store_true", help="increment numeric sent exchanges automatically")
+    ap.add_argument("-q", "--quiet", action="store_true", help="only report failures")
+    args = ap.parse_args(argv)
+
+    paths = find_logs(args.paths, args.suffix)
+    if not paths:
+        ap.error("no logs found")
+    if args.output_dir not in (None, "-"):
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    def report(res: ConvertResult):
+        if not res.ok or not args.quiet:
+            print(res, file=sys.stderr)
+
+    start = time.perf_counter()
+    results = convert(paths, args.format, args.output_dir, args.auto_incr, args.jobs, report)
+    failed = sum(not res.ok for res in results)
+    if not args.quiet:
+        print(f"{len(results) - failed} converted, {failed} failed, {sum(r.qsos for r in results)} QSOs "
+              f"in {time.perf_counter() - start:.3f}s", file=sys.stderr)
+    return 1 if failed else 0
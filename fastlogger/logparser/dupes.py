@@ -0,0 +1,125 @@
+"""
+dupes.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+from operator import attrgetter
+from typing import Iterable, Optional, Sequence, Set
+
+from .parser import LogRow
+
+
+__all__ = ["DupeIndex", "DUPE_RULES"]
+
+
+# what makes two QSOs the same contact, for each contest rule:
+# once per contest, once per band, once per mode, or once per band and mode
+DUPE_RULES = {
+    "contest": ("call",),
+    "band": ("call", "band"),
+    "mode": ("call", "mode"),
+    "band-mode": ("call", "band", "mode"),
+}
+
+
+class DupeIndex:
+    """
+    Counts the QSOs with each call (and band and/or mode, depending on the rule) to look up dupes in
+    constant time. Kept up to date by update() with the rows added to and removed from the log.
+
+    A row is a dupe if an earlier row in the log has the same key, see is_dupe(). The first row with each key
+    is kept for this, and is looked for again in the log when an edit may have changed which one it is.
+    """
+    __slots__ = ("rule", "_key", "_counts", "_first", "_dupes")
+
+    def __init__(self, rows: Iterable[LogRow] = (), rule: str = "band-mode"):
+        if rule not in DUPE_RULES:
+            raise ValueError(f"unknown dupe rule: {rule!r}")
+        self.rule = rule
+        self._key = attrgetter(*DUPE_RULES[rule])
+        self._counts = {}
+        # the first row in the log with each key
+        self._first = {}
+        # number of rows that repeat an earlier contact
+        self._dupes = 0
+        self.update((), rows)
+
+    def __len__(self):
+        # number of different contacts
+        return len(self._counts)
+
+    @property
+    def dupe_count(self) -> int:
+        return self._dupes
+
+    def key(self, call: str, band: str = "", mode: str = ""):
+        fields = {"call": call.upper(), "band": band, "mode": mode.upper()}
+        key = tuple(fields[name] for name in DUPE_RULES[self.rule])
+        return key[0] if len(key) == 1 else key
+
+    def worked(self, call: str, band: str = "", mode: str = "") -> int:
+        # how often a contact is in the log already, i.e. a new QSO with it would be a dupe if this isn't 0
+        return self._counts.get(self.key(call, band, mode), 0)
+
+    def is_dupe(self, row: LogRow) -> bool:
+        # whether the row repeats an earlier contact. the first QSO with a contact isn't a dupe
+        key = self._key(row)
+        return self._counts.get(key, 0) > 1 and self._first.get(key) is not row
+
+    def update(self, removed: Iterable[LogRow], added: Iterable[LogRow],
+               rows: Optional[Sequence[LogRow]] = None) -> Set:
+        """
+        Count rows out and in. `added` are next to each other in the log, in log order. `rows` is the log after
+        the update, to find the first row with a key again when the edit may have changed which one it is.
+        Without it, added rows are taken to come after the rest of the log, like new QSOs do.
+        Returns the keys of the rows that became or stopped being dupes.
+        """
+        changed = set()
+        counts = self._counts
+        first = self._first
+        # keys whose first row may be another one now
+        lost = set()
+        for row in removed:
+            n = counts[key := self._key(row)] - 1
+            if n:
+                counts[key] = n
+                self._dupes -= 1
+                if n == 1:
+                    changed.add(key)
+                if first[key] is row:
+                    first[key] = None
+                    lost.add(key)
+            else:
+                del counts[key]
+                del first[key]
+                lost.discard(key)
+        for row in added:
+            n = counts.get(key := self._key(row), 0) + 1
+            counts[key] = n
+            if n == 1 or first[key] is None:
+                first[key] = row
+            elif rows is not None:
+                # the row may come before the first one of the rest of the log
+                lost.add(key)
+            if n > 1:
+                self._dupes += 1
+                if n == 2:
+                    changed.add(key)
+        if lost:
+            changed |= lost
+            if rows is not None:
+                self._find_first(lost, rows)
+        return changed
+
+    def _find_first(self, keys: Set, rows: Sequence[LogRow]):
+        # look for the first row with each of `keys`, from the top of the log until all are found
+        keys = set(keys)
+        for row in rows:
+            if (key := self._key(row)) in keys:
+                self._first[key] = row
+                keys.discard(key)
+                if not keys:
+                    break
@@ -0,0 +1,255 @@
+"""
+dxcc.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import hashlib
+import marshal
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from .cache import default_cache_dir
+from .parser import LogRow
+
+
+__all__ = ["CallInfo", "PrefixTrie", "load_cty", "resolve"]
+
+
+# bump when the compiled form changes, so cached tables are built again
+_FORMAT = 1
+
+# suffixes that say how someone operates, not where
+_modifiers = {"P", "M", "A", "B", "QRP", "QRPP", "LH", "J", "R"}
+# maritime and aeronautical mobile count for no entity
+_no_entity = {"MM", "AM"}
+
+# a prefix or =exact call in a cty.dat entity record, and the zones, place, continent, and time zone
+# that can follow it to override the entity's
+_entry_re = re.compile(r"(=?)([A-Z0-9/]+)(.*)")
+_override_re = re.compile(r"\((\d+)\)|\[(\d+)\]|<([^>]*)>|\{(\w+)\}|~([^~]*)~")
+
+
+class CallInfo:
+    """
+    Where a call is: its DXCC entity (name and primary prefix), CQ and ITU zones, continent, location
+    (degrees, east and north positive), and UTC offset in hours.
+    """
+    __slots__ = ("entity", "prefix", "cq_zone", "itu_zone", "continent", "lat", "lon", "utc_offset")
+
+    def __init__(self, entity: str, prefix: str, cq_zone: int, itu_zone: int, continent: str, lat: float,
+                 lon: float, utc_offset: float):
+        self.entity = entity
+        self.prefix = prefix
+        self.cq_zone = cq_zone
+        self.itu_zone = itu_zone
+        self.continent = continent
+        self.lat = lat
+        self.lon = lon
+        self.utc_offset = utc_offset
+
+    def _values(self) -> tuple:
+        return tuple(getattr(self, attr) for attr in self.__slots__)
+
+    def __eq__(self, other):
+        if isinstance(other, CallInfo):
+            return self._values() == other._values()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return (f"CallInfo({self.entity!r}, {self.prefix!r}, cq_zone={self.cq_zone}, itu_zone={self.itu_zone}, "
+                f"continent={self.continent!r})")
+
+
+class PrefixTrie:
+    """
+    Callsign prefixes compiled into a trie, for longest-prefix lookups of the entity of a call, plus the
+    calls that are listed on their own (=CALL in cty.dat).
+
+    The trie is nested dicts of one char each, a node's "" key holding the index of the CallInfo of the
+    prefix that ends there. Build one from a cty.dat file with load_cty(), which keeps the compiled
+    table cached on disk.
+    """
+    __slots__ = ("infos", "_trie", "_exact")
+
+    def __init__(self, infos: List[CallInfo], prefixes: Dict[str, int], exact: Dict[str, int]):
+        self.infos = infos
+        self._exact = exact
+        self._trie = {}
+        for prefix, info in prefixes.items():
+            node = self._trie
+            for c in prefix:
+                node = node.setdefault(c, {})
+            node[""] = info
+
+    def __len__(self):
+        # number of prefixes and exact calls
+        def count(node):
+            return ("" in node) + sum(count(child) for c, child in node.items() if c)
+        return count(self._trie) + len(self._exact)
+
+    @classmethod
+    def from_cty(cls, text: str) -> "PrefixTrie":
+        # entity records of "name: cq: itu: continent: lat: lon: utc offset: prefix:" then the prefixes and
+        # exact calls of the entity, split by commas and ended by a semicolon. lon and utc offset are west positive
+        infos: List[CallInfo] = []
+        shared: Dict[CallInfo, int] = {}
+        prefixes: Dict[str, int] = {}
+        exact: Dict[str, int] = {}
+
+        def index(info: CallInfo) -> int:
+            if (i := shared.get(info)) is None:
+                i = shared[info] = len(infos)
+                infos.append(info)
+            return i
+
+        for record in text.split(";"):
+            fields = record.split(":")
+            if len(fields) < 9:
+                continue
+            name, cq, itu, cont, lat, lon, tz, primary = (f.strip() for f in fields[:8])
+            entity = CallInfo(name, primary.lstrip("*"), int(cq), int(itu), cont, float(lat), _east(lon), _east(tz))
+            for entry in "".join(":".join(fields[8:]).split()).split(","):
+                if not (m := _entry_re.fullmatch(entry.upper())):
+                    continue
+                info = CallInfo(*entity._values())
+                for cq_o, itu_o, place, cont_o, tz_o in _override_re.findall(m.group(3)):
+                    if cq_o:
+                        info.cq_zone = int(cq_o)
+                    elif itu_o:
+                        info.itu_zone = int(itu_o)
+                    elif place:
+                        lat_o, _, lon_o = place.partition("/")
+                        info.lat, info.lon = float(lat_o), _east(lon_o)
+                    elif cont_o:
+                        info.continent = cont_o
+                    elif tz_o:
+                        info.utc_offset = _east(tz_o)
+                (exact if m.group(1) else prefixes)[m.group(2)] = index(info)
+        return cls(infos, prefixes, exact)
+
+    def dumps(self) -> bytes:
+        return marshal.dumps((_FORMAT, [info._values() for info in self.infos], self._trie, self._exact))
+
+    @classmethod
+    def loads(cls, data: bytes) -> "PrefixTrie":
+        fmt, infos, trie, exact = marshal.loads(data)
+        if fmt != _FORMAT:
+            raise ValueError("compiled with another version of the format")
+        table = cls.__new__(cls)
+        table.infos = [CallInfo(*values) for values in infos]
+        table._trie = trie
+        table._exact = exact
+        return table
+
+    def lookup(self, call: str) -> Optional[CallInfo]:
+        # the entity of a call, including portable ones like W1ABC/VE3, VE3/W1ABC/P, or W1ABC/4
+        call = call.upper()
+        if (i := self._exact.get(call)) is not None:
+            return self.infos[i]
+        parts = [p for p in call.split("/") if p]
+        if not parts or parts[-1] in _no_entity:
+            return None
+        # modifiers are never the first part, so /P and the like can't be mistaken for a prefix
+        parts = parts[:1] + [p for p in parts[1:] if p not in _modifiers]
+        if len(parts) == 1:
+            if (i := self._exact.get(parts[0])) is not None:
+                return self.infos[i]
+            return self._longest(parts[0])
+        home, away = parts[0], parts[1]
+        if len(away) == 1 and away.isdecimal():
+            # a new call area: W1ABC/4 is in the same place as W4ABC
+            for n, c in enumerate(home):
+                if c.isdecimal():
+                    return self._longest(home[:n] + away + home[n + 1:])
+            return self._longest(home)
+        # of a prefix and a call, the prefix is the shorter one
+        return self._longest(away if len(away) < len(home) else home)
+
+    def _longest(self, text: str) -> Optional[CallInfo]:
+        node = self._trie
+        found = None
+        for c in text:
+            if (node := node.get(c)) is None:
+                break
+            if (i := node.get("")) is not None:
+                found = i
+        return self.infos[found] if found is not None else None
+
+    def resolve(self, rows: Iterable[LogRow]) -> List[Optional[CallInfo]]:
+        # the CallInfo of each row (None if unknown), in one pass that looks each call up only once
+        seen: Dict[str, Optional[CallInfo]] = {}
+        lookup = self.lookup
+        out = []
+        for row in rows:
+            call = row.call
+            if (info := seen.get(call, seen)) is seen:
+                info = seen[call] = lookup(call)
+            out.append(info)
+        return out
+
+
+def _east(west: str) -> float:
+    # cty.dat longitudes and UTC offsets are west positive
+    return -float(west) or 0.0
+
+
+# compiled tables, by (path, modification time)
+_compiled: Dict[Tuple[str, int], PrefixTrie] = {}
+
+
+def load_cty(path: Union[str, os.PathLike], cache_dir: Union[None, str, os.PathLike] = None) -> PrefixTrie:
+    """
+    The PrefixTrie of a cty.dat file. It is compiled once and kept in `cache_dir` (by default next to the
+    parse cache) as marshal data, which loads much faster than the file parses. It is compiled again when
+    the file changes.
+    """
+    path = os.path.abspath(path)
+    key = path, os.stat(path).st_mtime_ns
+    if (table := _compiled.get(key)) is not None:
+        return table
+
+    with open(path, "rb") as file:
+        data = file.read()
+    digest = hashlib.sha256(data).digest()
+    directory = Path(cache_dir) if cache_dir is not None else default_cache_dir().parent / "cty"
+    # one entry per file, holding the hash of the text it was compiled from
+    cached = directory / (hashlib.sha256(path.encode()).hexdigest()[:32] + ".marshal")
+    table = None
+    try:
+        with open(cached, "rb") as file:
+            if file.read(len(digest)) == digest:
+                table = PrefixTrie.loads(file.read())
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+    if table is None:
+        table = PrefixTrie.from_cty(data.decode("latin-1"))
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(digest + table.dumps())
+                os.replace(tmp, cached)
+            except OSError:
+                os.remove(tmp)
+                raise
+        except OSError:
+            pass
+    _compiled[key] = table
+    return table
+
+
+def resolve(log: Iterable[LogRow], table: Union[str, os.PathLike, PrefixTrie]) -> List[Optional[CallInfo]]:
+    # entity, zones, and continent of each row of a log, from a PrefixTrie or a cty.dat file (see load_cty)
+    if not isinstance(table, PrefixTrie):
+        table = load_cty(table)
+    return table.resolve(log)
@@ -0,0 +1,194 @@
+"""
+grid.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import math
+from array import array
+from functools import lru_cache
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .parser import LogRow
+
+
+__all__ = ["locator_to_latlon", "is_locator", "distance", "bearing", "row_path", "total_distance",
+           "grid_distances", "GridDistances", "EARTH_RADIUS"]
+
+
+# mean radius, in km
+EARTH_RADIUS = 6371.0
+
+_digits = frozenset("0123456789")
+
+
+@lru_cache(maxsize=65536)
+def locator_to_latlon(locator: str) -> Optional[Tuple[float, float]]:
+    # centre of a 4, 6, or 8 character Maidenhead locator in degrees (north and east positive), None if it isn't one
+    loc = locator.strip().upper()
+    n = len(loc)
+    if n not in (4, 6, 8) or not ("A" <= loc[0] <= "R" and "A" <= loc[1] <= "R"
+                                  and loc[2] in _digits and loc[3] in _digits):
+        return None
+    # field (20 x 10 degrees), then square (2 x 1)
+    lon = (ord(loc[0]) - 65) * 20 - 180 + int(loc[2]) * 2
+    lat = (ord(loc[1]) - 65) * 10 - 90 + int(loc[3])
+    width, height = 2.0, 1.0
+    if n >= 6:
+        # subsquare (5 x 2.5 minutes)
+        if not ("A" <= loc[4] <= "X" and "A" <= loc[5] <= "X"):
+            return None
+        width, height = 5 / 60, 2.5 / 60
+        lon += (ord(loc[4]) - 65) * width
+        lat += (ord(loc[5]) - 65) * height
+    if n == 8:
+        # extended square (0.5 x 0.25 minutes)
+        if not (loc[6] in _digits and loc[7] in _digits):
+            return None
+        width, height = width / 10, height / 10
+        lon += int(loc[6]) * width
+        lat += int(loc[7]) * height
+    return lat + height / 2, lon + width / 2
+
+
+def is_locator(text: str) -> bool:
+    return bool(text) and locator_to_latlon(text) is not None
+
+
+@lru_cache(maxsize=65536)
+def _path(a: str, b: str) -> Optional[Tuple[float, float]]:
+    # great-circle distance in km and initial bearing in degrees from locator a to locator b
+    if (p := locator_to_latlon(a)) is None or (q := locator_to_latlon(b)) is None:
+        return None
+    lat1, lon1 = math.radians(p[0]), math.radians(p[1])
+    lat2, lon2 = math.radians(q[0]), math.radians(q[1])
+    dlon = lon2 - lon1
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    km = 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(h)))
+    y = math.sin(dlon) * math.cos(lat2)
+    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlon)
+    return km, math.degrees(math.atan2(y, x)) % 360
+
+
+def distance(a: str, b: str) -> Optional[float]:
+    # km between two locators
+    return p[0] if (p := _path(a.upper(), b.upper())) is not None else None
+
+
+def bearing(a: str, b: str) -> Optional[float]:
+    # degrees from north (clockwise) to head from locator a towards locator b
+    return p[1] if (p := _path(a.upper(), b.upper())) is not None else None
+
+
+def _row_grids(row: LogRow, my_grid: str) -> Tuple[str, str]:
+    # where a QSO was made from and to. a sent exchange that is a locator outside of my_grid means the station
+    # moved (a rover), the other station's locator is its grid or else a received exchange that is a locator
+    sent = row.sent_exch
+    here = sent if is_locator(sent) and not my_grid.upper().startswith(sent.upper()) else my_grid
+    there = row.grid or (row.rcvd_exch if is_locator(row.rcvd_exch) else "")
+    return here.upper(), there.upper()
+
+
+def row_path(row: LogRow, my_grid: str) -> Optional[Tuple[float, float]]:
+    # (km, bearing) of one QSO, None if either end isn't known
+    return _path(*_row_grids(row, my_grid))
+
+
+def total_distance(rows: Iterable[LogRow], my_grid: str) -> float:
+    # km summed over the rows that have a distance
+    total = 0.0
+    for row in rows:
+        if (p := _path(*_row_grids(row, my_grid))) is not None:
+            total += p[0]
+    return total
+
+
+class GridDistances:
+    """
+    Distance (km) and bearing (degrees) of each row of a log, NaN for rows where either end isn't known.
+    The columns are numpy arrays if numpy is installed, else array.array.
+    """
+    __slots__ = ("km", "bearing")
+
+    def __init__(self, km: Sequence[float], bearing: Sequence[float]):
+        self.km = km
+        self.bearing = bearing
+
+    def __len__(self):
+        return len(self.km)
+
+    @property
+    def total_km(self) -> float:
+        if np is not None and isinstance(self.km, np.ndarray):
+            return float(np.nansum(self.km))
+        return math.fsum(k for k in self.km if k == k)
+
+    @property
+    def count(self) -> int:
+        # rows with a distance
+        if np is not None and isinstance(self.km, np.ndarray):
+            return int(np.count_nonzero(~np.isnan(self.km)))
+        return sum(1 for k in self.km if k == k)
+
+    def longest(self) -> Optional[int]:
+        # index of the row with the longest distance
+        if not self.count:
+            return None
+        if np is not None and isinstance(self.km, np.ndarray):
+            return int(np.nanargmax(self.km))
+        return max((i for i, k in enumerate(self.km) if k == k), key=self.km.__getitem__)
+
+
+def grid_distances(log: Sequence[LogRow], my_grid: Optional[str] = None) -> GridDistances:
+    """
+    Distance and bearing of every row of a log in one go, from `my_grid` (by default the log's) to the grid
+    of each row (its grid, or a received exchange that is a locator, like in VHF contests).
+
+    Each distinct locator is converted once. With numpy, the distances are then worked out on whole arrays,
+    without it each distinct pair of locators is worked out once.
+    """
+    if my_grid is None:
+        my_grid = getattr(log, "my_grid", "")
+    pairs = [_row_grids(row, my_grid) for row in log]
+    nan = float("nan")
+
+    if np is None:
+        km = array("d")
+        brg = array("d")
+        for a, b in pairs:
+            p = _path(a, b)
+            km.append(p[0] if p is not None else nan)
+            brg.append(p[1] if p is not None else nan)
+        return GridDistances(km, brg)
+
+    # each distinct locator gets an index into the coordinate table, 0 being "not known"
+    index = {"": 0}
+    coords: List[Tuple[float, float]] = [(nan, nan)]
+    ends = []
+    for pair in pairs:
+        for loc in pair:
+            if (k := index.get(loc)) is None:
+                if (p := locator_to_latlon(loc)) is not None:
+                    k = len(coords)
+                    coords.append(p)
+                else:
+                    k = 0
+                index[loc] = k
+            ends.append(k)
+    ends = np.array(ends, dtype=np.intp).reshape(-1, 2)
+    table = np.radians(np.array(coords, dtype=np.float64))
+    lat1, lon1 = table[ends[:, 0], 0], table[ends[:, 0], 1]
+    lat2, lon2 = table[ends[:, 1], 0], table[ends[:, 1], 1]
+    dlon = lon2 - lon1
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    km = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+    y = np.sin(dlon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return GridDistances(km, np.degrees(np.arctan2(y, x)) % 360)
@@ -0,0 +1,357 @@
+"""
+incremental.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple, Union
+
+from .bandplan import BandPlan
+from .parser import (LogFile, LogRow, _ParserState, _parse_line, _carry_exch, _with_exch, _header_attrs,
+                     _sent_exch)
+from .spans import Span, line_spans
+
+
+__all__ = ["IncrementalLogFile", "RowDelta"]
+
+
+# lines are ordered by integer keys with room between them, so lines can be inserted without renumbering
+# the whole log. _KEY_STEP is the spacing after a renumbering, _KEY_GAP the most a single insert uses up.
+_KEY_STEP = 1 << 32
+_KEY_GAP = 1 << 16
+
+_initial_state = _ParserState().snapshot()
+
+
+class RowDelta:
+    # rows[start:start + removed] of the log were replaced with `rows`
+    __slots__ = ("start", "removed", "rows")
+
+    def __init__(self, start: int, removed: int, rows: Sequence[LogRow]):
+        self.start = start
+        self.removed = removed
+        self.rows = tuple(rows)
+
+    def __bool__(self):
+        return bool(self.removed or self.rows)
+
+    @staticmethod
+    def merge(deltas: Sequence["RowDelta"], rows: Sequence[LogRow]) -> "RowDelta":
+        # a single delta for a run of deltas, given the rows after the last one
+        start = end = removed = None
+        for d in deltas:
+            if not d:
+                continue
+            if start is None:
+                start, end, removed = d.start, d.start + len(d.rows), d.removed
+                continue
+            # changed range so far is [start, end) of the rows before d
+            lo = min(start, d.start)
+            hi = max(end, d.start + d.removed)
+            removed = hi - (end - start) + removed - lo
+            start, end = lo, hi - d.removed + len(d.rows)
+        if start is None:
+            return RowDelta(0, 0, ())
+        return RowDelta(start, removed, rows[start:end])
+
+    def __repr__(self):
+        return f"RowDelta(start={self.start}, removed={self.removed}, rows=<{len(self.rows)} rows>)"
+
+
+class _Line:
+    __slots__ = ("text", "key", "state", "kind", "value", "row", "killed_by", "error", "spans")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.key = 0
+        # parser state after this line
+        self.state = _initial_state
+        # what the line parsed to, see _parse_line
+        self.kind = None
+        self.value = None
+        # the row as it appears in the log (with the carried sent exchange), and the drop line that removed it
+        self.row = None
+        self.killed_by = None
+        self.error = None
+        # where its fields are, see take_spans
+        self.spans = ()
+
+
+class IncrementalLogFile(LogFile):
+    """
+    A LogFile that can be edited line by line.
+
+    Each line keeps the parser state it leaves behind, so an edit only re-parses from the changed lines
+    until the state carried into a line is the same as before the edit. Returns what changed as a RowDelta.
+    Lines that fail to parse are skipped and listed in `errors` instead of raising QLParsingError.
+
+    With spans=True, the lines that were parsed are also kept track of to give the spans of their fields
+    (see line_spans) with take_spans().
+    """
+    def __init__(self, data: Sequence[str] = (), auto_incr: bool = False,
+                 band_plan: Union[None, str, BandPlan] = None, spans: bool = False):
+        super().__init__((), auto_incr, band_plan=band_plan)
+        self._spans = spans
+        # lines parsed since their spans were last looked at
+        self._span_lines = set()
+        self._this_year = datetime.today().year
+        self._lines: List[_Line] = []
+        self._data: List[LogRow] = []
+        # keys of the lines each row, drop, header, and error come from, in line order
+        self._row_keys: List[int] = []
+        self._drop_keys: List[int] = []
+        self._header_keys: List[int] = []
+        self._headers = {}
+        self._errors = {}
+        self.update(0, 0, data)
+
+    @property
+    def line_count(self) -> int:
+        return len(self._lines)
+
+    @property
+    def errors(self) -> List[Tuple[int, str]]:
+        # (line number, message), numbered from 1 like QLParsingError
+        lines = sorted(self._errors.values(), key=lambda ln: ln.key)
+        return [(self._lines.index(ln) + 1, ln.error) for ln in lines]
+
+    @property
+    def error_count(self) -> int:
+        return len(self._errors)
+
+    def snapshot(self) -> LogFile:
+        # a plain LogFile with the current rows and headers, which later edits leave alone
+        log = LogFile((), self._auto_exch, band_plan=self.band_plan)
+        for attr in _header_attrs:
+            setattr(log, attr, getattr(self, attr))
+        log._data = tuple(self._data)
+        return log
+
+    def take_spans(self, limit: Optional[int] = None) -> List[Tuple[int, str, Tuple[Span, ...]]]:
+        # (line number from 0, text, spans) of the lines whose spans changed since they were last taken, in line
+        # order. spans are only worked out here, for at most `limit` lines, the rest are left for the next call
+        pending = self._span_lines
+        if not pending:
+            return []
+        lines = self._lines
+        if len(pending) * 16 > len(lines):
+            found = [(i, ln) for i, ln in enumerate(lines) if ln in pending]
+        else:
+            found = sorted((i, ln) for ln in pending if (i := self._line_index(ln)) >= 0)
+        if limit is not None and len(found) > limit:
+            self._span_lines = {ln for _, ln in found[limit:]}
+            found = found[:limit]
+        else:
+            self._span_lines = set()
+
+        changed = []
+        for i, ln in found:
+            comment = lines[i - 1].state[4] if i else False
+            spans = line_spans(ln.text, comment, ln.kind, ln.error is not None, self.band_plan)
+            if spans != ln.spans:
+                ln.spans = spans
+                changed.append((i, ln.text, spans))
+        return changed
+
+    def _line_index(self, ln: _Line) -> int:
+        # where a line is, found by its key, or -1 if it is not in the log anymore
+        lines = self._lines
+        lo, hi = 0, len(lines)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if lines[mid].key < ln.key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(lines) and lines[lo] is ln else -1
+
+    def set_lines(self, lines: Sequence[str]) -> RowDelta:
+        # replace all lines, only re-parsing the ones that differ
+        old = self._lines
+        n = min(len(old), len(lines))
+        pre = 0
+        while pre < n and old[pre].text == lines[pre]:
+            pre += 1
+        post = 0
+        while post < n - pre and old[-1 - post].text == lines[-1 - post]:
+            post += 1
+        return self.update(pre, len(old) - pre - post, lines[pre:len(lines) - post])
+
+    def update(self, start: int, removed: int, lines: Sequence[str]) -> RowDelta:
+        # replace `removed` lines from line `start` on with `lines`
+        if start < 0 or removed < 0 or start + removed > len(self._lines):
+            raise IndexError("line range out of range")
+
+        nxt = start + removed
+        lo_key = self._lines[start - 1].key if start else 0
+        hi_key = self._lines[nxt].key if nxt < len(self._lines) else lo_key + _KEY_STEP * (len(lines) + 1)
+        if hi_key - lo_key <= len(lines):
+            self._relabel()
+            lo_key = self._lines[start - 1].key if start else 0
+            hi_key = self._lines[nxt].key if nxt < len(self._lines) else lo_key + _KEY_STEP * (len(lines) + 1)
+
+        # a drop line at or after the edit could reach back across it, then the rows are rebuilt from the top
+        rebuild = bisect_right(self._drop_keys, lo_key) < len(self._drop_keys)
+        row_lo = bisect_right(self._row_keys, lo_key)
+
+        old = self._lines[start:nxt]
+        headers_changed = False
+        for ln in old:
+            headers_changed |= self._unindex(ln)
+        new = [_Line(text) for text in lines]
+        step = min((hi_key - lo_key) // (len(new) + 1), _KEY_GAP)
+        for i, ln in enumerate(new, 1):
+            ln.key = lo_key + i * step
+        self._lines[start:nxt] = new
+
+        # re-parse until the state carried into a line is the same as before the edit
+        state = self._lines[start - 1].state if start else _initial_state
+        old_state = old[-1].state if old else state
+        end = start + len(new)
+        i = start
+        while i < len(self._lines):
+            ln = self._lines[i]
+            if i >= end:
+                if state == old_state:
+                    break
+                old_state = ln.state
+                headers_changed |= self._unindex(ln)
+            state = self._parse(ln, state)
+            headers_changed |= self._index(ln)
+            i += 1
+        parsed = i
+
+        if rebuild:
+            start = row_lo = 0
+        delta = self._assemble(start, parsed, row_lo, rebuild)
+
+        if headers_changed:
+            self._update_headers()
+        if delta:
+            self._columns = None
+        return delta
+
+    def _assemble(self, start: int, parsed: int, row_lo: int, rebuild: bool) -> RowDelta:
+        # carry the sent exchange over and apply drops from line `start` on, until the exchange carried into a
+        # line that was not re-parsed is the same as before
+        rows = []
+        owners = []
+        # rows before `start` removed by drop lines after it
+        killed = 0
+        scan = start
+        top = self._data[row_lo - 1] if row_lo else None
+        j = start
+        while j < len(self._lines):
+            ln = self._lines[j]
+            if j >= parsed and not rebuild:
+                k = bisect_left(self._row_keys, ln.key)
+                old_top = self._data[k - 1] if k else None
+                if _exch(top) == _exch(old_top):
+                    break
+            if ln.kind == "row":
+                value = ln.value
+                if top is not None and not value[_sent_exch] and (p_sent_exch := top.sent_exch):
+                    value = _with_exch(value, _carry_exch(p_sent_exch, self._auto_exch))
+                if ln.row is None or ln.row._values != value:
+                    ln.row = LogRow._make(value)
+                ln.killed_by = None
+                rows.append(ln.row)
+                owners.append(ln)
+                top = ln.row
+            elif ln.kind == "drop":
+                if owners:
+                    rows.pop()
+                    owners.pop().killed_by = ln
+                else:
+                    while scan > 0:
+                        scan -= 1
+                        if (prev := self._lines[scan]).row is not None and prev.killed_by is None:
+                            prev.killed_by = ln
+                            killed += 1
+                            break
+                if rows:
+                    top = rows[-1]
+                else:
+                    top = self._data[row_lo - killed - 1] if row_lo - killed > 0 else None
+            j += 1
+
+        lo = row_lo - killed
+        hi = bisect_left(self._row_keys, self._lines[j].key) if j < len(self._lines) else len(self._data)
+        # leave out rows that did not change at either end
+        old_rows = self._data[lo:hi]
+        n = min(len(old_rows), len(rows))
+        pre = 0
+        while pre < n and old_rows[pre] is rows[pre]:
+            pre += 1
+        post = 0
+        while post < n - pre and old_rows[-1 - post] is rows[-1 - post]:
+            post += 1
+        rows = rows[pre:len(rows) - post]
+        removed = self._data[lo + pre:hi - post]
+        self._data[lo + pre:hi - post] = rows
+        # with the rows in place, so the indexes can find which row with a key comes first
+        for index in self._dupes.values():
+            index.update(removed, rows, self._data)
+        self._row_keys[lo + pre:hi - post] = [ln.key for ln in owners[pre:len(owners) - post]]
+        return RowDelta(lo + pre, len(old_rows) - pre - post, rows)
+
+    def _parse(self, ln: _Line, state: tuple) -> tuple:
+        st = _ParserState(state, self.band_plan)
+        try:
+            line = _parse_line(ln.text, st, self._this_year)
+            ln.error = None
+        except ValueError as e:
+            # skip the line, as if it was not there
+            line = None
+            st = _ParserState(state, self.band_plan)
+            ln.error = str(e)
+        ln.kind, ln.value = line if line is not None else (None, None)
+        if ln.kind != "row":
+            ln.row = None
+        if self._spans:
+            self._span_lines.add(ln)
+        # lines that leave the state alone share it
+        ln.state = state if (snapshot := st.snapshot()) == state else snapshot
+        return ln.state
+
+    def _index(self, ln: _Line) -> bool:
+        if ln.kind == "drop":
+            insort(self._drop_keys, ln.key)
+        elif ln.kind == "header":
+            insort(self._header_keys, ln.key)
+            self._headers[ln.key] = ln
+        if ln.error is not None:
+            self._errors[ln.key] = ln
+        return ln.kind == "header"
+
+    def _unindex(self, ln: _Line) -> bool:
+        if ln.kind == "drop":
+            del self._drop_keys[bisect_left(self._drop_keys, ln.key)]
+        elif ln.kind == "header":
+            del self._header_keys[bisect_left(self._header_keys, ln.key)]
+            del self._headers[ln.key]
+        self._errors.pop(ln.key, None)
+        return ln.kind == "header"
+
+    def _relabel(self):
+        for i, ln in enumerate(self._lines, 1):
+            ln.key = i * _KEY_STEP
+        self._row_keys = [ln.key for ln in self._lines if ln.row is not None and ln.killed_by is None]
+        self._drop_keys = [ln.key for ln in self._lines if ln.kind == "drop"]
+        self._headers = {ln.key: ln for ln in self._lines if ln.kind == "header"}
+        self._header_keys = list(self._headers)
+        self._errors = {ln.key: ln for ln in self._lines if ln.error is not None}
+
+    def _update_headers(self):
+        self._init_headers()
+        for key in self._header_keys:
+            self._set_header(*self._headers[key].value)
+        self.operators = tuple(set(self.operators))
+
+
+def _exch(row: Optional[LogRow]) -> str:
+    return row.sent_exch if row is not None else ""
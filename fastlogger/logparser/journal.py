@@ -0,0 +1,402 @@
+"""
+journal.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import hashlib
+import json
+import locale
+import os
+import tempfile
+import uuid
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .mapped import MappedLog
+
+
+__all__ = ["Journal", "find_journals", "default_journal_dir"]
+
+
+# bump when the records change, so older journals are left alone
+_FORMAT = 1
+_SUFFIX = ".journal"
+_SAVED = "saved"
+
+# (first line, lines replaced or None for all of them, new lines), like the edits of the editor
+Edit = Tuple[int, Optional[int], Sequence[str]]
+
+
+def default_journal_dir() -> Path:
+    base = os.environ.get("XDG_STATE_HOME") or Path.home() / ".local" / "state"
+    return Path(base) / "fastlogger" / "journals"
+
+
+class Journal:
+    """
+    The edits made to a log since it was last written out, appended to a journal file as line-level edits,
+    so saving costs as much as what changed rather than the whole log.
+
+    The journal starts from the log file as it is on disk (begin()). Edits are appended with append(). save()
+    writes the file from the first line edited on, over the old lines from there, which for new QSOs at the
+    end of a log is only those, and records this in the journal first. Once the journal has grown past
+    should_compact(), the edits are folded into the log file by compact(), which writes the file anew and
+    renames it over the old one, and starts a new journal. A log without a file (`path` None) is kept in the
+    journal only, and saved with mark_saved().
+
+    After a crash, the journal is replayed (replay()) onto the file it started from, or the file as it was
+    last saved. A journal whose file was changed otherwise no longer applies and is thrown away. Where there
+    is fcntl, a journal is locked while it is in use, and a journal locked by another running instance is
+    neither written to nor replaced.
+    """
+    def __init__(self, path: Union[None, str, os.PathLike] = None, directory: Union[None, str, os.PathLike] = None,
+                 encoding: Optional[str] = None):
+        self.path = os.path.abspath(path) if path is not None else None
+        self.directory = Path(directory) if directory is not None else default_journal_dir()
+        self.encoding = encoding
+        # the line ending of the file, kept when it is written out. None for the platform's
+        self.newline: Optional[str] = None
+        # one journal per file, a new one for each log without a file
+        name = hashlib.sha256(self.path.encode()).hexdigest()[:32] if self.path is not None else uuid.uuid4().hex
+        self.journal_path = self.directory / (name + _SUFFIX)
+        # bytes of the log text it started from, of the journal, of its header, and of the journal up to the
+        # last saved mark
+        self.base_size = 0
+        self.size = 0
+        self._start = 0
+        self._saved_at = 0
+        # lines and bytes of the file as it was last written, -1 bytes if that's not known, and the first line
+        # edited since (None for none), also as of the last saved mark
+        self._file_lines = 0
+        self._file_size = -1
+        self._low: Optional[int] = None
+        self._saved_low: Optional[int] = None
+        self._file = None
+
+    @classmethod
+    def load(cls, journal_path: Union[str, os.PathLike]) -> "Journal":
+        # a journal left on disk, see find_journals()
+        with open(journal_path, "rb") as file:
+            header = json.loads(file.readline())
+        if not isinstance(header, dict) or header.get("journal") != _FORMAT:
+            raise ValueError("not a journal of this version")
+        journal = cls(header["path"], Path(journal_path).parent, header.get("encoding"))
+        journal.journal_path = Path(journal_path)
+        return journal
+
+    @property
+    def dirty(self) -> bool:
+        # whether there are edits since the last saved mark
+        return self.size > self._saved_at
+
+    @property
+    def empty(self) -> bool:
+        # whether there are no edits since the journal was started
+        return self.size <= self._start
+
+    def in_use(self) -> bool:
+        # whether something else is writing to the journal
+        if fcntl is None or self._file is not None:
+            return False
+        try:
+            with open(self.journal_path, "rb") as file:
+                fcntl.flock(file.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    def begin(self, lines: Sequence[str]):
+        # start a new journal from `lines`, the log as its file is now
+        header = {"journal": _FORMAT, "path": self.path, "encoding": self.encoding, "base": _digest(lines)}
+        data = _record(header)
+        if self._file is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # locked before anything is written, so the journal of another instance is left alone
+            self._open()
+        # a crash while this is written leaves a journal that can't be read, which is skipped
+        self._file.truncate(0)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.base_size = sum(map(len, lines)) + len(lines)
+        self.size = self._start = self._saved_at = len(data)
+        self._file_lines = len(lines)
+        self._file_size = -1
+        self._low = self._saved_low = None
+        if self.path is not None:
+            if self.newline is None:
+                self.newline = _newline_of(self.path)
+            try:
+                self._file_size = os.stat(self.path).st_size
+            except OSError:
+                pass
+
+    def resume(self):
+        # carry on with the journal after replay(), without a record that was cut off
+        self.close()
+        self._open()
+        if self.journal_path.stat().st_size > self.size:
+            self._file.truncate(self.size)
+
+    def append(self, edits: Sequence[Edit]):
+        # add edits, and make sure they are on disk
+        if not edits:
+            return
+        self._write(b"".join(_record([start, removed, list(lines)]) for start, removed, lines in edits))
+        low = min(0 if removed is None else start for start, removed, _ in edits)
+        self._low = low if self._low is None else min(self._low, low)
+
+    def mark_saved(self):
+        # the edits so far are saved, so they stay when the log is closed without saving
+        if self.dirty:
+            self._write(_record(_SAVED))
+            self._saved_at = self.size
+            self._saved_low = self._low
+
+    def save(self, lines: Sequence[str]):
+        """
+        Write `lines` (the log with all edits so far) to the file, which is only the lines from the first one
+        edited since the file was last written. The file is written anew (see compact()) if that's the bigger
+        part of it, the journal has grown past should_compact(), or the file was changed by something else.
+        """
+        if self.path is None:
+            self.mark_saved()
+            return
+        if self._low is None and self._file_size >= 0:
+            return
+        low = min(self._low or 0, self._file_lines - 1, len(lines) - 1)
+        try:
+            size = os.stat(self.path).st_size
+        except OSError:
+            size = -1
+        if low < self._file_lines // 2 or size != self._file_size or self.should_compact():
+            self.compact(lines)
+            return
+        with open(self.path, "r+b") as file:
+            if (offset := _line_start(file, size, self._file_lines - low)) is None:
+                self.compact(lines)
+                return
+            tail = lines[low:]
+            text = "\n".join(tail)
+            if (newline := self.newline or os.linesep) != "\n":
+                text = text.replace("\n", newline)
+            data = text.encode(self.encoding or locale.getpreferredencoding(False))
+            # what is written goes into the journal first, so the file can be put together after a crash
+            self._write(_record({"save": low, "offset": offset, "tail": list(tail)}))
+            file.seek(offset)
+            file.write(data)
+            file.truncate()
+            file.flush()
+            os.fsync(file.fileno())
+        self._file_size = offset + len(data)
+        self._file_lines = len(lines)
+        self._write(_record({"saved": self._file_size}))
+        self._saved_at = self.size
+        self._low = self._saved_low = None
+
+    def revert(self):
+        # throw away the edits since the last saved mark
+        if self.dirty:
+            if self._file is not None:
+                self._file.truncate(self._saved_at)
+            else:
+                os.truncate(self.journal_path, self._saved_at)
+            self.size = self._saved_at
+            self._low = self._saved_low
+
+    def should_compact(self) -> bool:
+        # whether the journal has grown enough that folding it into the file is worth writing the file out,
+        # so writing out files costs in proportion to the edits made
+        return self.size > max(64 << 10, self.base_size // 2)
+
+    def compact(self, lines: Sequence[str]):
+        # write out `lines` (the log with all edits so far), and start over from them
+        if self.path is None:
+            # there is no file to write to, so the journal starts with all of the log instead
+            self.begin([])
+            self.append([(0, None, lines)])
+            self._start = self.size
+            return
+        text = "\n".join(lines)
+        if self.newline is None:
+            self.newline = _newline_of(self.path)
+        directory = os.path.dirname(self.path)
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding=self.encoding, newline=self.newline) as file:
+                file.write(text)
+                file.flush()
+                os.fsync(file.fileno())
+            if os.path.exists(self.path):
+                os.chmod(tmp, os.stat(self.path).st_mode & 0o7777)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        # a crash here leaves a journal that doesn't match the file anymore, which replay() throws away
+        self.begin(lines)
+
+    def replay(self) -> Optional[Tuple[List[str], bool]]:
+        """
+        The lines of the log with the journal applied, and whether it has edits after the last saved mark.
+        None if the journal doesn't apply to the file as it is now. A record cut off by a crash is left out.
+        """
+        with open(self.journal_path, "rb") as file:
+            head = file.readline()
+            data = file.read()
+        header = json.loads(head)
+        # the last record ends with "\n", so the split leaves an empty (or cut off) one at the end
+        records = []
+        for record in data.split(b"\n")[:-1]:
+            try:
+                records.append((json.loads(record), len(record) + 1))
+            except ValueError:
+                break
+        # the file is as the last save() left it, or as it was when the journal started
+        saves = [i for i, (value, _) in enumerate(records) if isinstance(value, dict) and "save" in value]
+        try:
+            mapped = MappedLog(self.path, self.encoding) if self.path is not None else None
+        except FileNotFoundError:
+            mapped = None
+        try:
+            if saves:
+                first = saves[-1]
+                save = records[first][0]
+                done = records[first + 1][0] if first + 1 < len(records) else None
+                written = isinstance(done, dict) and "saved" in done
+                low, offset = save["save"], save["offset"]
+                if mapped is None or (written and len(mapped.raw) != done["saved"]):
+                    return None
+                if low > len(mapped) or mapped._starts[low] != offset:
+                    return None
+                lines = mapped[:low] + save["tail"]
+                file_size = len(mapped.raw) if written else -1
+            else:
+                first = -1
+                lines = list(mapped) if mapped is not None else []
+                if header.get("base") != _digest(lines):
+                    return None
+                file_size = len(mapped.raw) if mapped is not None else -1
+        finally:
+            if mapped is not None:
+                mapped.close()
+        self.base_size = sum(map(len, lines)) + len(lines)
+        self._file_lines = len(lines)
+        self._file_size = file_size
+        self._low = self._saved_low = None
+        self.size = self._start = self._saved_at = len(head)
+        for i, (value, length) in enumerate(records):
+            self.size += length
+            if i > first and isinstance(value, list):
+                try:
+                    start, removed, new = value
+                    if removed is None:
+                        lines = new
+                    else:
+                        lines[start:start + removed] = new
+                except (ValueError, TypeError):
+                    self.size -= length
+                    break
+                low = 0 if removed is None else start
+                self._low = low if self._low is None else min(self._low, low)
+            elif value == _SAVED or isinstance(value, dict) and "saved" in value:
+                self._saved_at = self.size
+                self._saved_low = self._low
+        return lines, self.dirty
+
+    def discard(self):
+        # remove the journal, once everything in it is in the file
+        self.close()
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+        self.size = self._start = self._saved_at = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self):
+        file = open(self.journal_path, "ab")
+        if fcntl is not None:
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                file.close()
+                raise BlockingIOError(f"{self.path or 'the log'} is open in another instance") from None
+        self._file = file
+
+    def _write(self, data: bytes):
+        if self._file is None:
+            self._open()
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.size += len(data)
+
+
+def find_journals(directory: Union[None, str, os.PathLike] = None) -> List[Journal]:
+    # the journals left on disk, newest first
+    directory = Path(directory) if directory is not None else default_journal_dir()
+    found = []
+    try:
+        paths = sorted(directory.glob("*" + _SUFFIX), key=lambda p: p.stat().st_mtime_ns, reverse=True)
+    except OSError:
+        return []
+    for path in paths:
+        try:
+            journal = Journal.load(path)
+        except (OSError, ValueError, KeyError):
+            continue
+        if not journal.in_use():
+            found.append(journal)
+    return found
+
+
+def _newline_of(path: str) -> Optional[str]:
+    # the line ending of the first line of a file, None if there is no file or only one line
+    try:
+        with open(path, "rb") as file:
+            data = file.read(64 << 10)
+    except OSError:
+        return None
+    if (i := data.find(b"\n")) < 0:
+        return None
+    return "\r\n" if data[i - 1:i] == b"\r" else "\n"
+
+
+def _line_start(file, size: int, n: int) -> Optional[int]:
+    # where the n-th line from the end of a file of `size` bytes starts, read from the end. None if it has
+    # fewer lines
+    pos = size
+    while pos > 0:
+        chunk = min(64 << 10, pos)
+        pos -= chunk
+        file.seek(pos)
+        data = file.read(chunk)
+        end = len(data)
+        while (end := data.rfind(b"\n", 0, end)) >= 0:
+            n -= 1
+            if n == 0:
+                return pos + end + 1
+    return 0 if n == 1 else None
+
+
+def _record(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8", "surrogatepass") + b"\n"
+
+
+def _digest(lines: Sequence[str]) -> str:
+    return hashlib.sha256("\n".join(lines).encode("utf-8", "surrogatepass")).hexdigest()
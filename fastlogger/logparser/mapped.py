@@ -0,0 +1,105 @@
+"""
+mapped.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import collections.abc as abc
+import locale
+import mmap
+import os
+from array import array
+from typing import Iterator, List, Optional, Union
+
+
+__all__ = ["MappedLog"]
+
+
+class MappedLog(abc.Sequence):
+    """
+    The lines of a log file, read through a memory map of the file. Only the offsets where the lines start
+    are worked out up front, and a line is decoded from the map when it is asked for, so the text of the whole
+    file is never held in memory just to get at its lines. The file has to be in an encoding that keeps "\\n"
+    a single byte, which all the usual ones for logs (UTF-8, latin-1, cp1252) do.
+
+    Lines are split like str.split("\\n") and given without their line ending ("\\n" or "\\r\\n"), so they
+    are numbered like the lines of the editor. A LogFile can be parsed from them:
+
+        with MappedLog("my.log") as lines:
+            log = LogFile(lines)
+    """
+    def __init__(self, path: Union[str, os.PathLike], encoding: Optional[str] = None, errors: str = "strict"):
+        self.path = path
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.errors = errors
+        with open(path, "rb") as file:
+            # an empty file can't be mapped
+            if os.fstat(file.fileno()).st_size:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._map = b""
+        self._view = memoryview(self._map)
+        # start of each line, and the end of the file + 1 as the start of the line after the last
+        self._starts = _line_starts(self._map)
+        self._starts.append(len(self._map) + 1)
+
+    @property
+    def raw(self) -> memoryview:
+        # the bytes of the file, without copying them
+        return self._view
+
+    def text(self) -> str:
+        # the whole file decoded, with "\r\n" line endings turned into "\n" like a file opened as text
+        text = str(self._view, self.encoding, self.errors)
+        return text.replace("\r\n", "\n") if "\r" in text else text
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+            if isinstance(self._map, mmap.mmap):
+                self._map.close()
+
+    def __enter__(self) -> "MappedLog":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _line(self, i: int) -> str:
+        start, end = self._starts[i], self._starts[i + 1] - 1
+        if end > start and self._view[end - 1] == 13:
+            end -= 1
+        return str(self._view[start:end], self.encoding, self.errors)
+
+    # --- Wrappers to implement sequence-like functionality ---
+    def __len__(self):
+        return len(self._starts) - 1
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self._line(i) for i in range(*index.indices(len(self)))]
+        return self._line(range(len(self))[index])
+
+    def __iter__(self) -> Iterator[str]:
+        view, encoding, errors = self._view, self.encoding, self.errors
+        starts = iter(self._starts)
+        start = next(starts)
+        for nxt in starts:
+            end = nxt - 1
+            if end > start and view[end - 1] == 13:
+                end -= 1
+            yield str(view[start:end], encoding, errors)
+            start = nxt
+
+
+def _line_starts(buf) -> array:
+    starts = array("Q", [0])
+    find = buf.find
+    pos = find(b"\n")
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = find(b"\n", pos + 1)
+    return starts
@@ -0,0 +1,259 @@
+"""
+merge.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import argparse
+import collections.abc as abc
+import heapq
+import json
+import os
+import sys
+import time
+from collections import deque
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from itertools import chain, count, groupby
+from operator import attrgetter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple, Union
+
+from .adif import _write_head, _write_records
+from .bandplan import BandPlan
+from .convert import _json_default, find_logs
+from .parser import LogRow, LogStream, QLParsingError
+
+
+__all__ = ["LogMerge", "MergedRow", "MERGE_FORMATS", "merge_logs", "write_merged"]
+
+
+class MergedRow:
+    """
+    A row of a merged log, with the index of the log it came from, and that log's my_call and operators as
+    they were when the row was read.
+    """
+    __slots__ = ("row", "source", "my_call", "operators")
+
+    def __init__(self, row: LogRow, source: int, my_call: str, operators: Tuple[str, ...]):
+        self.row = row
+        self.source = source
+        self.my_call = my_call
+        self.operators = operators
+
+    def __repr__(self):
+        return f"MergedRow({self.row!r}, source={self.source}, my_call={self.my_call!r})"
+
+
+class LogMerge(abc.Iterator):
+    """
+    The rows of several logs in date and time order, as MergedRows. See merge_logs().
+
+    Each log has to be in time order itself, as logs are, so that only the next row of each is held, in a
+    heap keyed on its date and time. Rows at the same time come in the order of the logs, then of the rows.
+    Logs given as paths are parsed while they are read (see iterparse()), holding back `lookahead` rows of
+    each so delete lines can take them back. With the default of None, a log's rows are all held until its
+    end, so any run of deletes works; a number keeps memory bounded, but a longer run of deletes raises
+    QLParsingError partway through the merge (see check_lookahead()).
+
+    With `dedupe`, a row is left out if a row from another log with the same call, band, and mode was within
+    `window` minutes of it, like when two operators logged the same QSO or day logs overlap. Only the rows
+    of the last `window` minutes are kept for this. `dropped` counts the rows left out.
+    """
+    def __init__(self, sources: Sequence[Union[str, os.PathLike, Iterable[LogRow]]], dedupe: bool = False,
+                 window: float = 2, auto_incr: bool = False, band_plan: Union[None, str, BandPlan] = None,
+                 lookahead: Optional[int] = None):
+        self._files = ExitStack()
+        # the logs (LogFiles or LogStreams), and a name for each: its path, or its index
+        self.sources: List[Iterable[LogRow]] = []
+        self.names: List[str] = []
+        try:
+            for i, source in enumerate(sources):
+                if isinstance(source, (str, os.PathLike)):
+                    file = self._files.enter_context(open(source))
+                    self.sources.append(LogStream(file, auto_incr, lookahead, band_plan))
+                    self.names.append(str(source))
+                else:
+                    self.sources.append(source)
+                    self.names.append(str(i))
+        except BaseException:
+            self._files.close()
+            raise
+        self.dedupe = dedupe
+        self.window = timedelta(minutes=window)
+        # rows given, and rows left out as duplicates
+        self.qsos = 0
+        self.dropped = 0
+        self._rows = self._merge()
+
+    def __next__(self) -> MergedRow:
+        return next(self._rows)
+
+    def close(self):
+        self._files.close()
+
+    def __enter__(self) -> "LogMerge":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _merge(self) -> Iterator[MergedRow]:
+        iters = [iter(source) for source in self.sources]
+        # operators are only looked at again when a header line added some, see _LogHeaders
+        operators: List[Tuple[int, Tuple[str, ...]]] = [(-1, ())] * len(iters)
+        seq = count()
+        heap = []
+
+        def push(i: int):
+            # put the next row of log i on the heap, with the headers of the log as of that row
+            if (row := next(iters[i], None)) is None:
+                return
+            source = self.sources[i]
+            ops = getattr(source, "operators", ())
+            if len(ops) != operators[i][0]:
+                operators[i] = (len(ops), tuple(dict.fromkeys(ops)))
+            heapq.heappush(heap, (datetime.combine(row.date, row.time), i, next(seq), row,
+                                  getattr(source, "my_call", ""), operators[i][1]))
+
+        for i in range(len(iters)):
+            push(i)
+        # (call, band, mode): [(time, log)] of the rows of the last `window` minutes, oldest first
+        recent: Dict[Tuple[str, str, str], deque] = {}
+        expiry = deque()
+        while heap:
+            when, i, _, row, my_call, ops = heapq.heappop(heap)
+            push(i)
+            if self.dedupe:
+                cutoff = when - self.window
+                while expiry and expiry[0][0] < cutoff:
+                    _, old = expiry.popleft()
+                    if times := recent[old]:
+                        times.popleft()
+                    if not times:
+                        del recent[old]
+                key = (row.call, row.band, row.mode)
+                if (times := recent.get(key)) is None:
+                    times = recent[key] = deque()
+                if any(j != i for _, j in times):
+                    self.dropped += 1
+                    continue
+                times.append((when, i))
+                expiry.append((when, key))
+            self.qsos += 1
+            yield MergedRow(row, i, my_call, ops)
+
+
+def merge_logs(sources: Sequence[Union[str, os.PathLike, Iterable[LogRow]]], dedupe: bool = False,
+               window: float = 2, auto_incr: bool = False,
+               band_plan: Union[None, str, BandPlan] = None, lookahead: Optional[int] = None) -> LogMerge:
+    # merge LogFiles, LogStreams, or log files by QSO time, see LogMerge
+    return LogMerge(sources, dedupe, window, auto_incr, band_plan, lookahead)
+
+
+def check_lookahead(path: Union[str, os.PathLike], lookahead: Optional[int], auto_incr: bool = False,
+                    band_plan: Union[None, str, BandPlan] = None):
+    # parse a log with `lookahead`, without keeping its rows, raising the QLParsingError merging it would
+    with open(path) as file:
+        for _ in LogStream(file, auto_incr, lookahead, band_plan):
+            pass
+
+
+def write_merged_jsonl(merged: LogMerge, file: TextIO):
+    # one object per row, with the keys of the row, the log's my_call and operators, and the log it came from
+    dumps = json.JSONEncoder(default=_json_default, ensure_ascii=False).encode
+    names = merged.names
+    for m in merged:
+        obj = dict(m.row)
+        obj["my_call"] = m.my_call
+        obj["operators"] = list(m.operators)
+        obj["source"] = names[m.source]
+        file.write(dumps(obj) + "\n")
+
+
+class _RowHeaders:
+    # the headers of a log as they were for a run of its rows: the row's my_call and operators, the rest from the
+    # log, which has them as of the last row read (see LogStream), so as of the run
+    def __init__(self, source, my_call: str, operators: Tuple[str, ...]):
+        self._source = source
+        self.my_call = my_call
+        self.operators = operators
+
+    def __getattr__(self, attr):
+        return getattr(self._source, attr)
+
+
+def write_merged_adif(merged: LogMerge, file: TextIO, program: str = "FastLogger"):
+    # each record gets the station headers (STATION_CALLSIGN, OPERATOR, ...) its row had in the log it came from.
+    # the operators in the file head are those of the logs when the merge starts, as it's written before any record
+    first = next(merged, None)
+    operators = dict.fromkeys(op for source in merged.sources for op in getattr(source, "operators", ()))
+    _write_head(file, program, list(operators))
+    if first is None:
+        return
+    for (i, my_call, ops), run in groupby(chain((first,), merged), key=attrgetter("source", "my_call", "operators")):
+        _write_records(_RowHeaders(merged.sources[i], my_call, ops), (m.row for m in run), file)
+
+
+# format name: writer(merged, file)
+MERGE_FORMATS: Dict[str, Callable[[LogMerge, TextIO], None]] = {
+    "jsonl": write_merged_jsonl,
+    "adif": write_merged_adif,
+}
+
+
+def write_merged(merged: LogMerge, file: TextIO, fmt: str = "jsonl"):
+    if fmt not in MERGE_FORMATS:
+        raise ValueError(f"unknown format: {fmt!r}")
+    MERGE_FORMATS[fmt](merged, file)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m fastlogger.logparser merge",
+                                 description="Merge FLE logs into one, in QSO time order.")
+    ap.add_argument("paths", nargs="+", metavar="PATH", help="log files, globs, or directories of logs")
+    ap.add_argument("-f", "--format", default="jsonl", choices=list(MERGE_FORMATS), help="output format")
+    ap.add_argument("-o", "--output", default="-", metavar="FILE", help="where to write the merged log (default: -, "
+                                                                        "for stdout)")
+    ap.add_argument("--dedupe", action="store_true",
+                    help="leave out QSOs that another log has with the same call, band, and mode")
+    ap.add_argument("--window", type=float, default=2, metavar="MIN",
+                    help="how many minutes apart QSOs can be and still be the same (default: 2)")
+    ap.add_argument("--suffix", default=".txt", help="file ending of logs searched for in directories")
+    ap.add_argument("--auto-incr", action="store_true", help="increment numeric sent exchanges automatically")
+    ap.add_argument("--lookahead", type=int, metavar="N",
+                    help="hold back only N rows of each log, for deletes to take back (default: all rows). the logs "
+                         "are checked for longer runs of deletes before anything is written")
+    ap.add_argument("-q", "--quiet", action="store_true", help="only report failures")
+    args = ap.parse_args(argv)
+
+    paths = find_logs(args.paths, args.suffix)
+    if not paths:
+        ap.error("no logs found")
+    if args.lookahead is not None and args.lookahead < 0:
+        ap.error("--lookahead can't be negative")
+
+    start = time.perf_counter()
+    try:
+        if args.lookahead is not None:
+            for path in paths:
+                check_lookahead(path, args.lookahead, args.auto_incr)
+        with merge_logs(paths, args.dedupe, args.window, args.auto_incr, lookahead=args.lookahead) as merged, \
+                ExitStack() as stack:
+            if args.output == "-":
+                out = sys.stdout
+            else:
+                out = stack.enter_context(open(args.output, "w", newline=""))
+            write_merged(merged, out, args.format)
+    except QLParsingError as e:
+        print(f"[!!] {e.msg} on line {e.line_num}: {e.line.strip()}", file=sys.stderr)
+        return 1
+    except OSError as e:
+        print(f"[!!] {e}", file=sys.stderr)
+        return 1
+    if not args.quiet:
+        dropped = f", {merged.dropped} duplicates left out" if args.dedupe else ""
+        elapsed = time.perf_counter() - start
+        print(f"{merged.qsos} QSOs from {len(paths)} logs{dropped} in {elapsed:.3f}s", file=sys.stderr)
+    return 0
@@ -0,0 +1,155 @@
+"""
+parallel.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from .bandplan import BandPlan
+from .parser import QLParsingError, _ParserState, _parse_line, _parse_lines
+
+
+__all__ = ["parse_lines"]
+
+
+# below this many lines per process, starting the processes costs more than it saves
+MIN_CHUNK = 10000
+# lines parsed before a chunk (and thrown away) to settle the state it starts with
+WARMUP = 200
+# how far a chunk boundary may move to land on a date line
+SYNC_WINDOW = 500
+
+# (line number, kind, value), see _parse_lines
+_Result = Tuple[int, str, object]
+
+
+def parse_lines(data: Iterable[str], processes: Optional[int] = None,
+                plan: Optional[BandPlan] = None) -> List[Tuple[int, str, object]]:
+    """
+    Parse a log in chunks in several processes, giving the same lines as _parse_lines would.
+
+    Each chunk is parsed on a guess of the state the lines before it leave behind: the {} comment flag is
+    exact from a quick scan, the rest comes from parsing the WARMUP lines before the chunk. Chunks are then
+    joined in order, and a chunk whose guess turns out wrong is parsed again from its start, but only until
+    its state is the same as in the guessed parse. In FLE logs that is usually the next date, band, and mode.
+    """
+    lines = data if isinstance(data, Sequence) else list(data)
+    this_year = datetime.today().year
+    processes = min(processes or os.cpu_count() or 1, len(lines) // MIN_CHUNK)
+    if processes <= 1:
+        return list(_parse_lines(lines, _ParserState(plan=plan), this_year))
+
+    starts = _split(lines, processes)
+    ends = starts[1:] + [len(lines)]
+    warmups = [max(start - WARMUP, 0) for start in starts]
+    comments = _comment_flags(lines, warmups)
+
+    with ProcessPoolExecutor(processes) as pool:
+        chunks = pool.map(_parse_chunk, [lines[w:e] for w, e in zip(warmups, ends)], starts,
+                          [s - w for s, w in zip(starts, warmups)], comments, [this_year] * processes,
+                          [plan] * processes)
+
+        results = []
+        state = _ParserState().snapshot()
+        for start, end, (guess, chunk, states, guess_end) in zip(starts, ends, chunks):
+            if state == guess:
+                results.extend(chunk)
+                state = guess_end
+            else:
+                state = _fix_chunk(lines, start, end, state, chunk, states, guess_end, this_year, plan, results)
+
+    for i, kind, value in results:
+        if kind == "error":
+            raise QLParsingError(value, i, lines[i])
+    return results
+
+
+def _split(lines: Sequence[str], n: int) -> List[int]:
+    # first line of each chunk. a chunk starts on a date line if there is one close by
+    starts = [0]
+    for k in range(1, n):
+        start = k * len(lines) // n
+        for i in range(start, min(start + SYNC_WINDOW, len(lines))):
+            if lines[i].lstrip()[:4].lower() == "date":
+                start = i
+                break
+        if start > starts[-1]:
+            starts.append(start)
+    return starts
+
+
+def _comment_flags(lines: Sequence[str], at: Sequence[int]) -> List[bool]:
+    # whether a {} comment is open before each line in `at` (in order), same as _parse_line would see it
+    flags = []
+    comment = False
+    pos = 0
+    for target in at:
+        for ln in lines[pos:target]:
+            if "{" in ln or (comment and "}" in ln):
+                ln = ln.strip()
+                if not ln or ln.startswith("#"):
+                    continue
+                # the last brace on the line decides
+                if (opened := ln.rfind("{")) > (closed := ln.rfind("}")):
+                    comment = True
+                elif closed > opened:
+                    comment = False
+        pos = max(pos, target)
+        flags.append(comment)
+    return flags
+
+
+def _parse_chunk(lines: Sequence[str], first: int, warmup: int, comment: bool, this_year: int,
+                 plan: Optional[BandPlan]) -> Tuple[tuple, List[_Result], List[tuple], tuple]:
+    # parse lines[warmup:], numbered from `first`, on the state lines[:warmup] leave behind.
+    # the state after each of the first WARMUP results is kept to join a wrong guess back up with
+    state = _ParserState(plan=plan)
+    state.comment = comment
+    for ln in lines[:warmup]:
+        try:
+            _parse_line(ln, state, this_year)
+        except ValueError:
+            pass
+    guess = state.snapshot()
+
+    results = []
+    states = []
+    for i, ln in enumerate(lines[warmup:], first):
+        try:
+            line = _parse_line(ln, state, this_year)
+        except ValueError as e:
+            # only an error if the line is reached with this state, which is decided when joining the chunks
+            line = "error", str(e)
+        if line is not None:
+            results.append((i, line[0], line[1]))
+            if len(states) < WARMUP:
+                states.append(state.snapshot())
+    return guess, results, states, state.snapshot()
+
+
+def _fix_chunk(lines: Sequence[str], start: int, end: int, state: tuple, chunk: List[_Result], states: List[tuple],
+               chunk_end: tuple, this_year: int, plan: Optional[BandPlan], results: list) -> tuple:
+    # parse the chunk again from the right state until it meets the guessed parse, add its lines to `results`,
+    # and return the state after the chunk
+    st = _ParserState(state, plan)
+    j = 0
+    for i in range(start, end):
+        try:
+            line = _parse_line(lines[i], st, this_year)
+        except ValueError as e:
+            results.append((i, "error", str(e)))
+            return st.snapshot()
+        if line is not None:
+            results.append((i, line[0], line[1]))
+        while j < len(states) and chunk[j][0] < i:
+            j += 1
+        if j < len(states) and chunk[j][0] == i and states[j] == st.snapshot():
+            results.extend(chunk[j + 1:])
+            return chunk_end
+    return st.snapshot()
@@ -6,17 +6,37 @@ Copyright (C) 2020 classabbyamp
 This software is released under the BSD 3-Clause license.
 """
 
-from typing import List, Sequence, Union
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 import collections.abc as abc
+from collections import deque
+from contextvars import ContextVar
+from operator import attrgetter
 from datetime import datetime, timedelta, date, time
+from functools import lru_cache
 import re
+from sys import intern
 
+if __package__:
+    from .bandplan import BandPlan, DEFAULT_PLAN, get_plan, bands, modes
+else:
+    # parser.py run on its own by the test interface
+    from bandplan import BandPlan, DEFAULT_PLAN, get_plan, bands, modes
 
-__all__ = ["LogFile"]
 
+__all__ = ["LogFile", "LogStream", "LogRow", "iterparse", "QLParsingError", "ENGINES", "PARSER_VERSION"]
 
-class LogFile(abc.Sequence):
-    def __init__(self, data: Sequence[str], auto_incr: bool = False):
+
+# parse engines: "token" is the single-pass tokenizer, "regex" is the original regex cascade,
+# kept as a reference implementation
+ENGINES = ("token", "regex")
+
+# bump when a change to the parser changes what a log parses to, so parses saved by ParseCache aren't reused
+PARSER_VERSION = 1
+
+
+class _LogHeaders:
+    # the header fields of a log, as set by its header lines
+    def _init_headers(self):
         self.my_call = ""
         self.my_grid = ""
         self.operators = []
@@ -25,11 +45,59 @@ class LogFile(abc.Sequence):
         self.my_sota = ""
         self.my_pota = ""
         self.qth_nickname = ""
+
+    def _set_header(self, key: str, value: str):
+        if key == "operators":
+            for op in value.upper().split():
+                self.operators.append(op)
+        elif key in ("qsl_msg", "qth_nickname"):
+            setattr(self, key, value)
+        else:
+            setattr(self, key, value.upper())
+
+
+class LogFile(abc.Sequence, _LogHeaders):
+    def __init__(self, data: Iterable[str], auto_incr: bool = False, engine: str = "token",
+                 processes: Optional[int] = 1, band_plan: Union[None, str, BandPlan] = None, profile: bool = False):
+        # processes: parse big logs in this many processes (None for one per CPU), token engine only
+        # band_plan: a BandPlan, or the name or file of one, see get_plan(). token engine only
+        # profile: time the stages of the token engine into `stats`, see profiling.py. parses in one process
+        if engine not in ENGINES:
+            raise ValueError(f"unknown parse engine: {engine!r}")
+        self._init_headers()
         self._auto_exch = auto_incr
-        self._raw_data = tuple(data)
-        self._data = self._parse(data)
+        self.band_plan = get_plan(band_plan)
+        self._columns = None
+        self._dupes = {}
+        self.stats = None
+        if engine == "regex":
+            self._data = self._parse_regex(data)
+        else:
+            self._data = self._parse_tokens(data, processes, profile)
 
-    def _parse(self, data: List[str]):
+    def _parse_tokens(self, data: Iterable[str], processes: Optional[int] = 1, profile: bool = False):
+        # no lookahead limit, so a run of deletes can go back as far as it likes
+        if profile or _profiling.get() is not None:
+            # imported here so parser.py can still be run on its own by the test interface
+            from .profiling import _profiler
+            profiler = _profiler()
+            stream = LogStream._from_lines(profiler.parse_lines(data, self.band_plan), self._auto_exch,
+                                           band_plan=self.band_plan)
+            self.stats = profiler.stats
+        elif processes == 1:
+            stream = LogStream(data, self._auto_exch, lookahead=None, band_plan=self.band_plan)
+        else:
+            # imported here so parser.py can still be run on its own by the test interface
+            from .parallel import parse_lines
+            stream = LogStream._from_lines(parse_lines(data, processes, self.band_plan), self._auto_exch,
+                                           band_plan=self.band_plan)
+        rows = tuple(stream)
+        for attr in _header_attrs:
+            setattr(self, attr, getattr(stream, attr))
+        self.operators = tuple(set(self.operators))
+        return rows
+
+    def _parse_regex(self, data: List[str]):
         rows = list()
         curr_datetime = datetime.min
         curr_band = None
@@ -282,6 +350,25 @@ class LogFile(abc.Sequence):
 
         return tuple(rows)
 
+    def columns(self):
+        # the rows as typed arrays, see LogColumns. built on first use
+        if self._columns is None:
+            # imported here so parser.py can still be run on its own by the test interface
+            from .columns import LogColumns
+            self._columns = LogColumns(self._data)
+        return self._columns
+
+    def to_numpy(self):
+        # columns() as numpy arrays, needs numpy
+        return self.columns().to_numpy()
+
+    def dupes(self, rule: str = "band-mode"):
+        # the dupe index for a contest rule, see DupeIndex. built on first use
+        if (index := self._dupes.get(rule)) is None:
+            from .dupes import DupeIndex
+            index = self._dupes[rule] = DupeIndex(self._data, rule)
+        return index
+
     # --- Wrappers to implement sequence-like functionality ---
     def __len__(self):
         return len(self._data)
@@ -293,47 +380,184 @@ class LogFile(abc.Sequence):
         return iter(self._data)
 
 
+class LogStream(abc.Iterator, _LogHeaders):
+    """
+    Parses a log while it is being read, yielding LogRows. See iterparse().
+
+    A row is held back until `lookahead` more rows have been parsed, so that delete/drop/error lines can still
+    take it back. A delete that would have to take back a row that was already yielded raises QLParsingError;
+    `lookahead=None` holds back all rows. Header fields are those of the last row yielded: a header line read
+    while rows are held back is only set once the rows before it have been yielded.
+    """
+    def __init__(self, data: Iterable[str], auto_incr: bool = False, lookahead: Optional[int] = 1,
+                 band_plan: Union[None, str, BandPlan] = None, profile: bool = False):
+        self._init_headers()
+        self._auto_exch = auto_incr
+        self._lookahead = lookahead
+        self.band_plan = get_plan(band_plan)
+        self.stats = None
+        if profile or _profiling.get() is not None:
+            from .profiling import _profiler
+            profiler = _profiler()
+            self.stats = profiler.stats
+            self._rows = self._assemble(profiler.parse_lines(data, self.band_plan))
+        else:
+            self._rows = self._assemble(_parse_lines(data, _ParserState(plan=self.band_plan), datetime.today().year))
+
+    @classmethod
+    def _from_lines(cls, lines: Iterable[Tuple[int, str, object]], auto_incr: bool = False,
+                    lookahead: Optional[int] = None, band_plan: Union[None, str, BandPlan] = None) -> "LogStream":
+        # a stream over lines that were already parsed, see _parse_lines
+        stream = cls.__new__(cls)
+        stream._init_headers()
+        stream._auto_exch = auto_incr
+        stream._lookahead = lookahead
+        stream.band_plan = get_plan(band_plan)
+        stream.stats = None
+        stream._rows = stream._assemble(lines)
+        return stream
+
+    def __next__(self) -> "LogRow":
+        return next(self._rows)
+
+    def _assemble(self, lines: Iterable[Tuple[int, str, object]]) -> Iterator["LogRow"]:
+        held = deque()
+        # the last row yielded, and how many rows were
+        last = None
+        done = 0
+        # header lines read while rows were held back: (number of rows before the line, (attr, value))
+        headers = deque()
+
+        for i, kind, value in lines:
+            if kind == "drop":
+                if held:
+                    held.pop()
+                    # headers after the dropped row now come after the row before it
+                    n = done + len(held)
+                    moved = []
+                    while headers and headers[-1][0] > n:
+                        moved.append(headers.pop()[1])
+                    headers.extend((n, h) for h in reversed(moved))
+                elif last is not None:
+                    raise QLParsingError(f"{value} reaches back past the rows held back (lookahead={self._lookahead})",
+                                         i, value)
+            elif kind == "header":
+                if held or headers:
+                    headers.append((done + len(held), value))
+                else:
+                    self._set_header(*value)
+            else:
+                if (prev := held[-1] if held else last) is not None and not value[_sent_exch] \
+                        and (p_sent_exch := prev.sent_exch):
+                    value = _with_exch(value, _carry_exch(p_sent_exch, self._auto_exch))
+                held.append(LogRow._make(value))
+                if self._lookahead is not None and len(held) > self._lookahead:
+                    while headers and headers[0][0] <= done:
+                        self._set_header(*headers.popleft()[1])
+                    last = held.popleft()
+                    done += 1
+                    yield last
+
+        if not headers:
+            yield from held
+            return
+        for row in held:
+            while headers and headers[0][0] <= done:
+                self._set_header(*headers.popleft()[1])
+            done += 1
+            yield row
+        for _, header in headers:
+            self._set_header(*header)
+
+
+def iterparse(data: Iterable[str], auto_incr: bool = False, lookahead: Optional[int] = 1,
+              band_plan: Union[None, str, BandPlan] = None) -> LogStream:
+    # parse a log from a file object or any other iterable of lines without keeping it all in memory
+    return LogStream(data, auto_incr, lookahead, band_plan)
+
+
 class LogRow(abc.Mapping):
-    def __init__(self, data):
-        self._data = data
+    # a row keeps its values in slots named by `fields`, which all rows share.
+    # they can be read as attributes or by name like a dict
+    fields = (
         # required
-        self.date: date = data["date"]
-        self.time: time = data["time"]
-        self.band: str = data["band"]
-        self.freq: float = data["freq"]
-        self.mode: str = data["mode"]
-        self.call: str = data["call"]
+        "date", "time", "band", "freq", "mode", "call",
         # RST
-        self.sent_rst: str = data.get("sent_rst", "")
-        self.rcvd_rst: str = data.get("rcvd_rst", "")
+        "sent_rst", "rcvd_rst",
         # optional
-        self.name: str = data.get("name", "")
-        self.grid: str = data.get("grid", "")
+        "name", "grid",
         # contest
-        self.sent_exch: str = data.get("sent_exch", "")
-        self.rcvd_exch: str = data.get("rcvd_exch", "")
-        # WWFF
-        self.wwff: str = data.get("wwff", "")
-        # SOTA
-        self.sota: str = data.get("sota", "")
-        # POTA
-        self.pota: str = data.get("pota", "")
+        "sent_exch", "rcvd_exch",
+        # WWFF, SOTA, POTA
+        "wwff", "sota", "pota",
         # Other/Optional
-        self.qsl_msg: str = data.get("qsl_msg", "")
-        self.notes: str = data.get("notes", "")
+        "qsl_msg", "notes",
+    )
+    __slots__ = fields
+    _required = 6
+    _index = {f: i for i, f in enumerate(fields)}
+    # all values as a tuple, in field order
+    _values = property(attrgetter(*fields))
+
+    date: date
+    time: time
+    band: str
+    freq: float
+    mode: str
+    call: str
+    sent_rst: str
+    rcvd_rst: str
+    name: str
+    grid: str
+    sent_exch: str
+    rcvd_exch: str
+    wwff: str
+    sota: str
+    pota: str
+    qsl_msg: str
+    notes: str
+
+    def __init__(self, data: abc.Mapping):
+        req = self._required
+        self._set(tuple(data[f] for f in self.fields[:req]) + tuple(data.get(f, "") for f in self.fields[req:]))
+
+    @classmethod
+    def _make(cls, values: tuple) -> "LogRow":
+        # build a row straight from a tuple of values in field order
+        row = cls.__new__(cls)
+        row._set(values)
+        return row
+
+    def _set(self, values: tuple):
+        (self.date, self.time, self.band, self.freq, self.mode, self.call, self.sent_rst, self.rcvd_rst, self.name,
+         self.grid, self.sent_exch, self.rcvd_exch, self.wwff, self.sota, self.pota, self.qsl_msg,
+         self.notes) = values
 
     def __str__(self):
-        return str(self._data)
+        return str(dict(zip(self.fields, self._values)))
+
+    def __eq__(self, other):
+        if isinstance(other, LogRow):
+            return self._values == other._values
+        return super().__eq__(other)
+
+    def __reduce__(self):
+        return LogRow._make, (self._values,)
 
     # --- Wrappers to implement mapping-like functionality ---
     def __len__(self):
-        return len(self._data)
+        return len(self.fields)
 
     def __getitem__(self, key):
-        return self._data[key]
+        if key not in self._index:
+            raise KeyError(key)
+        return getattr(self, key)
 
     def __iter__(self):
-        return iter(self._data)
+        return iter(self.fields)
+
+
+_sent_exch = LogRow._index["sent_exch"]
 
 
 class QLParsingError(Exception):
@@ -379,90 +603,490 @@ def process_rst(raw: str, mode: str):
         return raw
 
 
-bands = {
-    # wl: (lower f, upper f)
-    # [pfx]metres (MHz, MHz)
-    "2200m": (0.1357, 0.1358),
-    "630m": (0.472, 0.479),
-    "160m": (1.8, 2.0),
-    "80m": (3.5, 4.0),
-    "60m": (5.06, 5.45),
-    "40m": (7.0, 7.3),
-    "30m": (10.1, 10.15),
-    "20m": (14.0, 14.35),
-    "17m": (18.068, 18.168),
-    "15m": (21.0, 21.45),
-    "12m": (24.89, 24.99),
-    "10m": (28.0, 29.7),
-    "6m": (50.0, 54.0),
-    "4m": (70.0, 71.0),
-    "2m": (144.0, 148.0),
-    "1.25m": (222.0, 225.0),
-    "70cm": (420.0, 450.0),
-    "33cm": (902.0, 928.0),
-    "23cm": (1240.0, 1300.0),
-    "13cm": (2300.0, 2450.0),
-    "9cm": (3300.0, 3500.0),
-    "6cm": (5650.0, 5925.0),
-    "3cm": (10000.0, 10500.0),
-    "1.25cm": (24000.0, 24250.0),
-    "6mm": (47000.0, 47200.0),
-    "4mm": (75500.0, 81000.0),
-    "2.5mm": (119980.0, 120020.0),
-    "2mm": (142000.0, 149000.0),
-    "1mm": (241000.0, 250000.0),
+# --- Token engine ---
+# The token engine splits each line into whitespace-separated tokens once and then picks fields off
+# the token list in the same order and with the same precedence as the regex cascade in
+# LogFile._parse_regex. Each token remembers how many blanks preceded it, because some fields
+# (bare dates, wwff/sota/pota references) are only recognised by the cascade after a run of blanks.
+
+_notes_re = re.compile(r"\<\s*?(.+)\s*?\>")
+_qsl_re = re.compile(r"\b\[\s*(.+)\s*\]")
+_date_re = re.compile(r"(\d{2,4})\D(\d{1,2})\D(\d{1,2})\b")
+_rst_re = re.compile(r"\b([+-]?\d{1,3})\s*([+-]?\d{1,3})?\b")
+_drop_re = re.compile(r"(?:\s|^)(delete|drop|error)\b", re.I)
+
+_header_res = {
+    # keyword: (attribute, regex)
+    "mycall": ("my_call", re.compile(r"mycall\s*([\w\d/]+)?", re.I)),
+    "mygrid": ("my_grid", re.compile(r"mygrid\s*([A-R]{2}[0-9]{2}(?:[A-X]{2}(?:[0-9]{2})?)?)?", re.I)),
+    "op": ("operators", re.compile(r"op(?:erator)?s?\s*((?:[\w\d\/]{3,}\s*)+)?", re.I)),
+    "qslmsg": ("qsl_msg", re.compile(r"qslmsg\s*(.*)?", re.I)),
+    "mywwff": ("my_wwff", re.compile(r"mywwff\s*([\w\d]{1,2}FF-\d{4})?", re.I)),
+    "mysota": ("my_sota", re.compile(r"mysota\s*([\w\d]+/[\w\d]+-\d{3})?", re.I)),
+    "mypota": ("my_pota", re.compile(r"mypota\s*([\w\d]+-\d{4})?", re.I)),
+    "nickname": ("qth_nickname", re.compile(r"nickname\s*(.*)?", re.I)),
 }
 
-modes = [
-    "CW",
-    "SSB",
-    "USB",
-    "LSB",
-    "AM",
-    "FM",
-    "RTTY",
-    "FT8",
-    "PSK",
-    "JT65",
-    "JT9",
-    "FT4",
-    "JS8",
-    "ARDOP",
-    "ATV",
-    "C4FM",
-    "CHIP",
-    "CLO",
-    "CONTESTI",
-    "DIGITALVOICE",
-    "DOMINO",
-    "DSTAR",
-    "FAX",
-    "FSK441",
-    "HELL",
-    "ISCAT",
-    "JT4",
-    "JT6M",
-    "JT44",
-    "MFSK",
-    "MSK144",
-    "MT63",
-    "OLIVIA",
-    "OPERA",
-    "PAC",
-    "PAX",
-    "PKT",
-    "PSK2K",
-    "Q15",
-    "QRA64",
-    "ROS",
-    "RTTYM",
-    "SSTV",
-    "T10",
-    "THOR",
-    "THRB",
-    "TOR",
-    "V4",
-    "VOI",
-    "WINMOR",
-    "WSPR",
-]
+_header_attrs = tuple(attr for attr, _ in _header_res.values())
+
+_qso_fields = ("call", "sent_rst", "rcvd_rst", "name", "grid", "sent_exch", "rcvd_exch", "wwff", "sota", "pota",
+               "qsl_msg", "notes")
+
+_sigil_fields = (
+    # (field, sigil, formatter)
+    ("name", "@", str.title),
+    ("grid", "#", str.upper),
+    ("sent_exch", ",", str.upper),
+    ("rcvd_exch", ".", str.upper),
+)
+
+
+# the profiler of an active profiling.profile_parsing() block
+_profiling = ContextVar("_profiling", default=None)
+
+
+class _ParserState:
+    __slots__ = ("datetime", "band", "freq", "mode", "comment", "plan")
+
+    def __init__(self, snapshot: tuple = (datetime.min, None, None, None, False), plan: Optional[BandPlan] = None):
+        self.datetime, self.band, self.freq, self.mode, self.comment = snapshot
+        # the band plan bands, frequencies, and modes are checked against
+        self.plan = plan or DEFAULT_PLAN
+
+    def snapshot(self) -> tuple:
+        # everything a line carries over to the next one, as a hashable and comparable tuple
+        return self.datetime, self.band, self.freq, self.mode, self.comment
+
+
+def _parse_lines(data: Iterable[str], state: _ParserState, this_year: int,
+                 first: int = 0) -> Iterator[Tuple[int, str, object]]:
+    # (line number, kind, value) for each line that adds something to the log, see _parse_line
+    for i, ln in enumerate(data, first):
+        try:
+            line = _parse_line(ln, state, this_year)
+        except ValueError as e:
+            raise QLParsingError(str(e), i, ln)
+        if line is not None:
+            yield i, line[0], line[1]
+
+
+def _parse_line(ln: str, state: _ParserState, this_year: int) -> Optional[Tuple[str, object]]:
+    # returns ("row", row values), ("header", (attr, value)), ("drop", keyword), or None if the line adds nothing.
+    # the sent exchange of a row is not carried over from the previous row here, see _carry_exch
+    ln = ln.strip()
+
+    # single line comment or empty line
+    if not ln or ln.startswith("#"):
+        return None
+
+    # multi-line comment
+    if state.comment or "{" in ln:
+        ln, state.comment = _strip_comments(ln, state.comment)
+
+    # delete, drop, error: remove previous log entry
+    if len(ln) <= 6 and ln.lower() in ["delete", "drop", "error"]:
+        return "drop", ln
+
+    # headers
+    if (header := _match_header(ln)) is not None:
+        return ("header", header) if header[1] else None
+
+    # qsos
+    # a delete, drop, or error on the qso line drops the qso itself
+    if (qso := _parse_qso(ln, state, this_year)) is None:
+        return None
+
+    if (curr_band := state.band) and (curr_freq := state.freq):
+        if not state.plan.in_band(curr_band, curr_freq):
+            state.freq = None
+
+    if qso["call"]:
+        return "row", _make_row(qso, state)
+    return None
+
+
+def _carry_exch(prev_exch: str, auto_incr: bool) -> str:
+    # sent exchange for a row that has none, given the one of the row before it
+    if prev_exch and auto_incr:
+        try:
+            return str(int(prev_exch) + 1)
+        except ValueError:
+            pass
+    return prev_exch
+
+
+def _strip_comments(ln: str, comment: bool) -> Tuple[str, bool]:
+    parts = []
+    pos = 0
+    while True:
+        if comment:
+            if (end := ln.find("}", pos)) < 0:
+                break
+            pos = end + 1
+            comment = False
+        else:
+            if (start := ln.find("{", pos)) < 0:
+                parts.append(ln[pos:])
+                break
+            parts.append(ln[pos:start])
+            pos = start + 1
+            comment = True
+    return "".join(parts), comment
+
+
+def _match_header(ln: str) -> Optional[Tuple[str, Optional[str]]]:
+    kw = ln[:8].lower()
+    if kw.startswith("op"):
+        kw = "op"
+    elif kw != "nickname":
+        kw = kw[:6]
+    if (header := _header_res.get(kw)) is None:
+        return None
+    attr, regex = header
+    if m := regex.match(ln):
+        return attr, m.group(1)
+    return None
+
+
+def _parse_qso(ln: str, state: _ParserState, this_year: int) -> Optional[dict]:
+    qso = dict.fromkeys(_qso_fields)
+
+    # notes
+    if "<" in ln and (m := _notes_re.search(ln)):
+        qso["notes"] = m.group(1)
+        ln = ln[:m.start()] + ln[m.end():]
+
+    # qsl msg
+    if "[" in ln and (m := _qsl_re.search(ln)):
+        qso["qsl_msg"] = m.group(1)
+        ln = ln[:m.start()] + ln[m.end():]
+
+    texts, gaps = _tokenize(ln)
+
+    # band, frequency, date, and time all start with a digit
+    numeric = False
+    for t in texts:
+        if t[0].isdecimal():
+            numeric = True
+            break
+
+    found = None
+    if numeric:
+        # band
+        for i, t in enumerate(texts):
+            if n := _band_len(t):
+                if (b := state.plan.band_name(t[:n])) is not None:
+                    state.band = b
+                _take(texts, gaps, i, n, gaps[i] - 1)
+                break
+
+        # frequency
+        for i, t in enumerate(texts):
+            if "." in t and _is_freq(t):
+                if state.plan.band_of(f := float(t)) is not None:
+                    state.freq = f
+                _take(texts, gaps, i, len(t), gaps[i])
+                break
+
+        # date
+        if found := _find_keyed(texts, gaps, "date", _date_match):
+            i, m, keep = found
+            state.datetime = _set_date(state.datetime, *m.groups(), this_year)
+            _take(texts, gaps, i, m.end(), keep)
+
+    # day: only at the very start of what is left of the line
+    if not found and texts and not gaps[0] and texts[0][:3].lower() == "day":
+        rest = texts[0][3:]
+        if not rest and len(texts) > 1:
+            rest = texts[1]
+        if days := len(rest) - len(rest.lstrip("+")):
+            if len(texts[0]) == 3:
+                del texts[0], gaps[0]
+                _take(texts, gaps, 0, days, 0)
+            else:
+                _take(texts, gaps, 0, 3 + days, 0)
+            state.datetime += timedelta(days=days)
+            # whatever is left after the plus signs may be a time
+            numeric = True
+
+    # time
+    if numeric:
+        for i, t in enumerate(texts):
+            if n := _time_len(t):
+                state.datetime = _set_time(state.datetime, t[:n])
+                _take(texts, gaps, i, n, gaps[i])
+                break
+
+    # mode: only the first word is considered
+    for i, t in enumerate(texts):
+        if t[0].isalnum() or t[0] == "_":
+            n = _word_len(t)
+            if (mode := state.plan.mode_name(t[:n])) is not None:
+                state.mode = mode
+                _take(texts, gaps, i, n, gaps[i] - 1)
+            break
+
+    # callsign
+    for i, t in enumerate(texts):
+        if n := _call_len(t):
+            qso["call"] = t[:n].upper()
+            _take(texts, gaps, i, n, gaps[i] - 1)
+            break
+
+    # name, grid, sent and received exchange
+    for field, sigil, fmt in _sigil_fields:
+        if sigil not in ln:
+            continue
+        for i, t in enumerate(texts):
+            if t[0] != sigil:
+                continue
+            if n := _sigil_len(t):
+                qso[field] = fmt(t[1:n])
+                _take(texts, gaps, i, n, gaps[i] - 1)
+                break
+            if value := _take_sigil_run(texts, gaps, i):
+                qso[field] = fmt(value)
+                break
+
+    # wwff, sota, pota
+    for field, size in (("wwff", _wwff_len), ("sota", _sota_len), ("pota", _pota_len)):
+        if "-" not in ln:
+            break
+        if found := _find_keyed(texts, gaps, field, lambda texts, gaps, i: size(texts[i])):
+            i, n, keep = found
+            qso[field] = texts[i][:n].upper()
+            _take(texts, gaps, i, n, keep)
+
+    if texts:
+        rest = " ".join(texts)
+        # sent and received rst
+        if m := _rst_re.search(rest):
+            qso["sent_rst"] = process_rst(m.group(1), state.mode)
+            qso["rcvd_rst"] = process_rst(m.group(2), state.mode)
+            rest = rest.replace(m.group(0), "", 1)
+        # delete, drop, error
+        if _drop_re.search(rest):
+            return None
+
+    return qso
+
+
+def _make_row(qso: dict, state: _ParserState) -> tuple:
+    # row values in LogRow.fields order
+    default_rst = "599" if state.mode in ["CW", "RTTY", "PSK"] else "59"
+    return (
+        _share(state.datetime.date()),
+        _share(state.datetime.time()),
+        state.band if state.band else "",
+        state.freq if state.freq else "",
+        state.mode if state.mode else "",
+        qso["call"],
+        # only a handful of different reports are ever logged
+        intern(qso["sent_rst"]) if qso["sent_rst"] else default_rst,
+        intern(qso["rcvd_rst"]) if qso["rcvd_rst"] else default_rst,
+        qso["name"] if qso["name"] else "",
+        qso["grid"] if qso["grid"] else "",
+        qso["sent_exch"] if qso["sent_exch"] else "",
+        qso["rcvd_exch"] if qso["rcvd_exch"] else "",
+        qso["wwff"] if qso["wwff"] else "",
+        qso["sota"] if qso["sota"] else "",
+        qso["pota"] if qso["pota"] else "",
+        qso["qsl_msg"] if qso["qsl_msg"] else "",
+        qso["notes"] if qso["notes"] else "",
+    )
+
+
+@lru_cache(maxsize=4096)
+def _share(value):
+    # rows with equal dates or times share one date or time object
+    return value
+
+
+def _with_exch(values: tuple, sent_exch: str) -> tuple:
+    return values[:_sent_exch] + (sent_exch,) + values[_sent_exch + 1:]
+
+
+def _tokenize(ln: str) -> Tuple[List[str], List[int]]:
+    texts = ln.split()
+    gaps = []
+    end = 0
+    for t in texts:
+        start = ln.find(t, end)
+        gaps.append(start - end)
+        end = start + len(t)
+    return texts, gaps
+
+
+def _take(texts: List[str], gaps: List[int], i: int, n: int, keep: int):
+    # remove the first n chars of token i, leaving `keep` blanks in front of whatever follows
+    keep = max(keep, 0)
+    # a field can run over into the following tokens
+    while n > len(texts[i]):
+        n -= len(texts[i]) + gaps[i + 1]
+        del texts[i], gaps[i + 1]
+    if rest := texts[i][n:]:
+        if keep or not i:
+            texts[i] = rest
+            gaps[i] = keep
+        else:
+            texts[i - 1] += rest
+            del texts[i], gaps[i]
+    else:
+        del texts[i], gaps[i]
+        if i < len(texts):
+            gaps[i] += keep
+
+
+def _take_sigil_run(texts: List[str], gaps: List[int], i: int) -> Optional[str]:
+    # the sigil is followed by nothing word-like, so the field runs on over the blanks up to the next word
+    parts = [texts[i][1:]]
+    for j in range(i + 1, len(texts)):
+        parts.append(" " * gaps[j])
+        t = texts[j]
+        for n, c in enumerate(t):
+            if c.isalnum() or c == "_":
+                parts.append(t[:n])
+                keep = gaps[i] - 1
+                del texts[i:j], gaps[i:j]
+                _take(texts, gaps, i, n, keep)
+                return "".join(parts)
+        parts.append(t)
+    return None
+
+
+def _find_keyed(texts: List[str], gaps: List[int], keyword: str, match):
+    # a field that is either preceded by its keyword, or by two or more blanks
+    for i, t in enumerate(texts):
+        if len(t) == len(keyword) and t.lower() == keyword and i + 1 < len(texts) and (m := match(texts, gaps, i + 1)):
+            keep = gaps[i] - 1
+            del texts[i], gaps[i]
+            return i, m, keep
+        if gaps[i] + (not i) >= 2 and (m := match(texts, gaps, i)):
+            return i, m, 0
+    return None
+
+
+def _date_match(texts: List[str], gaps: List[int], i: int):
+    if not texts[i][0].isdecimal():
+        return None
+    # any single non-digit separates the parts of a date, including a blank
+    tail = texts[i]
+    for j in range(i + 1, min(i + 3, len(texts))):
+        if gaps[j] != 1:
+            break
+        tail += " " + texts[j]
+    return _date_re.match(tail)
+
+
+def _is_word(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+
+def _bounded(t: str, n: int) -> bool:
+    # is there a word boundary after t[:n]?
+    return _is_word(t[n - 1]) != (n < len(t) and _is_word(t[n]))
+
+
+def _digit_len(t: str) -> int:
+    n = 0
+    for c in t:
+        if not c.isdecimal():
+            break
+        n += 1
+    return n
+
+
+def _word_len(t: str) -> int:
+    n = 0
+    for c in t:
+        if not (c.isalnum() or c == "_"):
+            break
+        n += 1
+    return n
+
+
+def _band_len(t: str) -> int:
+    if not (n := _digit_len(t)):
+        return 0
+    if t[n:n + 2].lower() in ("cm", "mm") and _bounded(t, n + 2):
+        return n + 2
+    if t[n:n + 1].lower() == "m" and _bounded(t, n + 1):
+        return n + 1
+    return 0
+
+
+def _is_freq(t: str) -> bool:
+    dot = t.find(".")
+    return dot > 0 and t[:dot].isdecimal() and t[dot + 1:].isdecimal()
+
+
+def _time_len(t: str) -> int:
+    if 0 < (n := _digit_len(t)) <= 4 and _bounded(t, n):
+        return n
+    return 0
+
+
+def _call_len(t: str) -> int:
+    r = 0
+    for c in t:
+        if not (c.isalnum() or c == "_" or c == "/"):
+            break
+        r += 1
+    # longest run of at least 3 chars that ends on a word boundary
+    for n in range(r, 2, -1):
+        if (t[n - 1] != "/") != (n < r and t[n] != "/"):
+            return n
+    return 0
+
+
+def _sigil_len(t: str) -> int:
+    # shortest text after the sigil that ends on a word boundary
+    for n in range(2, len(t) + 1):
+        if _bounded(t, n):
+            return n
+    return 0
+
+
+def _wwff_len(t: str) -> int:
+    for k in (2, 1):
+        if (len(t) >= k + 7 and _word_len(t[:k]) == k and t[k:k + 3].lower() == "ff-"
+                and t[k + 3:k + 7].isdecimal() and _bounded(t, k + 7)):
+            return k + 7
+    return 0
+
+
+def _sota_len(t: str) -> int:
+    if not (i := _word_len(t)) or t[i:i + 1] != "/":
+        return 0
+    if not (j := _word_len(t[i + 1:])) or t[i + j + 1:i + j + 2] != "-":
+        return 0
+    n = i + j + 5
+    if len(t) >= n and t[n - 3:n].isdecimal() and _bounded(t, n):
+        return n
+    return 0
+
+
+def _pota_len(t: str) -> int:
+    if not (i := _word_len(t)) or t[i:i + 1] != "-":
+        return 0
+    n = i + 5
+    if len(t) >= n and t[n - 4:n].isdecimal() and _bounded(t, n):
+        return n
+    return 0
+
+
+def _set_date(dt: datetime, y: str, mo: str, d: str, this_year: int) -> datetime:
+    # 2 digit year
+    if len(y) == 2:
+        y = ("19" if int("20" + y) >= this_year else "20") + y
+    # 3 digit year
+    elif len(y) == 3:
+        y = "2" + y
+    return datetime(int(y), int(mo), int(d), hour=dt.hour, minute=dt.minute)
+
+
+def _set_time(dt: datetime, t: str) -> datetime:
+    if len(t) <= 2:
+        return dt + timedelta(minutes=int(t) - dt.minute)
+    h, m = (t[0:1], t[1:]) if len(t) == 3 else (t[0:2], t[2:])
+    return dt + timedelta(seconds=(int(h) - dt.hour)*3600 + (int(m) - dt.minute)*60)
@@ -0,0 +1,218 @@
+"""
+profiling.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import argparse
+import heapq
+import json
+import re
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+from types import FunctionType
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from . import parser as _parser
+from .bandplan import BandPlan
+from .parser import LogFile, QLParsingError, _ParserState, _profiling
+
+
+__all__ = ["ParseStats", "StageStats", "profile_parsing", "STAGES"]
+
+
+# stage: the token engine functions it covers. times are inclusive, so "qso" includes the stages after it
+STAGES = {
+    "comments": ("_strip_comments",),
+    "header": ("_match_header",),
+    "qso": ("_parse_qso",),
+    "tokenize": ("_tokenize",),
+    "band": ("_band_len",),
+    "freq": ("_is_freq",),
+    "date": ("_date_match", "_set_date"),
+    "time": ("_time_len", "_set_time"),
+    "call": ("_call_len",),
+    "sigil fields": ("_sigil_len", "_take_sigil_run"),
+    "refs": ("_wwff_len", "_sota_len", "_pota_len"),
+    "rst": ("process_rst",),
+    "row": ("_make_row",),
+}
+
+
+class StageStats:
+    __slots__ = ("calls", "seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    def __repr__(self):
+        return f"StageStats(calls={self.calls}, seconds={self.seconds:.6f})"
+
+
+class ParseStats:
+    """
+    Where the token engine spent its time: per stage (see STAGES, plus "re:<name>" for each field regex),
+    per line, and the `keep` slowest lines as (seconds, line number from 1, line).
+    """
+    def __init__(self, keep: int = 10):
+        self.keep = keep
+        self.lines = 0
+        self.seconds = 0.0
+        self.stages: Dict[str, StageStats] = {}
+        self._slowest: List[Tuple[float, int, str]] = []
+
+    @property
+    def slowest(self) -> List[Tuple[float, int, str]]:
+        return sorted(self._slowest, reverse=True)
+
+    def as_dict(self) -> dict:
+        return {
+            "lines": self.lines,
+            "seconds": self.seconds,
+            "stages": {name: {"calls": s.calls, "seconds": s.seconds} for name, s in self.stages.items()},
+            "slowest": [{"seconds": secs, "line_num": i, "line": ln.rstrip("\r\n")} for secs, i, ln in self.slowest],
+        }
+
+    def __str__(self):
+        out = [f"{self.lines} lines in {self.seconds:.4f}s", "", f"{'stage':<16}{'calls':>10}{'seconds':>12}{'%':>7}"]
+        for name, s in sorted(self.stages.items(), key=lambda item: -item[1].seconds):
+            if s.calls:
+                share = 100 * s.seconds / self.seconds if self.seconds else 0
+                out.append(f"{name:<16}{s.calls:>10}{s.seconds:>12.4f}{share:>7.1f}")
+        if self._slowest:
+            out += ["", "slowest lines:"]
+            out += [f"{secs * 1e6:>9.1f}us  line {i}: {ln.strip()}" for secs, i, ln in self.slowest]
+        return "\n".join(out)
+
+
+class _TimedPattern:
+    # a compiled regex that counts its calls against a stage
+    def __init__(self, pattern: re.Pattern, stage: StageStats):
+        self._pattern = pattern
+        for name in ("search", "match", "fullmatch", "sub", "findall"):
+            setattr(self, name, _timed(getattr(pattern, name), stage))
+
+    def __getattr__(self, name):
+        return getattr(self._pattern, name)
+
+
+def _timed(fn, stage: StageStats):
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stage.calls += 1
+            stage.seconds += perf_counter() - start
+    return timed
+
+
+class _Profiler:
+    """
+    The token engine with timers around its stages.
+
+    The engine's functions are copied with their own module globals, in which the stage functions and field
+    regexes are replaced with timed ones. The engine itself is left alone, so nothing is timed (or slowed down)
+    outside of profiling, and other threads parsing at the same time are not affected.
+    """
+    def __init__(self, stats: ParseStats):
+        self.stats = stats
+        module = vars(_parser)
+        env = dict(module)
+        for name, obj in module.items():
+            if isinstance(obj, FunctionType) and obj.__globals__ is module:
+                fn = FunctionType(obj.__code__, env, obj.__name__, obj.__defaults__, obj.__closure__)
+                fn.__kwdefaults__ = obj.__kwdefaults__
+                env[name] = fn
+        for stage, names in STAGES.items():
+            counter = stats.stages.setdefault(stage, StageStats())
+            for name in names:
+                env[name] = _timed(env[name], counter)
+        for name, obj in module.items():
+            if isinstance(obj, re.Pattern) and name.endswith("_re"):
+                env[name] = _TimedPattern(obj, stats.stages.setdefault(f"re:{name.strip('_')[:-3]}", StageStats()))
+        self._parse_line = env["_parse_line"]
+
+    def parse_lines(self, data: Iterable[str], plan: Optional[BandPlan] = None,
+                    first: int = 0) -> Iterator[Tuple[int, str, object]]:
+        # the same as parser._parse_lines, timing each line
+        stats = self.stats
+        slowest = stats._slowest
+        parse_line = self._parse_line
+        state = _ParserState(plan=plan)
+        this_year = datetime.today().year
+        for i, ln in enumerate(data, first):
+            start = perf_counter()
+            try:
+                line = parse_line(ln, state, this_year)
+            except ValueError as e:
+                raise QLParsingError(str(e), i, ln)
+            finally:
+                secs = perf_counter() - start
+                stats.lines += 1
+                stats.seconds += secs
+                if len(slowest) < stats.keep:
+                    heapq.heappush(slowest, (secs, i + 1, ln))
+                elif stats.keep and secs > slowest[0][0]:
+                    heapq.heapreplace(slowest, (secs, i + 1, ln))
+            if line is not None:
+                yield i, line[0], line[1]
+
+
+@contextmanager
+def profile_parsing(keep: int = 10) -> Iterator[ParseStats]:
+    """
+    Profile every LogFile and LogStream parsed in this block (on this thread), adding up into one ParseStats:
+
+        with profile_parsing() as stats:
+            log = LogFile(lines)
+        print(stats)
+    """
+    stats = ParseStats(keep)
+    token = _profiling.set(_Profiler(stats))
+    try:
+        yield stats
+    finally:
+        _profiling.reset(token)
+
+
+def _profiler(keep: int = 10) -> "_Profiler":
+    # the profiler of the enclosing profile_parsing() block, or a new one
+    return _profiling.get() or _Profiler(ParseStats(keep))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m fastlogger.logparser profile",
+                                 description="Show where parsing a log spends its time.")
+    ap.add_argument("paths", nargs="+", metavar="FILE", help="logs to parse")
+    ap.add_argument("-n", "--slowest", type=int, default=10, metavar="N", help="number of slowest lines to show")
+    ap.add_argument("--auto-incr", action="store_true", help="increment numeric sent exchanges automatically")
+    ap.add_argument("--json", action="store_true", help="print the stats of each log as a line of JSON")
+    args = ap.parse_args(argv)
+
+    failed = 0
+    for path in args.paths:
+        error = None
+        # left None if the file couldn't be opened
+        stats = None
+        try:
+            with open(path) as file, profile_parsing(args.slowest) as stats:
+                log = LogFile(file, args.auto_incr)
+        except QLParsingError as e:
+            error = f"{e.msg} on Line {e.line_num}: {e.line.strip()}"
+        except OSError as e:
+            error = str(e)
+        failed += error is not None
+
+        if args.json:
+            print(json.dumps({"path": path, "error": error, "qsos": len(log) if error is None else None,
+                              **(stats.as_dict() if stats is not None else {})}))
+        elif error is not None:
+            print(f"== {path}\n[!!] {error}\n")
+        else:
+            print(f"== {path}\n{len(log)} QSOs\n{stats}\n")
+    return 1 if failed else 0
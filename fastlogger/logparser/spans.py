@@ -0,0 +1,232 @@
+"""
+spans.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+from typing import List, Optional, Tuple
+
+from .bandplan import DEFAULT_PLAN, BandPlan
+from .parser import (_band_len, _call_len, _date_re, _drop_re, _is_freq, _match_header, _notes_re, _pota_len,
+                     _qsl_re, _rst_re, _sigil_fields, _sigil_len, _sota_len, _strip_comments, _time_len, _word_len,
+                     _wwff_len)
+
+
+__all__ = ["line_spans", "SPAN_KINDS"]
+
+
+SPAN_KINDS = ("call", "band", "freq", "mode", "date", "time", "exchange", "ref", "rst", "notes", "comment", "header",
+              "drop", "error")
+
+# (start, length, kind)
+Span = Tuple[int, int, str]
+
+
+def line_spans(ln: str, comment: bool = False, kind: Optional[str] = None, error: bool = False,
+               plan: Optional[BandPlan] = None) -> Tuple[Span, ...]:
+    """
+    Where the fields of a line are, as (start, length, kind) spans with a kind from SPAN_KINDS.
+
+    Takes what the token engine made of the line: the kind _parse_line returned ("row", "header", "drop", or None),
+    whether it failed to parse, and whether a {} comment was open before it. The fields are then picked off the
+    line's tokens in the same order and with the same checks as _parse_qso, but keeping track of where each token
+    came from. Made for highlighting, so a field the engine found in a token that was put together from
+    pieces (which is rare) may be left out.
+    """
+    stripped = ln.strip()
+    if not stripped:
+        return ()
+    lead = len(ln) - len(ln.lstrip())
+    if stripped.startswith("#"):
+        return ((lead, len(stripped), "comment"),)
+    if error:
+        return ((lead, len(stripped), "error"),)
+
+    spans: List[Span] = []
+    code = ln
+    if comment or "{" in ln:
+        code = _blank_comments(ln, comment, spans)
+
+    if kind == "drop":
+        word = code.strip()
+        spans.append((code.find(word), len(word), "drop"))
+    elif kind == "header" or (kind is None and _match_header(_strip_comments(stripped, comment)[0]) is not None):
+        if word := code.strip():
+            spans.append((code.find(word), len(word), "header"))
+    else:
+        _qso_spans(code, plan or DEFAULT_PLAN, spans)
+    spans.sort()
+    return tuple(spans)
+
+
+def _blank_comments(ln: str, comment: bool, spans: List[Span]) -> str:
+    # the line with its {} comments blanked out, so everything else stays where it is
+    chars = list(ln)
+    start = 0 if comment else None
+    for i, c in enumerate(ln):
+        if start is None:
+            if c == "{":
+                start = i
+        elif c == "}":
+            spans.append((start, i + 1 - start, "comment"))
+            chars[start:i + 1] = " " * (i + 1 - start)
+            start = None
+    if start is not None:
+        spans.append((start, len(ln) - start, "comment"))
+        chars[start:] = " " * (len(ln) - start)
+    return "".join(chars)
+
+
+class _Tokens:
+    # the tokens of a line with their offsets, taken apart like _take does to the token engine's tokens
+    __slots__ = ("starts", "texts", "gaps", "spans")
+
+    def __init__(self, code: str, spans: List[Span]):
+        self.starts = []
+        self.texts = code.split()
+        self.gaps = []
+        self.spans = spans
+        end = len(code) - len(code.lstrip())
+        for t in self.texts:
+            start = code.find(t, end)
+            self.starts.append(start)
+            self.gaps.append(start - end)
+            end = start + len(t)
+
+    def take(self, i: int, n: int, keep: int, kind: str):
+        # mark the first n chars of token i (which may run on into the next tokens) as `kind` and remove them
+        start = self.starts[i]
+        end = start + n
+        keep = max(keep, 0)
+        while i < len(self.texts) and self.starts[i] + len(self.texts[i]) <= end:
+            del self.starts[i], self.texts[i], self.gaps[i]
+        if i < len(self.texts) and self.starts[i] < end:
+            cut = end - self.starts[i]
+            self.texts[i] = self.texts[i][cut:]
+            self.starts[i] = end
+            self.gaps[i] = keep
+        elif i < len(self.texts):
+            self.gaps[i] += keep
+        self.spans.append((start, n, kind))
+
+    def keyed(self, keyword: str, match):
+        # a field preceded by its keyword, or by two or more blanks, see _find_keyed
+        texts, gaps = self.texts, self.gaps
+        for i, t in enumerate(texts):
+            if len(t) == len(keyword) and t.lower() == keyword and i + 1 < len(texts) and (n := match(i + 1)):
+                keep = gaps[i] - 1
+                self.spans.append((self.starts[i], len(t), "date" if keyword == "date" else "ref"))
+                del self.starts[i], texts[i], gaps[i]
+                return i, n, keep
+            if gaps[i] + (not i) >= 2 and (n := match(i)):
+                return i, n, 0
+        return None
+
+    def date_len(self, i: int) -> int:
+        texts = self.texts
+        if not texts[i][0].isdecimal():
+            return 0
+        tail = texts[i]
+        for j in range(i + 1, min(i + 3, len(texts))):
+            if self.gaps[j] != 1:
+                break
+            tail += " " + texts[j]
+        return m.end() if (m := _date_re.match(tail)) else 0
+
+    def rest_spans(self):
+        # rst and drop keywords in what is left, found in the tokens joined by single blanks like _parse_qso does
+        if not self.texts:
+            return
+        rest = " ".join(self.texts)
+        offsets = []
+        pos = 0
+        for start, t in zip(self.starts, self.texts):
+            offsets.append((pos, start))
+            pos += len(t) + 1
+
+        def where(p: int) -> int:
+            for off, start in reversed(offsets):
+                if off <= p:
+                    return start + p - off
+            return p
+
+        if m := _rst_re.search(rest):
+            for g in (1, 2):
+                if m.group(g):
+                    self.spans.append((where(m.start(g)), len(m.group(g)), "rst"))
+            rest = rest[:m.start()] + " " * len(m.group(0)) + rest[m.end():]
+        if m := _drop_re.search(rest):
+            self.spans.append((where(m.start(1)), len(m.group(1)), "drop"))
+
+
+def _qso_spans(code: str, plan: BandPlan, spans: List[Span]):
+    # notes and qsl message
+    for sigil, regex in (("<", _notes_re), ("[", _qsl_re)):
+        if sigil in code and (m := regex.search(code)):
+            spans.append((m.start(), m.end() - m.start(), "notes"))
+            code = code[:m.start()] + " " * (m.end() - m.start()) + code[m.end():]
+
+    tok = _Tokens(code, spans)
+    texts, gaps = tok.texts, tok.gaps
+    numeric = any(t[0].isdecimal() for t in texts)
+
+    found = None
+    if numeric:
+        for i, t in enumerate(texts):
+            if n := _band_len(t):
+                tok.take(i, n, gaps[i] - 1, "band")
+                break
+        for i, t in enumerate(texts):
+            if "." in t and _is_freq(t):
+                tok.take(i, len(t), gaps[i], "freq")
+                break
+        if found := tok.keyed("date", tok.date_len):
+            i, n, keep = found
+            tok.take(i, n, keep, "date")
+
+    if not found and texts and not gaps[0] and texts[0][:3].lower() == "day":
+        rest = texts[0][3:]
+        if not rest and len(texts) > 1:
+            rest = texts[1]
+        if days := len(rest) - len(rest.lstrip("+")):
+            if len(texts[0]) == 3:
+                tok.take(0, tok.starts[1] - tok.starts[0] + days, 0, "date")
+            else:
+                tok.take(0, 3 + days, 0, "date")
+            numeric = True
+
+    if numeric:
+        for i, t in enumerate(texts):
+            if n := _time_len(t):
+                tok.take(i, n, gaps[i], "time")
+                break
+
+    for i, t in enumerate(texts):
+        if t[0].isalnum() or t[0] == "_":
+            n = _word_len(t)
+            if plan.mode_name(t[:n]) is not None:
+                tok.take(i, n, gaps[i] - 1, "mode")
+            break
+
+    for i, t in enumerate(texts):
+        if n := _call_len(t):
+            tok.take(i, n, gaps[i] - 1, "call")
+            break
+
+    for _, sigil, _ in _sigil_fields:
+        if sigil not in code:
+            continue
+        for i, t in enumerate(texts):
+            if t[0] == sigil and (n := _sigil_len(t)):
+                tok.take(i, n, gaps[i] - 1, "exchange")
+                break
+
+    if "-" in code:
+        for keyword, size in (("wwff", _wwff_len), ("sota", _sota_len), ("pota", _pota_len)):
+            if found := tok.keyed(keyword, lambda i: size(texts[i])):
+                i, n, keep = found
+                tok.take(i, n, keep, "ref")
+
+    tok.rest_spans()
@@ -0,0 +1,135 @@
+"""
+stats.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import heapq
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .parser import LogRow
+
+
+__all__ = ["LogStats", "RATE_WINDOWS"]
+
+
+# minutes of the rolling QSO rates shown by the app
+RATE_WINDOWS = (10, 60)
+
+
+class LogStats:
+    """
+    Statistics of a log: QSOs per band and mode, calls worked, QSOs per hour, and the QSO rate over the last
+    minutes of the log. Kept up to date by update() with the rows added to and removed from the log, like
+    DupeIndex, so an edit costs the same however long the log is.
+
+    Times are those of the rows, so the rates are over the minutes up to the latest QSO of the log, not up to
+    now. Rows without a date are counted, but not in the hours or rates.
+    """
+    __slots__ = ("_qsos", "_undated", "_band_mode", "_calls", "_hours", "_minutes", "_heap", "_in_heap")
+
+    def __init__(self, rows: Iterable[LogRow] = ()):
+        self._qsos = 0
+        self._undated = 0
+        self._band_mode: Dict[Tuple[str, str], int] = {}
+        self._calls: Dict[str, int] = {}
+        # QSOs in each hour and minute, by minute number (date ordinal * 1440 + minute of the day)
+        self._hours: Dict[int, int] = {}
+        self._minutes: Dict[int, int] = {}
+        # the minutes with QSOs, newest first (negated), where those that have none left are only removed once
+        # they get to the top
+        self._heap: List[int] = []
+        self._in_heap: Set[int] = set()
+        self.update((), rows)
+
+    def __len__(self):
+        return self._qsos
+
+    @property
+    def unique_calls(self) -> int:
+        return len(self._calls)
+
+    @property
+    def undated(self) -> int:
+        return self._undated
+
+    def band_mode(self) -> Dict[Tuple[str, str], int]:
+        # QSOs per (band, mode)
+        return dict(sorted(self._band_mode.items()))
+
+    def count(self, band: Optional[str] = None, mode: Optional[str] = None) -> int:
+        # QSOs on a band and/or in a mode
+        if band is not None and mode is not None:
+            return self._band_mode.get((band, mode.upper()), 0)
+        if band is None and mode is None:
+            return self._qsos
+        if band is not None:
+            return sum(n for (b, _), n in self._band_mode.items() if b == band)
+        return sum(n for (_, m), n in self._band_mode.items() if m == mode.upper())
+
+    def worked(self, call: str) -> int:
+        # QSOs with a call
+        return self._calls.get(call.upper(), 0)
+
+    def per_hour(self) -> Dict[datetime, int]:
+        # QSOs in each hour that has any, by the start of the hour
+        return {_datetime(hour * 60): n for hour, n in sorted(self._hours.items())}
+
+    @property
+    def latest(self) -> Optional[datetime]:
+        # the minute of the latest dated QSO
+        minute = self._latest()
+        return _datetime(minute) if minute is not None else None
+
+    def window(self, minutes: int) -> int:
+        # QSOs in the last `minutes` minutes of the log, up to and including the minute of the latest QSO
+        if (end := self._latest()) is None:
+            return 0
+        counts = self._minutes
+        return sum(counts.get(m, 0) for m in range(end - minutes + 1, end + 1))
+
+    def rate(self, minutes: int = 60) -> float:
+        # QSOs per hour over the last `minutes` minutes of the log
+        return self.window(minutes) * 60 / minutes
+
+    def update(self, removed: Iterable[LogRow], added: Iterable[LogRow]):
+        # count rows out and in
+        for row in removed:
+            self._count(row, -1)
+        for row in added:
+            self._count(row, 1)
+
+    def _count(self, row: LogRow, n: int):
+        self._qsos += n
+        _add(self._band_mode, (row.band, row.mode), n)
+        _add(self._calls, row.call, n)
+        if row.date == date.min:
+            self._undated += n
+            return
+        minute = row.date.toordinal() * 1440 + row.time.hour * 60 + row.time.minute
+        _add(self._hours, minute // 60, n)
+        if _add(self._minutes, minute, n) and minute not in self._in_heap:
+            heapq.heappush(self._heap, -minute)
+            self._in_heap.add(minute)
+
+    def _latest(self) -> Optional[int]:
+        heap = self._heap
+        while heap and -heap[0] not in self._minutes:
+            self._in_heap.discard(-heapq.heappop(heap))
+        return -heap[0] if heap else None
+
+
+def _add(counts: Dict, key, n: int) -> bool:
+    # add n to a count, dropping it at 0. returns whether it's there now
+    if total := counts.get(key, 0) + n:
+        counts[key] = total
+        return True
+    del counts[key]
+    return False
+
+
+def _datetime(minute: int) -> datetime:
+    return datetime.fromordinal(minute // 1440) + timedelta(minutes=minute % 1440)
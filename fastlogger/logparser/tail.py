@@ -0,0 +1,214 @@
+"""
+tail.py - part of fastlogger
+---
+
+Copyright (C) 2020 classabbyamp
+Released under the terms of the BSD 3-Clause license.
+"""
+
+import locale
+import os
+import select
+import struct
+import sys
+import time
+from typing import Iterator, Optional, Sequence, Tuple, Union
+
+try:
+    import ctypes
+    import ctypes.util
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True) if sys.platform.startswith("linux") else None
+    if _libc is not None and not hasattr(_libc, "inotify_init1"):
+        _libc = None
+except (ImportError, OSError):
+    _libc = None
+
+
+__all__ = ["LogTail", "FileWatcher", "follow"]
+
+
+# (first line, lines replaced or None for all of them, new lines), like the edits of the editor
+Edit = Tuple[int, Optional[int], Sequence[str]]
+
+# see inotify(7)
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVE_SELF = 0x800
+_IN_DELETE_SELF = 0x400
+_IN_IGNORED = 0x8000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_event = struct.Struct("iIII")
+
+
+class LogTail:
+    """
+    Reads a log file that another program appends to, a bit at a time: each read() only reads the bytes
+    added since the last one, and gives them as an edit to the lines of the file, which are split like
+    MappedLog splits them. The first read gives all of the file, and so does a read after the file was
+    truncated or replaced.
+
+    The last line of a file is often not finished yet, so an edit starts at the last line of the previous
+    read and replaces it. The edits can be applied to an IncrementalLogFile, which parses only the new lines,
+    on from the parser state of the line before them:
+
+        log = IncrementalLogFile()
+        for start, removed, lines in follow("my.log"):
+            if removed is None:
+                delta = log.set_lines(lines)
+            else:
+                delta = log.update(start, removed, lines)
+    """
+    def __init__(self, path: Union[str, os.PathLike], encoding: Optional[str] = None, errors: str = "replace"):
+        self.path = path
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.errors = errors
+        # bytes read so far, of which the unfinished last line is kept to be read again
+        self.offset = 0
+        self._partial = b""
+        # number of the last line, and the file it is of
+        self._last = None
+        self._file_id = None
+
+    def read(self) -> Optional[Edit]:
+        # the edit for what was appended since the last read, None if nothing was
+        try:
+            file = open(self.path, "rb")
+        except FileNotFoundError:
+            return None
+        with file:
+            st = os.fstat(file.fileno())
+            if (st.st_dev, st.st_ino) != self._file_id or st.st_size < self.offset:
+                # another file, or cut short: start over
+                self._file_id = (st.st_dev, st.st_ino)
+                self.offset = 0
+                self._partial = b""
+                self._last = None
+            elif st.st_size == self.offset:
+                return None
+            file.seek(self.offset)
+            data = file.read()
+        if not data and self._last is not None:
+            return None
+        self.offset += len(data)
+        parts = (self._partial + data).split(b"\n")
+        self._partial = parts[-1]
+        lines = [self._decode(part) for part in parts]
+        if self._last is None:
+            edit = (0, None, lines)
+            self._last = 0
+        else:
+            edit = (self._last, 1, lines)
+        self._last += len(parts) - 1
+        return edit
+
+    def _decode(self, part: bytes) -> str:
+        if part.endswith(b"\r"):
+            part = part[:-1]
+        return str(part, self.encoding, self.errors)
+
+
+class FileWatcher:
+    """
+    Waits for a file to change. Uses inotify where there is one (Linux), which costs nothing while the file
+    doesn't change, and otherwise checks the size and modification time of the file now and then.
+
+    fileno() gives the inotify file descriptor to wait on in an event loop, which becomes readable when the
+    file changed; call drain() then. If the file is replaced (like when a log is rotated), the new one is
+    watched once it's there.
+    """
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = os.fsencode(path)
+        self._fd = None
+        self._wd = None
+        self._last = self._signature()
+        if _libc is not None:
+            fd = _libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+                self._watch()
+
+    def fileno(self) -> Optional[int]:
+        return self._fd
+
+    def drain(self) -> bool:
+        # read the pending inotify events, returns whether the file changed
+        if self._fd is None:
+            return self._changed()
+        changed = False
+        while True:
+            try:
+                data = os.read(self._fd, 4096)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = _event.unpack_from(data, pos)
+                pos += _event.size + length
+                changed = True
+                if mask & (_IN_MOVE_SELF | _IN_DELETE_SELF | _IN_IGNORED) and wd == self._wd:
+                    self._unwatch()
+        if self._wd is None:
+            # the file went away: watch the new one if there is one already, else keep checking for it
+            self._watch()
+            changed |= self._changed()
+        return changed
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        # wait until the file changes or `timeout` seconds passed, returns whether it changed
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            left = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if self._fd is not None and self._wd is not None:
+                if select.select([self._fd], [], [], left)[0] and self.drain():
+                    return True
+            else:
+                time.sleep(min(1.0, left) if left is not None else 1.0)
+                if self.drain():
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = self._wd = None
+
+    def __enter__(self) -> "FileWatcher":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _watch(self):
+        mask = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVE_SELF | _IN_DELETE_SELF
+        wd = _libc.inotify_add_watch(self._fd, self.path, mask)
+        self._wd = wd if wd >= 0 else None
+
+    def _unwatch(self):
+        if self._wd is not None:
+            _libc.inotify_rm_watch(self._fd, self._wd)
+            self._wd = None
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _changed(self) -> bool:
+        signature = self._signature()
+        changed, self._last = signature != self._last, signature
+        return changed
+
+
+def follow(path: Union[str, os.PathLike], encoding: Optional[str] = None, interval: float = 1.0) -> Iterator[Edit]:
+    # all of a log file, then what is appended to it as it is, see LogTail. checks at least every `interval` s
+    tail = LogTail(path, encoding)
+    with FileWatcher(path) as watcher:
+        while True:
+            if (edit := tail.read()) is not None:
+                yield edit
+            watcher.wait(interval)
@@ -0,0 +1,30 @@
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "fastlogger"))
+
+import logparser  # noqa: E402
+
+
+def qso_lines(log):
+    out = io.StringIO()
+    logparser.write_cabrillo(log, out)
+    return [ln for ln in out.getvalue().splitlines() if ln.startswith("QSO:")]
+
+
+def test_rows_without_date_or_mode_left_out():
+    log = logparser.LogFile(["mycall w1aw", "40m", "1100 k1abc", "date 2020-01-01", "1101 k2abc", "cw",
+                             "1102 k3abc"])
+    with pytest.warns(UserWarning, match="left out 2 QSOs"):
+        lines = qso_lines(log)
+    assert len(lines) == 1
+    assert lines[0].split()[1:5] == ["7000", "CW", "2020-01-01", "1102"]
+
+
+def test_no_warning_for_complete_log(recwarn):
+    log = logparser.LogFile(["mycall w1aw", "date 2020-01-01", "40m cw", "1100 k1abc"])
+    assert len(qso_lines(log)) == 1
+    assert not recwarn
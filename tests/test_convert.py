@@ -0,0 +1,23 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "fastlogger"))
+
+from logparser import convert  # noqa: E402
+
+
+LOG = "mycall w1aw\ndate 2020-01-01\n40m cw\n1100 k1abc\n1110 k2abc\n"
+
+
+@pytest.mark.parametrize("fmt", list(convert.FORMATS))
+def test_convert_twice(tmp_path, fmt):
+    (tmp_path / "a.txt").write_text(LOG)
+    (tmp_path / "b.txt").write_text(LOG)
+    assert convert.main([str(tmp_path), "-f", fmt, "-j", "1", "-q"]) == 0
+    outputs = sorted(p.name for p in tmp_path.iterdir())
+    # the outputs of the first run aren't picked up as logs by the second
+    assert convert.main([str(tmp_path), "-f", fmt, "-j", "1", "-q"]) == 0
+    assert sorted(p.name for p in tmp_path.iterdir()) == outputs
+    assert convert.find_logs([str(tmp_path)]) == [str(tmp_path / "a.txt"), str(tmp_path / "b.txt")]
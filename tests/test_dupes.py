@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "fastlogger"))
+
+import logparser  # noqa: E402
+
+
+LOG = ["mycall w1aw", "date 2020-01-01", "40m cw", "1100 k1abc", "1110 k2abc", "1120 k1abc"]
+
+
+def flagged(log, index):
+    return [(row.call, index.is_dupe(row)) for row in log]
+
+
+def test_first_qso_is_not_a_dupe():
+    log = logparser.LogFile(LOG)
+    assert flagged(log, log.dupes()) == [("K1ABC", False), ("K2ABC", False), ("K1ABC", True)]
+
+
+def test_insert_above_existing_dupe():
+    log = logparser.IncrementalLogFile()
+    log.set_lines(LOG)
+    index = log.dupes()
+    log.update(3, 0, ["1050 k1abc"])
+    assert flagged(log, index) == [("K1ABC", False), ("K1ABC", True), ("K2ABC", False), ("K1ABC", True)]
+
+
+def test_remove_first_of_dupes():
+    log = logparser.IncrementalLogFile()
+    log.set_lines(LOG)
+    index = log.dupes()
+    log.update(3, 1, [])
+    assert flagged(log, index) == [("K2ABC", False), ("K1ABC", False)]
+    assert index.dupe_count == 0
@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "fastlogger"))
+
+import logparser  # noqa: E402
+from logparser import journal  # noqa: E402
+
+
+LINES = [f"{1000 + i} k{i}abc" for i in range(100)]
+
+
+@pytest.fixture
+def log(tmp_path):
+    path = tmp_path / "log.txt"
+    path.write_bytes("\r\n".join(LINES).encode())
+    return path
+
+
+def test_save_writes_only_the_tail(log, tmp_path):
+    j = logparser.Journal(log, tmp_path / "journals")
+    j.begin(LINES)
+    inode = log.stat().st_ino
+    doc = LINES + ["2359 w1aw"]
+    j.append([(len(LINES) - 1, 1, doc[-2:])])
+    j.save(doc)
+    # written in place, with the file's line endings
+    assert log.stat().st_ino == inode
+    assert log.read_bytes() == "\r\n".join(doc).encode()
+    assert not j.dirty
+    j.close()
+
+
+def test_replay_after_save(log, tmp_path):
+    j = logparser.Journal(log, tmp_path / "journals")
+    j.begin(LINES)
+    doc = LINES + ["2359 w1aw"]
+    j.append([(len(LINES) - 1, 1, doc[-2:])])
+    j.save(doc)
+    doc = doc + ["2400 k9xyz"]
+    j.append([(len(doc) - 2, 1, doc[-2:])])
+    j.close()
+    assert logparser.Journal.load(j.journal_path).replay() == (doc, True)
+
+
+@pytest.mark.skipif(journal.fcntl is None, reason="needs fcntl")
+def test_begin_leaves_a_locked_journal_alone(log, tmp_path):
+    first = logparser.Journal(log, tmp_path / "journals")
+    first.begin(LINES)
+    first.append([(0, 1, ["changed"])])
+    size = first.journal_path.stat().st_size
+    with pytest.raises(BlockingIOError):
+        logparser.Journal(log, tmp_path / "journals").begin(LINES)
+    assert first.journal_path.stat().st_size == size
+    first.close()
@@ -0,0 +1,63 @@
+import io
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "fastlogger"))
+
+import logparser  # noqa: E402
+from logparser import merge  # noqa: E402
+
+
+A = """mycall w1aw
+date 2020-01-01
+40m cw
+1100 k1abc
+1102 k2abc
+1104 k3abc
+delete
+delete
+mycall w1aw/p
+op k9op
+1106 k4abc
+"""
+B = """mycall n0call
+date 2020-01-01
+20m ssb
+1101 dl1abc
+1105 dl2abc
+"""
+
+
+def write_logs(tmp_path):
+    (tmp_path / "a.txt").write_text(A)
+    (tmp_path / "b.txt").write_text(B)
+    return [str(tmp_path / "a.txt"), str(tmp_path / "b.txt")]
+
+
+def test_merge_runs_of_deletes(tmp_path):
+    with logparser.merge_logs(write_logs(tmp_path)) as merged:
+        rows = [(m.row.call, m.my_call, m.operators) for m in merged]
+    assert rows == [
+        ("K1ABC", "W1AW", ()),
+        ("DL1ABC", "N0CALL", ()),
+        ("DL2ABC", "N0CALL", ()),
+        ("K4ABC", "W1AW/P", ("K9OP",)),
+    ]
+
+
+def test_adif_headers_of_each_row(tmp_path):
+    out = io.StringIO()
+    with logparser.merge_logs(write_logs(tmp_path)) as merged:
+        logparser.write_merged(merged, out, "adif")
+    records = out.getvalue().split("<EOH>")[1].split("<EOR>")[:-1]
+    assert ["<STATION_CALLSIGN:4>W1AW" in r for r in records] == [True, False, False, False]
+    assert "<STATION_CALLSIGN:6>W1AW/P" in records[3] and "<OPERATOR:4>K9OP" in records[3]
+    assert "<OPERATOR:" not in records[0]
+
+
+def test_lookahead_checked_before_writing(tmp_path, capsys):
+    output = tmp_path / "merged.jsonl"
+    assert merge.main(write_logs(tmp_path) + ["-o", str(output), "--lookahead", "1"]) == 1
+    assert not output.exists()
+    assert merge.main(write_logs(tmp_path) + ["-o", str(output), "--lookahead", "2", "-q"]) == 0
+    assert len(output.read_text().splitlines()) == 4